@@ -0,0 +1,217 @@
+# In-process admission control, applied before routing.
+#
+# Every request passes a per-user (or per-client) token bucket and a per-route
+# bucket; a refusal is an immediate 429 with Retry-After. Expensive routes also
+# have a concurrency limit: requests queue for a slot only while the expected
+# wait fits the latency budget, otherwise they get an immediate 503 with
+# Retry-After. Rejecting early keeps latency bounded for the work that is
+# accepted instead of letting every request slow down under overload.
+#
+# Limits are per worker process, like the LLM scheduler's.
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from auth import verify_token
+from ai_engine.llm_scheduler import TokenBucket
+from serialization import dumps
+
+ADMISSION = os.getenv("ADMISSION", "1") == "1"
+ADMIT_QUEUE_BUDGET_S = float(os.getenv("ADMIT_QUEUE_BUDGET_S", "2"))
+ADMIT_GENERATE_CONCURRENCY = int(os.getenv("ADMIT_GENERATE_CONCURRENCY", "4"))
+ADMIT_SUBMIT_CONCURRENCY = int(os.getenv("ADMIT_SUBMIT_CONCURRENCY", "8"))
+ADMIT_AUTH_CONCURRENCY = int(os.getenv("ADMIT_AUTH_CONCURRENCY", "8"))
+# Buckets kept per route class; the least recently seen clients are dropped first
+ADMIT_MAX_CLIENTS = int(os.getenv("ADMIT_MAX_CLIENTS", "10000"))
+# Peers whose X-Forwarded-For is believed (comma-separated IPs, "*" for any).
+# Empty by default: anyone can send the header, so it would let a client pick
+# a fresh bucket per request.
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+
+class RouteLimits:
+    """Admission policy for one class of routes (matched by method and path prefix)."""
+
+    def __init__(
+        self,
+        name: str,
+        method: Optional[str],
+        prefix: str,
+        client_rate: float,
+        client_burst: float,
+        route_rate: Optional[float] = None,
+        route_burst: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        queue_budget: float = ADMIT_QUEUE_BUDGET_S,
+    ):
+        self.name = name
+        self.method = method
+        self.prefix = prefix
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.route_bucket = TokenBucket(route_rate, route_burst) if route_rate else None
+        self.concurrency = concurrency
+        self.queue_budget = queue_budget
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.slots = asyncio.Semaphore(concurrency) if concurrency else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_s = 0.5  # EWMA of time spent holding a slot
+        self.stats = {"admitted": 0, "rate_limited": 0, "shed": 0}
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method is None or self.method == method) and path.startswith(self.prefix)
+
+    def _client_bucket(self, key: str) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.client_rate, self.client_burst)
+            if len(self.buckets) > ADMIT_MAX_CLIENTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def rate_wait(self, key: str) -> float:
+        """Seconds until ``key`` may call again; takes a token from both buckets when it is 0."""
+        now = time.monotonic()
+        buckets = [self._client_bucket(key)] + ([self.route_bucket] if self.route_bucket else [])
+        wait = max(b.wait_time(1, now) for b in buckets)
+        if wait == 0:
+            for b in buckets:
+                b.take(1)
+        return wait
+
+    def expected_wait(self) -> float:
+        if self.concurrency is None or self.in_flight < self.concurrency:
+            return 0.0
+        # Everyone queued ahead of us, served `concurrency` at a time
+        return (self.waiting + 1) / self.concurrency * self.service_s
+
+    def observe(self, seconds: float) -> None:
+        self.service_s = 0.8 * self.service_s + 0.2 * seconds
+
+
+def default_limits() -> List[RouteLimits]:
+    # First match wins; the last entry covers every other route
+    return [
+        RouteLimits("generate", "POST", "/exam/generate", client_rate=0.2, client_burst=3,
+                    route_rate=10, route_burst=20, concurrency=ADMIT_GENERATE_CONCURRENCY),
+        RouteLimits("submit", "POST", "/exam/submit", client_rate=1, client_burst=5,
+                    concurrency=ADMIT_SUBMIT_CONCURRENCY),
+        # Keyed by client address before login; a classroom behind one NAT shares it
+        RouteLimits("auth", None, "/auth/", client_rate=2, client_burst=30, concurrency=ADMIT_AUTH_CONCURRENCY),
+        RouteLimits("default", None, "/", client_rate=20, client_burst=60),
+    ]
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_key(scope: Dict[str, Any]) -> str:
+    authorization = _header(scope, b"authorization")
+    if authorization and authorization.lower().startswith("bearer "):
+        entry = verify_token(authorization[7:].strip())
+        if entry is not None:
+            return f"user:{entry[0]}"
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    forwarded = _header(scope, b"x-forwarded-for")
+    if forwarded and _trusted(peer):
+        # Walk back from the nearest hop; the first address not one of our proxies is the client
+        for hop in reversed([h.strip() for h in forwarded.split(",") if h.strip()]):
+            if not _trusted(hop):
+                return "ip:" + hop
+    return "ip:" + peer
+
+
+def _trusted(ip: str) -> bool:
+    return "*" in TRUSTED_PROXIES or ip in TRUSTED_PROXIES
+
+
+async def _reject(send, status: int, retry_after: float, detail: str) -> None:
+    body = dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, limits: Optional[List[RouteLimits]] = None, enabled: bool = ADMISSION):
+        self.app = app
+        self.limits = limits if limits is not None else default_limits()
+        self.enabled = enabled
+        _registry.append(self)
+
+    def _classify(self, method: str, path: str) -> Optional[RouteLimits]:
+        for limits in self.limits:
+            if limits.matches(method, path):
+                return limits
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        limits = self._classify(scope["method"], scope["path"])
+        if limits is None:
+            return await self.app(scope, receive, send)
+
+        if limits.slots is not None and limits.expected_wait() > limits.queue_budget:
+            # Shed before taking rate tokens so a refused request costs the client nothing
+            limits.stats["shed"] += 1
+            return await _reject(send, 503, limits.expected_wait(), "Server busy, please retry shortly")
+        wait = limits.rate_wait(client_key(scope))
+        if wait > 0:
+            limits.stats["rate_limited"] += 1
+            return await _reject(send, 429, wait, "Too many requests, please slow down")
+        if limits.slots is None:
+            limits.stats["admitted"] += 1
+            return await self.app(scope, receive, send)
+
+        limits.waiting += 1
+        try:
+            await asyncio.wait_for(limits.slots.acquire(), timeout=limits.queue_budget)
+        except asyncio.TimeoutError:
+            limits.stats["shed"] += 1
+            return await _reject(send, 503, limits.expected_wait(), "Server busy, please retry shortly")
+        finally:
+            limits.waiting -= 1
+        limits.stats["admitted"] += 1
+        limits.in_flight += 1
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limits.in_flight -= 1
+            limits.slots.release()
+            limits.observe(time.monotonic() - start)
+
+
+_registry: List[AdmissionMiddleware] = []
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for middleware in _registry:
+        for limits in middleware.limits:
+            out[limits.name] = {
+                **limits.stats,
+                "in_flight": limits.in_flight,
+                "waiting": limits.waiting,
+                "service_ms": round(limits.service_s * 1000, 1),
+            }
+    return out
@@ -0,0 +1,410 @@
+# Append-optimized store for per-exam topic results.
+#
+# Rows are buffered in memory and flushed in one transaction per partition,
+# either when the buffer is full or on a timer. Each UTC day gets its own
+# SQLite file; compaction folds finished days into one file per month. Readers
+# only open the partitions overlapping their time range and push the user /
+# topic predicates down into SQL.
+import os
+import csv
+import glob
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .storage import DATA_DIR, connect_sqlite, ensure_parent_dir, transaction, log_ai
+
+try:
+    import fcntl
+except Exception:  # pragma: no cover - Windows; single-worker only
+    fcntl = None
+
+ANALYTICS_DIR = os.path.join(DATA_DIR, "analytics")
+LEGACY_CSV_PATH = os.path.join(DATA_DIR, "ai_dataset.csv")
+
+FIELDNAMES = ["ts", "user_id", "exam_id", "topic", "accuracy"]
+ANALYTICS_FLUSH_ROWS = int(os.getenv("ANALYTICS_FLUSH_ROWS", "500"))
+ANALYTICS_FLUSH_INTERVAL_S = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_S", "2"))
+# Days younger than this may still receive late flushes and are never compacted
+ANALYTICS_COMPACT_GRACE_DAYS = int(os.getenv("ANALYTICS_COMPACT_GRACE_DAYS", "2"))
+
+
+def _day_path(day: str) -> str:
+    return os.path.join(ANALYTICS_DIR, f"day-{day}.db")
+
+
+def _month_path(month: str) -> str:
+    return os.path.join(ANALYTICS_DIR, f"month-{month}.db")
+
+
+def _connect(path: str):
+    conn = connect_sqlite(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        " ts REAL NOT NULL,"
+        " user_id INTEGER NOT NULL,"
+        " exam_id INTEGER,"
+        " topic TEXT NOT NULL,"
+        " accuracy REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_results_user_topic ON results (user_id, topic, ts);")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_results_topic ON results (topic, ts);")
+    return conn
+
+
+def _partitions() -> List[Tuple[str, float, float]]:
+    """Every partition file with the UTC time range ``[start, end)`` it covers."""
+    parts = []
+    for path in glob.glob(os.path.join(ANALYTICS_DIR, "*.db")):
+        name = os.path.basename(path)[:-3]
+        kind, _, stamp = name.partition("-")
+        try:
+            if kind == "day":
+                start = datetime.strptime(stamp, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+                end = start + timedelta(days=1)
+            elif kind == "month":
+                start = datetime.strptime(stamp, "%Y-%m").replace(tzinfo=timezone.utc)
+                end = (start + timedelta(days=32)).replace(day=1)
+            else:
+                continue
+        except ValueError:
+            continue
+        parts.append((path, start.timestamp(), end.timestamp()))
+    return sorted(parts, key=lambda p: p[1])
+
+
+def _compacted_days(month_path: str) -> Set[str]:
+    """Days whose rows the month partition already holds (their day files may linger)."""
+    conn = connect_sqlite(month_path)
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS compacted_days (day TEXT PRIMARY KEY, rows INTEGER NOT NULL,"
+            " compacted_at REAL NOT NULL)"
+        )
+        return {day for (day,) in conn.execute("SELECT day FROM compacted_days")}
+    finally:
+        conn.close()
+
+
+def _drop_day(path: str) -> None:
+    # Emptied first, in a transaction of its own, so a failed unlink leaves nothing behind
+    conn = connect_sqlite(path)
+    try:
+        with transaction(conn):
+            conn.execute("DELETE FROM results")
+    finally:
+        conn.close()
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def _file_lock(name: str) -> Iterator[None]:
+    path = os.path.join(ANALYTICS_DIR, name)
+    ensure_parent_dir(path)
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class AnalyticsStore:
+    def __init__(self, flush_rows: int = ANALYTICS_FLUSH_ROWS, flush_interval: float = ANALYTICS_FLUSH_INTERVAL_S):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._buffer: List[Tuple[float, int, Optional[int], str, float]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Thread] = None
+        self._imported = False
+        atexit.register(self.flush)
+
+    def append(self, user_id: int, topic_accuracy: Dict[str, float], exam_id: Optional[int] = None,
+               ts: Optional[float] = None) -> None:
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            self._buffer.extend((ts, user_id, exam_id, topic, float(acc)) for topic, acc in topic_accuracy.items())
+            full = len(self._buffer) >= self.flush_rows
+            self._start_timer()
+        if full:
+            self.flush()
+
+    def write(self, results: Iterable[Tuple[int, Dict[str, float], Optional[int]]]) -> int:
+        """Write ``(user_id, topic_accuracy, exam_id)`` results now, bypassing the buffer.
+
+        For callers that already batch (see backend/group_commit.py) and need
+        the rows on disk when this returns. Rows that fail to write are kept in
+        the buffer for the next flush.
+        """
+        ts = time.time()
+        rows = [(ts, user_id, exam_id, topic, float(acc)) for user_id, topic_accuracy, exam_id in results
+                for topic, acc in topic_accuracy.items()]
+        if not rows:
+            return 0
+        with self._flush_lock:
+            return self._write(rows)
+
+    def _start_timer(self) -> None:
+        # Called with self._lock held
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._flush_loop, name="analytics-flush", daemon=True)
+            self._timer.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                log_ai(f"[analytics][flush_error] {type(e).__name__}: {e}")
+
+    def flush(self) -> int:
+        """Write buffered rows, one transaction per day partition; returns rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            return self._write(rows)
+
+    def _write(self, rows: List[Tuple[float, int, Optional[int], str, float]]) -> int:
+        by_day: Dict[str, list] = {}
+        for row in rows:
+            day = datetime.fromtimestamp(row[0], tz=timezone.utc).strftime("%Y-%m-%d")
+            by_day.setdefault(day, []).append(row)
+        written = 0
+        try:
+            for day, day_rows in sorted(by_day.items()):
+                conn = _connect(_day_path(day))
+                try:
+                    with transaction(conn):
+                        conn.executemany(
+                            "INSERT INTO results (ts, user_id, exam_id, topic, accuracy) VALUES (?, ?, ?, ?, ?)",
+                            day_rows,
+                        )
+                finally:
+                    conn.close()
+                written += len(day_rows)
+        except Exception:
+            # Keep unwritten rows for the next attempt
+            with self._lock:
+                self._buffer[:0] = [r for d, rs in sorted(by_day.items()) for r in rs][written:]
+                self._start_timer()
+            raise
+        return written
+
+    def import_legacy_csv(self, path: str = LEGACY_CSV_PATH) -> int:
+        """Copy rows from the old ai_dataset.csv once; they are stamped with the file's mtime."""
+        if self._imported:
+            return 0
+        marker = os.path.join(ANALYTICS_DIR, ".legacy_imported")
+        count = 0
+        with _file_lock(".import.lock"):
+            if not os.path.exists(marker) and os.path.exists(path):
+                ts = os.path.getmtime(path)
+                month = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m")
+                rows = []
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    for row in csv.DictReader(f):
+                        try:
+                            rows.append((ts, int(row["user_id"]), None, row["topic"], float(row["accuracy"])))
+                        except (KeyError, TypeError, ValueError):
+                            continue
+                conn = _connect(_month_path(month))
+                try:
+                    with transaction(conn):
+                        conn.executemany(
+                            "INSERT INTO results (ts, user_id, exam_id, topic, accuracy) VALUES (?, ?, ?, ?, ?)", rows
+                        )
+                finally:
+                    conn.close()
+                count = len(rows)
+            open(marker, "a").close()
+        self._imported = True
+        return count
+
+    def query(
+        self,
+        user_id: Optional[int] = None,
+        topic: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Rows matching every given predicate, oldest partition first."""
+        for conn, where, params in self._scan(user_id, topic, since, until):
+            try:
+                for row in conn.execute(
+                    f"SELECT ts, user_id, exam_id, topic, accuracy FROM results {where} ORDER BY ts", params
+                ):
+                    yield dict(zip(FIELDNAMES, row))
+            finally:
+                conn.close()
+
+    def topic_averages(
+        self,
+        user_id: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Dict[str, float]:
+        """Mean accuracy per topic, aggregated inside each partition."""
+        sums: Dict[str, List[float]] = {}
+        for conn, where, params in self._scan(user_id, None, since, until):
+            try:
+                for topic, total, n in conn.execute(
+                    f"SELECT topic, SUM(accuracy), COUNT(*) FROM results {where} GROUP BY topic", params
+                ):
+                    acc = sums.setdefault(topic, [0.0, 0])
+                    acc[0] += total
+                    acc[1] += n
+            finally:
+                conn.close()
+        return {t: total / n for t, (total, n) in sums.items() if n}
+
+    def user_topic_averages(self, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, float]]:
+        """Mean accuracy per (user, topic), for every user or just ``user_ids``."""
+        sums: Dict[Tuple[int, str], List[float]] = {}
+        ids = None if user_ids is None else sorted(set(user_ids))
+        batches = [None] if ids is None else [ids[i:i + 500] for i in range(0, len(ids), 500)]
+        for batch in batches:
+            for conn, where, params in self._scan(None, None, None, None):
+                if batch is not None:
+                    where = (where + " AND " if where else "WHERE ") + f"user_id IN ({','.join('?' * len(batch))})"
+                    params = [*params, *batch]
+                try:
+                    for uid, topic, total, n in conn.execute(
+                        f"SELECT user_id, topic, SUM(accuracy), COUNT(*) FROM results {where} GROUP BY user_id, topic",
+                        params,
+                    ):
+                        acc = sums.setdefault((uid, topic), [0.0, 0])
+                        acc[0] += total
+                        acc[1] += n
+                finally:
+                    conn.close()
+        out: Dict[int, Dict[str, float]] = {}
+        for (uid, topic), (total, n) in sums.items():
+            out.setdefault(uid, {})[topic] = total / n
+        return out
+
+    def active_users(self, since: float) -> Set[int]:
+        """Users with at least one result at or after ``since``."""
+        users: Set[int] = set()
+        for conn, where, params in self._scan(None, None, since, None):
+            try:
+                users.update(uid for (uid,) in conn.execute(f"SELECT DISTINCT user_id FROM results {where}", params))
+            finally:
+                conn.close()
+        return users
+
+    def _scan(self, user_id, topic, since, until):
+        self.flush()  # read-your-writes within this process
+        self.import_legacy_csv()
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if topic is not None:
+            clauses.append("topic = ?")
+            params.append(topic)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        parts = _partitions()
+        months = {os.path.basename(p)[6:-3]: p for p, _, _ in parts if os.path.basename(p).startswith("month-")}
+        compacted: Dict[str, Set[str]] = {}
+        for path, start, end in parts:
+            if (since is not None and end <= since) or (until is not None and start >= until):
+                continue  # partition pruning
+            name = os.path.basename(path)
+            if name.startswith("day-") and name[4:11] in months:
+                # A day already folded into its month but not yet removed
+                if name[4:11] not in compacted:
+                    compacted[name[4:11]] = _compacted_days(months[name[4:11]])
+                if name[4:-3] in compacted[name[4:11]]:
+                    continue
+            yield _connect(path), where, params
+
+    def compact(self, now: Optional[float] = None) -> List[str]:
+        """Fold finished day partitions into their month partition; returns the days merged."""
+        self.flush()
+        now = time.time() if now is None else now
+        cutoff = datetime.fromtimestamp(now, tz=timezone.utc) - timedelta(days=ANALYTICS_COMPACT_GRACE_DAYS)
+        merged = []
+        with _file_lock(".compact.lock"):
+            for path, start, _ in _partitions():
+                if not os.path.basename(path).startswith("day-") or start >= cutoff.timestamp():
+                    continue
+                day = os.path.basename(path)[4:-3]
+                month_path = _month_path(day[:7])
+                if day not in _compacted_days(month_path):
+                    # The month rows and their marker commit first. SQLite only commits
+                    # across attached WAL files atomically per file, so the day file is
+                    # cleared in a second step; the marker makes a rerun skip the copy
+                    # and lets readers ignore the day file meanwhile
+                    conn = _connect(month_path)
+                    try:
+                        conn.execute("ATTACH DATABASE ? AS src", (path,))
+                        with transaction(conn):
+                            copied = conn.execute(
+                                "INSERT INTO results (ts, user_id, exam_id, topic, accuracy)"
+                                " SELECT ts, user_id, exam_id, topic, accuracy FROM src.results ORDER BY user_id, ts"
+                            ).rowcount
+                            conn.execute(
+                                "INSERT INTO compacted_days (day, rows, compacted_at) VALUES (?, ?, ?)",
+                                (day, copied, now),
+                            )
+                        conn.execute("DETACH DATABASE src")
+                    finally:
+                        conn.close()
+                _drop_day(path)
+                merged.append(day)
+        return merged
+
+    def export_csv(self, path: str, **filters: Any) -> int:
+        n = 0
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            for row in self.query(**filters):
+                row["ts"] = datetime.fromtimestamp(row["ts"], tz=timezone.utc).isoformat()
+                writer.writerow(row)
+                n += 1
+        return n
+
+
+_store: Optional[AnalyticsStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> AnalyticsStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AnalyticsStore()
+    return _store
+
+
+if __name__ == "__main__":
+    import sys
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "compact":
+        print(f"Compacted {len(get_store().compact())} day partitions")
+    elif cmd == "export" and len(sys.argv) > 2:
+        print(f"Exported {get_store().export_csv(sys.argv[2])} rows to {sys.argv[2]}")
+    else:
+        print("usage: python -m ai_engine.analytics_store compact | export OUT.csv")
@@ -0,0 +1,39 @@
+import hashlib
+import random
+from typing import List, Dict, Any
+
+
+LABELS = ["A", "B", "C", "D"]
+
+
+def variant_seed(blueprint_id: int, user_id: int) -> int:
+    # Stable across processes and restarts (unlike hash()); fits a signed SQLite INTEGER.
+    digest = hashlib.sha256(f"{blueprint_id}:{user_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:7], "big")
+
+
+def build_variant(questions: List[Dict[str, Any]], seed: int) -> List[Dict[str, Any]]:
+    """Return a per-student copy of a blueprint's questions.
+
+    Question order and option labels are shuffled with ``seed``; each answer
+    label is remapped to wherever its option text landed. Question ids are kept
+    so submitted answers can be graded against the same variant later.
+    """
+    rng = random.Random(seed)
+    order = list(range(len(questions)))
+    rng.shuffle(order)
+    variant: List[Dict[str, Any]] = []
+    for idx in order:
+        q = questions[idx]
+        options = q.get("options") or {}
+        labels = [l for l in LABELS if l in options]
+        shuffled = labels[:]
+        rng.shuffle(shuffled)
+        # new label labels[i] shows the option that was under shuffled[i]
+        remap = {old: new for new, old in zip(labels, shuffled)}
+        variant.append({
+            **q,
+            "options": {new: options[old] for new, old in zip(labels, shuffled)},
+            "answer": remap.get(q.get("answer"), q.get("answer")),
+        })
+    return variant
@@ -0,0 +1,510 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from .storage import STATE_DB_PATH, connect_sqlite, transaction, log_ai
+
+# memory | sqlite | redis
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Local LRU in front of a shared backend, kept coherent by pub/sub invalidation
+CACHE_NEAR = os.getenv("CACHE_NEAR", "1") != "0"
+CACHE_NEAR_SIZE = int(os.getenv("CACHE_NEAR_SIZE", "2048"))
+CACHE_NEAR_TTL_S = float(os.getenv("CACHE_NEAR_TTL_S", "60"))
+INVALIDATION_CHANNEL = "codexedu:cache:invalidate"
+
+
+class CacheBackend(ABC):
+    """Key/value cache holding JSON-serializable values, with optional TTL and pub/sub."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set ``key`` only if it holds no live value; True if this call stored it."""
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        """Atomically add one to an integer value (missing = 0) and return it."""
+        ...
+
+    @abstractmethod
+    def publish(self, channel: str, message: str) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        ...
+
+
+class MemoryCache(CacheBackend):
+    """Bounded in-process LRU; pub/sub only reaches subscribers in this process."""
+
+    def __init__(self, maxsize: int = 10000, default_ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[1] is None or item[1] >= time.monotonic()):
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def _store(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value, expires = self._data.get(key, (0, None))
+            self._data[key] = (int(value) + 1, expires)
+            self._data.move_to_end(key)
+            return int(value) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def publish(self, channel: str, message: str) -> None:
+        for callback in list(self._subscribers.get(channel, [])):
+            callback(message)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self._subscribers.setdefault(channel, []).append(callback)
+
+
+class SQLiteCache(CacheBackend):
+    """Shared by every process on one host; pub/sub is a polled event table."""
+
+    POLL_INTERVAL_S = 0.5
+    # Expired rows are only dropped on read; keys nobody reads again (idempotency
+    # keys, prefetch slots) are swept by writers at most this often
+    PURGE_INTERVAL_S = 60.0
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._next_purge = 0.0
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = {}
+        self._poller: Optional[threading.Thread] = None
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            " WITHOUT ROWID"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS cache_events (id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " channel TEXT NOT NULL, message TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.path)
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._db().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] < time.time():
+            self.delete(key)
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        self._db().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None),
+        )
+        if now >= self._next_purge:
+            self.purge_expired(now)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        # An expired row counts as absent; the upsert's WHERE leaves a live one alone
+        return self._db().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+            " WHERE cache.expires_at IS NOT NULL AND cache.expires_at < ?",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None, now),
+        ).rowcount == 1
+
+    def delete(self, key: str) -> None:
+        self._db().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Delete every expired row; returns how many were removed."""
+        now = time.time() if now is None else now
+        self._next_purge = now + self.PURGE_INTERVAL_S
+        return self._db().execute("DELETE FROM cache WHERE expires_at < ?", (now,)).rowcount
+
+    def incr(self, key: str) -> int:
+        db = self._db()
+        with transaction(db):
+            db.execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, '1', NULL)"
+                " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                (key,),
+            )
+            return int(db.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()[0])
+
+    def publish(self, channel: str, message: str) -> None:
+        now = time.time()
+        db = self._db()
+        db.execute("INSERT INTO cache_events (channel, message, created_at) VALUES (?, ?, ?)", (channel, message, now))
+        # Events only need to outlive the slowest poller
+        db.execute("DELETE FROM cache_events WHERE created_at < ?", (now - 60,))
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self._subscribers.setdefault(channel, []).append(callback)
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll, name="sqlite-cache-events", daemon=True)
+            self._poller.start()
+
+    def _poll(self) -> None:
+        last = self._db().execute("SELECT COALESCE(MAX(id), 0) FROM cache_events").fetchone()[0]
+        while True:
+            time.sleep(self.POLL_INTERVAL_S)
+            try:
+                rows = self._db().execute(
+                    "SELECT id, channel, message FROM cache_events WHERE id > ? ORDER BY id", (last,)
+                ).fetchall()
+            except Exception:
+                continue
+            for event_id, channel, message in rows:
+                last = event_id
+                for callback in list(self._subscribers.get(channel, [])):
+                    try:
+                        callback(message)
+                    except Exception:
+                        pass
+
+
+class RespError(RuntimeError):
+    pass
+
+
+class _RespConnection:
+    """Just enough of the Redis serialization protocol (RESP2) for a cache."""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None, timeout: float = 2.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+
+    def send(self, *args: Any) -> None:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+
+    def read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RespError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = self.reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self.read_reply() for _ in range(size)]
+        raise RespError(f"unexpected reply {line!r}")
+
+    def command(self, *args: Any) -> Any:
+        self.send(*args)
+        return self.read_reply()
+
+    def close(self) -> None:
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+
+class RedisCache(CacheBackend):
+    """Cache shared across nodes through any Redis-protocol server."""
+
+    def __init__(self, url: str = REDIS_URL, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._pool: List[_RespConnection] = []
+        self._pool_lock = threading.Lock()
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = {}
+        self._sub_thread: Optional[threading.Thread] = None
+
+    def _connect(self) -> _RespConnection:
+        return _RespConnection(self.host, self.port, self.db, self.password, self.timeout)
+
+    def _command(self, *args: Any) -> Any:
+        with self._pool_lock:
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            reply = conn.command(*args)
+        except RespError:
+            self._release(conn)
+            raise
+        except Exception:
+            conn.close()  # broken socket; never return it to the pool
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn: _RespConnection) -> None:
+        with self._pool_lock:
+            if len(self._pool) < 16:
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._command("GET", key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        if ttl:
+            self._command("SET", key, data, "PX", int(ttl * 1000))
+        else:
+            self._command("SET", key, data)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        data = json.dumps(value, ensure_ascii=False)
+        if ttl:
+            return self._command("SET", key, data, "PX", int(ttl * 1000), "NX") is not None
+        return self._command("SET", key, data, "NX") is not None
+
+    def delete(self, key: str) -> None:
+        self._command("DEL", key)
+
+    def incr(self, key: str) -> int:
+        return int(self._command("INCR", key))
+
+    def publish(self, channel: str, message: str) -> None:
+        self._command("PUBLISH", channel, message)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self._subscribers.setdefault(channel, []).append(callback)
+        if self._sub_thread is None:
+            self._sub_thread = threading.Thread(target=self._listen, name="redis-cache-sub", daemon=True)
+            self._sub_thread.start()
+
+    def _listen(self) -> None:
+        backoff = 0.5
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.sock.settimeout(None)  # block until a message arrives
+                conn.send("SUBSCRIBE", *self._subscribers.keys())
+                backoff = 0.5
+                while True:
+                    reply = conn.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        channel, message = reply[1].decode("utf-8"), reply[2].decode("utf-8")
+                        for callback in list(self._subscribers.get(channel, [])):
+                            try:
+                                callback(message)
+                            except Exception:
+                                pass
+            except Exception as e:
+                log_ai(f"[cache][subscribe_error] {type(e).__name__}: {e}")
+                if conn is not None:
+                    conn.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+class TwoTierCache(CacheBackend):
+    """Local LRU (near cache) in front of a shared backend.
+
+    Reads hit the local tier first. Writes and deletes go to the shared tier
+    and are broadcast on ``INVALIDATION_CHANNEL`` so other processes and nodes
+    drop their local copy instead of serving it until the local TTL expires.
+    """
+
+    def __init__(self, shared: CacheBackend, local: Optional[MemoryCache] = None):
+        self.shared = shared
+        self.local = local or MemoryCache(maxsize=CACHE_NEAR_SIZE, default_ttl=CACHE_NEAR_TTL_S)
+        self.node_id = uuid.uuid4().hex
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+        try:
+            shared.subscribe(INVALIDATION_CHANNEL, self._on_invalidate)
+        except Exception as e:
+            log_ai(f"[cache][near_cache_unsynced] {type(e).__name__}: {e}")
+
+    def _on_invalidate(self, message: str) -> None:
+        origin, _, key = message.partition(" ")
+        if origin != self.node_id:
+            self.local.delete(key)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+        value = self.shared.get(key)
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["shared_hits"] += 1
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.shared.set(key, value, ttl)
+        self.local.set(key, value, min(ttl, CACHE_NEAR_TTL_S) if ttl else None)
+        self.publish(INVALIDATION_CHANNEL, f"{self.node_id} {key}")
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        if not self.shared.add(key, value, ttl):
+            self.local.delete(key)  # the shared value wins; read it on the next get
+            return False
+        self.local.set(key, value, min(ttl, CACHE_NEAR_TTL_S) if ttl else None)
+        self.publish(INVALIDATION_CHANNEL, f"{self.node_id} {key}")
+        return True
+
+    def delete(self, key: str) -> None:
+        self.shared.delete(key)
+        self.local.delete(key)
+        self.publish(INVALIDATION_CHANNEL, f"{self.node_id} {key}")
+
+    def incr(self, key: str) -> int:
+        value = self.shared.incr(key)
+        self.local.set(key, value)
+        self.publish(INVALIDATION_CHANNEL, f"{self.node_id} {key}")
+        return value
+
+    def publish(self, channel: str, message: str) -> None:
+        self.shared.publish(channel, message)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self.shared.subscribe(channel, callback)
+
+
+class NamespacedCache(CacheBackend):
+    def __init__(self, backend: CacheBackend, namespace: str):
+        self.backend = backend
+        self.prefix = f"codexedu:{namespace}:"
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.backend.get(self.prefix + key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.backend.set(self.prefix + key, value, ttl)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return self.backend.add(self.prefix + key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(self.prefix + key)
+
+    def incr(self, key: str) -> int:
+        return self.backend.incr(self.prefix + key)
+
+    def publish(self, channel: str, message: str) -> None:
+        self.backend.publish(channel, message)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+        self.backend.subscribe(channel, callback)
+
+
+def create_backend(kind: str = CACHE_BACKEND, near: bool = CACHE_NEAR) -> CacheBackend:
+    if kind == "memory":
+        return MemoryCache()
+    shared: CacheBackend = RedisCache(REDIS_URL) if kind == "redis" else SQLiteCache()
+    return TwoTierCache(shared) if near else shared
+
+
+_backend: Optional[CacheBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_cache(namespace: str, near: bool = True) -> CacheBackend:
+    """Process-wide cache for ``namespace`` ("questions", "feedback", ...).
+
+    ``near=False`` skips the local tier, for small values that must be current
+    on every read (version counters) rather than up to CACHE_NEAR_TTL_S old.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    backend = _backend.shared if not near and isinstance(_backend, TwoTierCache) else _backend
+    return NamespacedCache(backend, namespace)
+
+
+def cache_stats() -> Dict[str, Any]:
+    if isinstance(_backend, TwoTierCache):
+        return {"backend": CACHE_BACKEND, **_backend.stats}
+    return {"backend": CACHE_BACKEND}
@@ -0,0 +1,370 @@
+# Offline cohort / topic / trend report over the full exam history.
+#
+#   python -m ai_engine.cohort_report [--workers N] [--chunk ROWS] [--out PATH]
+#
+# Exams are read in keyset-paginated chunks (``id > ? ORDER BY id LIMIT ?``),
+# expanded to answers by generator stages and folded into fixed-size NumPy
+# accumulators, so memory depends on the number of topics / weeks / cohorts,
+# not on the number of answers. Disjoint id ranges run in a process pool and
+# the partial accumulators are merged by key.
+import os
+import json
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .blueprint import build_variant
+from .storage import DATA_DIR, EXAMS_SHARDS, decompress_text, ensure_parent_dir, exams_shard_paths
+
+EXAMS_PATH = os.path.join(DATA_DIR, "exams.db")
+ARCHIVE_PATH = os.path.join(DATA_DIR, "exams_archive.db")
+USERS_PATH = os.path.join(DATA_DIR, "users.db")
+REPORT_PATH = os.path.join(DATA_DIR, "cohort_report.json")
+
+CHUNK_ROWS = int(os.getenv("REPORT_CHUNK_ROWS", "2000"))
+# Score histogram: 20 bins of 5 points over 0-100
+SCORE_BINS = [5.0 * i for i in range(21)]
+
+# The API imports this module for load_report only, so numpy loads with the
+# first accumulator (in the report job and its workers), not on import
+np = None
+
+
+def _load_numpy() -> None:
+    global np
+    if np is None:
+        import numpy
+
+        np = numpy
+
+
+class _Index:
+    """Grow-only mapping from a string key to a dense array index."""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.pos: Dict[str, int] = {}
+
+    def __call__(self, key: str) -> int:
+        i = self.pos.get(key)
+        if i is None:
+            i = self.pos[key] = len(self.keys)
+            self.keys.append(key)
+        return i
+
+
+class ReportAccumulator:
+    """Mergeable sums; every statistic in the report is derived from these."""
+
+    def __init__(self):
+        _load_numpy()
+        self.topics, self.weeks, self.cohorts = _Index(), _Index(), _Index()
+        # per topic: answers, correct
+        self.topic_n = np.zeros(0, dtype=np.int64)
+        self.topic_correct = np.zeros(0, dtype=np.int64)
+        # per week: exams, score sum, answers, correct
+        self.week_exams = np.zeros(0, dtype=np.int64)
+        self.week_score = np.zeros(0)
+        self.week_n = np.zeros(0, dtype=np.int64)
+        self.week_correct = np.zeros(0, dtype=np.int64)
+        # per cohort: exams, score sum, score sum of squares
+        self.cohort_exams = np.zeros(0, dtype=np.int64)
+        self.cohort_score = np.zeros(0)
+        self.cohort_score2 = np.zeros(0)
+        # per (cohort, topic): answers, correct; grown as a dense 2-D block
+        self.ct_n = np.zeros((0, 0), dtype=np.int64)
+        self.ct_correct = np.zeros((0, 0), dtype=np.int64)
+        self.score_hist = np.zeros(len(SCORE_BINS) - 1, dtype=np.int64)
+
+    @staticmethod
+    def _grow(arr: "np.ndarray", size: int) -> "np.ndarray":
+        if len(arr) >= size:
+            return arr
+        out = np.zeros(max(size, 2 * len(arr)), dtype=arr.dtype)
+        out[:len(arr)] = arr
+        return out
+
+    @staticmethod
+    def _grow2(arr: "np.ndarray", rows: int, cols: int) -> "np.ndarray":
+        if arr.shape[0] >= rows and arr.shape[1] >= cols:
+            return arr
+        out = np.zeros((max(rows, arr.shape[0]), max(cols, arr.shape[1])), dtype=arr.dtype)
+        out[:arr.shape[0], :arr.shape[1]] = arr
+        return out
+
+    def _fit(self) -> Tuple[int, int, int]:
+        # Make room for every key seen so far; returns (topics, weeks, cohorts)
+        nt, nw, nc = len(self.topics.keys), len(self.weeks.keys), len(self.cohorts.keys)
+        for name, n in (
+            ("topic_n", nt), ("topic_correct", nt),
+            ("week_exams", nw), ("week_score", nw), ("week_n", nw), ("week_correct", nw),
+            ("cohort_exams", nc), ("cohort_score", nc), ("cohort_score2", nc),
+        ):
+            setattr(self, name, self._grow(getattr(self, name), n))
+        self.ct_n = self._grow2(self.ct_n, nc, nt)
+        self.ct_correct = self._grow2(self.ct_correct, nc, nt)
+        return nt, nw, nc
+
+    def add_exams(self, week_idx: "np.ndarray", cohort_idx: "np.ndarray", scores: "np.ndarray") -> None:
+        _, nw, nc = self._fit()
+        self.week_exams[:nw] += np.bincount(week_idx, minlength=nw)
+        self.week_score[:nw] += np.bincount(week_idx, weights=scores, minlength=nw)
+        self.cohort_exams[:nc] += np.bincount(cohort_idx, minlength=nc)
+        self.cohort_score[:nc] += np.bincount(cohort_idx, weights=scores, minlength=nc)
+        self.cohort_score2[:nc] += np.bincount(cohort_idx, weights=scores * scores, minlength=nc)
+        self.score_hist += np.histogram(np.clip(scores, 0.0, 100.0), bins=SCORE_BINS)[0]
+
+    def add_answers(self, topic_idx: "np.ndarray", week_idx: "np.ndarray", cohort_idx: "np.ndarray",
+                    correct: "np.ndarray") -> None:
+        nt, nw, nc = self._fit()
+        ok = correct.astype(np.int64)
+        self.topic_n[:nt] += np.bincount(topic_idx, minlength=nt)
+        self.topic_correct[:nt] += np.bincount(topic_idx, weights=ok, minlength=nt).astype(np.int64)
+        self.week_n[:nw] += np.bincount(week_idx, minlength=nw)
+        self.week_correct[:nw] += np.bincount(week_idx, weights=ok, minlength=nw).astype(np.int64)
+        flat = cohort_idx * self.ct_n.shape[1] + topic_idx
+        size = self.ct_n.size
+        self.ct_n += np.bincount(flat, minlength=size).reshape(self.ct_n.shape)
+        self.ct_correct += np.bincount(flat, weights=ok, minlength=size).astype(np.int64).reshape(self.ct_n.shape)
+
+    def merge(self, other: "ReportAccumulator") -> "ReportAccumulator":
+        """Fold ``other`` into self; keys are re-mapped by name."""
+        t = np.array([self.topics(k) for k in other.topics.keys], dtype=np.int64)
+        w = np.array([self.weeks(k) for k in other.weeks.keys], dtype=np.int64)
+        c = np.array([self.cohorts(k) for k in other.cohorts.keys], dtype=np.int64)
+        self._fit()
+        other._fit()
+        for name, idx in (
+            ("topic_n", t), ("topic_correct", t),
+            ("week_exams", w), ("week_score", w), ("week_n", w), ("week_correct", w),
+            ("cohort_exams", c), ("cohort_score", c), ("cohort_score2", c),
+        ):
+            getattr(self, name)[idx] += getattr(other, name)[:len(idx)]  # keys are unique, no add.at needed
+        if len(c) and len(t):
+            rows, cols = np.ix_(c, t)
+            self.ct_n[rows, cols] += other.ct_n[:len(c), :len(t)]
+            self.ct_correct[rows, cols] += other.ct_correct[:len(c), :len(t)]
+        self.score_hist += other.score_hist
+        return self
+
+    def to_report(self) -> Dict[str, Any]:
+        self._fit()
+
+        def pct(num, den):
+            return round(100.0 * float(num) / float(den), 2) if den else None
+
+        topics = {
+            k: {"answers": int(self.topic_n[i]), "accuracy": pct(self.topic_correct[i], self.topic_n[i])}
+            for i, k in enumerate(self.topics.keys)
+        }
+        weekly = [
+            {
+                "week": k,
+                "exams": int(self.week_exams[i]),
+                "avg_score": round(float(self.week_score[i] / self.week_exams[i]), 2) if self.week_exams[i] else None,
+                "answers": int(self.week_n[i]),
+                "accuracy": pct(self.week_correct[i], self.week_n[i]),
+            }
+            for i, k in sorted(enumerate(self.weeks.keys), key=lambda x: x[1])
+        ]
+        cohorts = {}
+        for i, k in enumerate(self.cohorts.keys):
+            n = int(self.cohort_exams[i])
+            mean = float(self.cohort_score[i] / n) if n else 0.0
+            var = max(0.0, float(self.cohort_score2[i] / n) - mean * mean) if n else 0.0
+            cohorts[k] = {
+                "exams": n,
+                "avg_score": round(mean, 2),
+                "score_std": round(var ** 0.5, 2),
+                "topic_accuracy": {
+                    t: pct(self.ct_correct[i, j], self.ct_n[i, j])
+                    for j, t in enumerate(self.topics.keys)
+                    if j < self.ct_n.shape[1] and self.ct_n[i, j]
+                },
+            }
+        return {
+            "generated_at": datetime.utcnow().isoformat(),
+            "exams": int(self.week_exams.sum()),
+            "answers": int(self.topic_n.sum()),
+            "topics": topics,
+            "weekly": weekly,
+            "cohorts": cohorts,
+            "score_histogram": {"bins": list(SCORE_BINS), "counts": self.score_hist.tolist()},
+        }
+
+
+# ---------------- Pipeline stages ----------------
+
+def read_chunks(conn: sqlite3.Connection, lo: int, hi: int, chunk: int) -> Iterator[List[tuple]]:
+    """Submitted exams with ``lo < id <= hi``, ``chunk`` rows at a time."""
+    last = lo
+    while True:
+        rows = conn.execute(
+            "SELECT id, user_id, created_at, score, questions_json, answers_json, blueprint_id, variant_seed"
+            " FROM exams WHERE id > ? AND id <= ? AND answers_json IS NOT NULL AND answers_json != '{}'"
+            " ORDER BY id LIMIT ?",
+            (last, hi, chunk),
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def expand(rows: List[tuple], blueprint: Any) -> Iterator[Tuple[tuple, List[Tuple[str, bool]]]]:
+    """Each exam row with its ``(topic, is_correct)`` answers."""
+    for row in rows:
+        _, _, _, _, qjson, ajson, bid, seed = row
+        answers = json.loads(ajson or "{}")
+        qjson = decompress_text(qjson)
+        if bid is not None and not qjson:
+            questions = build_variant(blueprint(bid), seed)
+        else:
+            questions = json.loads(qjson or "[]")
+        yield row, [(q.get("topic", "General"), answers.get(q.get("id")) == q.get("answer")) for q in questions]
+
+
+def _week_of(created_at: Optional[str]) -> str:
+    try:
+        day = datetime.fromisoformat(str(created_at)).date()
+    except ValueError:
+        return "unknown"
+    return (day - timedelta(days=day.weekday())).isoformat()  # Monday of the ISO week
+
+
+_cohort_of: Dict[int, str] = {}
+
+
+def _init_worker(cohort_of: Dict[int, str]) -> None:
+    # Shipped once per worker process instead of once per range
+    global _cohort_of
+    _cohort_of = cohort_of
+
+
+def _process_range(args: Tuple[str, str, int, int, int]) -> ReportAccumulator:
+    # ``source`` is an exams shard or the archive; blueprints always live in exams.db (shard 0)
+    source, exams_path, lo, hi, chunk = args
+    cohort_of = _cohort_of
+    acc = ReportAccumulator()
+    conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    blueprints: Dict[int, List[Dict[str, Any]]] = {}
+
+    def blueprint(bid: int) -> List[Dict[str, Any]]:
+        if bid not in blueprints:
+            bconn = sqlite3.connect(f"file:{exams_path}?mode=ro", uri=True)
+            try:
+                row = bconn.execute("SELECT questions_json FROM exam_blueprints WHERE id = ?", (bid,)).fetchone()
+            finally:
+                bconn.close()
+            blueprints[bid] = json.loads(row[0] or "[]") if row else []
+        return blueprints[bid]
+
+    try:
+        for rows in read_chunks(conn, lo, hi, chunk):
+            e_week, e_cohort, e_score = [], [], []
+            a_topic, a_week, a_cohort, a_ok = [], [], [], []
+            for row, graded in expand(rows, blueprint):
+                w = acc.weeks(_week_of(row[2]))
+                c = acc.cohorts(cohort_of.get(row[1], "unknown"))
+                e_week.append(w)
+                e_cohort.append(c)
+                e_score.append(row[3] or 0.0)
+                for topic, ok in graded:
+                    a_topic.append(acc.topics(topic))
+                    a_week.append(w)
+                    a_cohort.append(c)
+                    a_ok.append(ok)
+            if e_week:
+                acc.add_exams(np.asarray(e_week), np.asarray(e_cohort), np.asarray(e_score, dtype=np.float64))
+            if a_topic:
+                acc.add_answers(np.asarray(a_topic), np.asarray(a_week), np.asarray(a_cohort), np.asarray(a_ok))
+    finally:
+        conn.close()
+    return acc
+
+
+def _load_cohorts(users_path: str) -> Dict[int, str]:
+    # Cohort = registration month
+    if not os.path.exists(users_path):
+        return {}
+    conn = sqlite3.connect(f"file:{users_path}?mode=ro", uri=True)
+    try:
+        return {uid: str(created)[:7] for uid, created in conn.execute("SELECT id, created_at FROM users") if created}
+    finally:
+        conn.close()
+
+
+def build_report(
+    exams_path: str = EXAMS_PATH,
+    users_path: str = USERS_PATH,
+    workers: Optional[int] = None,
+    chunk: int = CHUNK_ROWS,
+    archive_path: Optional[str] = ARCHIVE_PATH,
+    shards: int = EXAMS_SHARDS,
+) -> Dict[str, Any]:
+    workers = workers or os.cpu_count() or 1
+    acc = ReportAccumulator()
+    bounds = []
+    for source in (archive_path, *exams_shard_paths(shards, exams_path)):
+        if not source or not os.path.exists(source):
+            continue
+        conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+        try:
+            lo, hi = conn.execute("SELECT MIN(id), MAX(id) FROM exams").fetchone()
+        finally:
+            conn.close()
+        if lo is not None:
+            bounds.append((source, lo, hi))
+    if not bounds:
+        return acc.to_report()
+    cohort_of = _load_cohorts(users_path)
+    # Several ranges per worker so a dense id range does not stall the pool
+    n_ranges = max(1, workers * 4)
+    span = sum(hi - lo + 1 for _, lo, hi in bounds)
+    step = max(chunk, (span + n_ranges - 1) // n_ranges)
+    ranges = [
+        (source, exams_path, start, min(start + step, hi), chunk)
+        for source, lo, hi in bounds
+        for start in range(lo - 1, hi, step)
+    ]
+    if workers == 1:
+        _init_worker(cohort_of)
+        for r in ranges:
+            acc.merge(_process_range(r))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cohort_of,)) as pool:
+            for part in pool.map(_process_range, ranges):
+                acc.merge(part)
+    return acc.to_report()
+
+
+def write_report(report: Dict[str, Any], path: str = REPORT_PATH) -> None:
+    tmp = path + ".tmp"
+    ensure_parent_dir(tmp)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)  # readers never see a half-written report
+
+
+def load_report(path: str = REPORT_PATH) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the cohort / topic / trend report from exam history")
+    parser.add_argument("--exams", default=EXAMS_PATH, help="shard 0; exams-1.db etc. are read next to it")
+    parser.add_argument("--shards", type=int, default=EXAMS_SHARDS)
+    parser.add_argument("--archive", default=ARCHIVE_PATH)
+    parser.add_argument("--users", default=USERS_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--out", default=REPORT_PATH)
+    args = parser.parse_args()
+    report = build_report(args.exams, args.users, args.workers, args.chunk, args.archive, args.shards)
+    write_report(report, args.out)
+    print(f"{report['exams']} exams, {report['answers']} answers -> {args.out}")
@@ -0,0 +1,172 @@
+import os
+import json
+import math
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from .question_bank import BANK_PATH, question_fingerprint
+from .storage import thread_connection, transaction
+
+# Calibration needs a minimum sample before it overrides the requested difficulty
+ITEM_MIN_RESPONSES = int(os.getenv("ITEM_MIN_RESPONSES", "30"))
+# Items answered at roughly guessing level that also fail to separate strong from
+# weak students are treated as broken (unanswerable stem, wrong key, ...)
+ITEM_GUESS_P = float(os.getenv("ITEM_GUESS_P", "0.35"))
+ITEM_MIN_DISCRIMINATION = float(os.getenv("ITEM_MIN_DISCRIMINATION", "0.1"))
+# Negative discrimination: strong students get it wrong more often than weak ones
+ITEM_RETIRE_DISCRIMINATION = float(os.getenv("ITEM_RETIRE_DISCRIMINATION", "-0.05"))
+
+# p-value (share answering correctly) bands for each difficulty level
+DIFFICULTY_BANDS = {"easy": (0.75, 1.01), "medium": (0.45, 0.75), "hard": (0.0, 0.45)}
+
+_lock = threading.Lock()
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS item_stats ("
+        " fingerprint TEXT PRIMARY KEY,"
+        " topic TEXT,"
+        " n INTEGER NOT NULL DEFAULT 0,"
+        " n_correct INTEGER NOT NULL DEFAULT 0,"
+        " sum_x REAL NOT NULL DEFAULT 0,"  # x = rest-of-exam score of each respondent
+        " sum_x2 REAL NOT NULL DEFAULT 0,"
+        " sum_xy REAL NOT NULL DEFAULT 0,"  # y = 1 if this item was answered correctly
+        " choice_counts TEXT,"  # option text -> times selected
+        " p_value REAL,"
+        " discrimination REAL,"
+        " retired INTEGER NOT NULL DEFAULT 0,"
+        " updated_at TEXT) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_stats_topic_p ON item_stats (topic, p_value);")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_item_stats_retired ON item_stats (retired) WHERE retired = 1;")
+
+
+def _connect() -> sqlite3.Connection:
+    # Stats live next to the bank rows they describe, keyed by the same fingerprint
+    return thread_connection(BANK_PATH, _create_schema)
+
+
+def _point_biserial(n: int, n_correct: int, sum_x: float, sum_x2: float, sum_xy: float) -> Optional[float]:
+    # Pearson correlation with a 0/1 variable, from running sums
+    var_x = n * sum_x2 - sum_x * sum_x
+    var_y = n * n_correct - n_correct * n_correct
+    if var_x <= 1e-12 or var_y <= 0:
+        return None
+    return (n * sum_xy - sum_x * n_correct) / math.sqrt(var_x * var_y)
+
+
+def _is_retired(n: int, p_value: float, discrimination: Optional[float]) -> bool:
+    if n < ITEM_MIN_RESPONSES:
+        return False
+    if discrimination is not None and discrimination < ITEM_RETIRE_DISCRIMINATION:
+        return True
+    return p_value <= ITEM_GUESS_P and (discrimination is None or discrimination < ITEM_MIN_DISCRIMINATION)
+
+
+def record_responses(questions: List[Dict[str, Any]], answers: Dict[str, str]) -> None:
+    """Fold one graded submission into the running statistics of each item."""
+    total = len(questions)
+    if total < 2:
+        return
+    graded = []
+    for q in questions:
+        options = q.get("options") or {}
+        selected = answers.get(q["id"])
+        graded.append((question_fingerprint(q), q.get("topic"), selected == q.get("answer"), options.get(selected)))
+    n_right = sum(1 for g in graded if g[2])
+    now = datetime.utcnow().isoformat()
+    with _lock:
+        conn = _connect()
+        with transaction(conn):
+            fps = [g[0] for g in graded]
+            marks = ",".join("?" * len(fps))
+            current = {
+                row[0]: row
+                for row in conn.execute(
+                    "SELECT fingerprint, n, n_correct, sum_x, sum_x2, sum_xy, choice_counts"
+                    f" FROM item_stats WHERE fingerprint IN ({marks})",
+                    fps,
+                )
+            }
+            rows = []
+            for fp, topic, correct, selected_text in graded:
+                _, n, n_corr, sx, sx2, sxy, choices = current.get(fp, (fp, 0, 0, 0.0, 0.0, 0.0, None))
+                y = 1.0 if correct else 0.0
+                x = (n_right - y) / (total - 1)  # score on the rest of the exam
+                n, n_corr = n + 1, n_corr + int(correct)
+                sx, sx2, sxy = sx + x, sx2 + x * x, sxy + x * y
+                counts = json.loads(choices) if choices else {}
+                key = selected_text if selected_text is not None else "(blank)"
+                counts[key] = counts.get(key, 0) + 1
+                p_value = n_corr / n
+                disc = _point_biserial(n, n_corr, sx, sx2, sxy)
+                rows.append((
+                    fp, topic, n, n_corr, sx, sx2, sxy, json.dumps(counts, ensure_ascii=False),
+                    p_value, disc, int(_is_retired(n, p_value, disc)), now,
+                ))
+                current[fp] = (fp, n, n_corr, sx, sx2, sxy, rows[-1][7])
+            conn.executemany(
+                "INSERT OR REPLACE INTO item_stats (fingerprint, topic, n, n_correct, sum_x, sum_x2, sum_xy,"
+                " choice_counts, p_value, discrimination, retired, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+
+def lookup(questions: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Stats for the given questions, keyed by fingerprint (missing = never answered)."""
+    fps = list({question_fingerprint(q) for q in questions})
+    if not fps:
+        return {}
+    marks = ",".join("?" * len(fps))
+    rows = _connect().execute(
+        f"SELECT fingerprint, n, p_value, discrimination, retired, choice_counts FROM item_stats WHERE fingerprint IN ({marks})",
+        fps,
+    ).fetchall()
+    return {
+        fp: {
+            "n": n,
+            "p_value": p,
+            "discrimination": d,
+            "retired": bool(r),
+            "distractors": {k: v / n for k, v in json.loads(c or "{}").items()} if n else {},
+        }
+        for fp, n, p, d, r, c in rows
+    }
+
+
+def calibrated_difficulty(stats: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not stats or stats["n"] < ITEM_MIN_RESPONSES or stats["p_value"] is None:
+        return None
+    for level, (lo, hi) in DIFFICULTY_BANDS.items():
+        if lo <= stats["p_value"] < hi:
+            return level
+    return None
+
+
+def item_difficulty_b(stats: Optional[Dict[str, Any]], default: float = 0.0) -> float:
+    """Elo/IRT-style item difficulty from the observed p-value (0 = average item)."""
+    if not stats or stats["n"] < ITEM_MIN_RESPONSES or stats["p_value"] is None:
+        return default
+    p = min(0.98, max(0.02, stats["p_value"]))
+    return math.log((1.0 - p) / p)
+
+
+def filter_usable(questions: List[Dict[str, Any]], difficulty: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Drop retired items and items whose calibrated difficulty contradicts ``difficulty``."""
+    if not questions:
+        return questions
+    stats = lookup(questions)
+    usable = []
+    for q in questions:
+        s = stats.get(question_fingerprint(q))
+        if s and s["retired"]:
+            continue
+        level = calibrated_difficulty(s)
+        if difficulty and level and level != difficulty:
+            continue
+        usable.append(q)
+    return usable
@@ -0,0 +1,73 @@
+# Incremental parsing of streamed LLM output.
+#
+# The model is asked for {"questions": [...]} (or a bare array), but output
+# arrives token by token and may be cut off by max_tokens or carry stray text
+# around the JSON. ObjectArrayStream tracks string and bracket state across
+# chunks and hands back each object element of a top-level array (in practice
+# the questions array; callers validate what they get) as soon as its closing
+# brace arrives, parsed on its own: a malformed element is dropped without
+# losing its neighbours, and everything before a truncation is kept.
+import json
+from typing import Any, Dict, List
+
+# Container stacks at which an opening brace starts an element: inside a bare
+# top-level array, or inside an array that is a value of the top-level object
+_ELEMENT_PARENTS = (["["], ["{", "["])
+
+
+class ObjectArrayStream:
+    def __init__(self):
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._element: List[str] = []  # characters of the element being read
+        self._element_depth = -1  # stack depth at which it closes; -1 when not in one
+        self.emitted = 0
+        self.malformed = 0
+
+    @property
+    def in_element(self) -> bool:
+        """True while an element has started but not closed (output cut here loses it)."""
+        return self._element_depth >= 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume the next chunk; returns the element objects it completed."""
+        done: List[Dict[str, Any]] = []
+        for ch in text:
+            if self._element_depth >= 0:
+                self._element.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{" or ch == "[":
+                if ch == "{" and self._element_depth < 0 and self._stack in _ELEMENT_PARENTS:
+                    self._element = ["{"]
+                    self._element_depth = len(self._stack)
+                self._stack.append(ch)
+            elif ch == "}" or ch == "]":
+                if self._stack:
+                    self._stack.pop()
+                if len(self._stack) == self._element_depth:
+                    self._element_depth = -1
+                    obj = self._parse("".join(self._element))
+                    if obj is not None:
+                        done.append(obj)
+        return done
+
+    def _parse(self, text: str) -> Any:
+        try:
+            obj = json.loads(text)
+        except ValueError:
+            obj = None
+        if not isinstance(obj, dict):
+            self.malformed += 1
+            return None
+        self.emitted += 1
+        return obj
@@ -0,0 +1,174 @@
+import os
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Lower value runs first
+PRIORITY_INTERACTIVE = 0  # /exam/generate on behalf of a waiting student
+PRIORITY_REFILL = 1  # background pool / cache refills
+PRIORITY_FEEDBACK = 2  # post-submit coaching text, has a rule-based fallback
+
+# Provider limits are account-wide; each worker process gets an equal share
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+LLM_RPM = float(os.getenv("LLM_RPM", "60")) / WEB_CONCURRENCY
+LLM_TPM = float(os.getenv("LLM_TPM", "60000")) / WEB_CONCURRENCY
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_MAX_WAIT_S = float(os.getenv("LLM_MAX_WAIT_S", "10"))
+
+
+class SchedulerBusy(RuntimeError):
+    """Raised when an LLM call is shed; callers fall back to deterministic output."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: Optional[float] = None) -> float:
+        """Seconds until ``amount`` can be taken (0 if available now)."""
+        self._refill(time.monotonic() if now is None else now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        # Settle an estimate against actual usage; may go negative (debt)
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return sum(len(m.get("content") or "") for m in messages) // 4 + max_tokens
+
+
+class LLMScheduler:
+    """Process-wide gate for every outbound LLM call.
+
+    Calls wait in a bounded priority queue until they reach the head, a
+    concurrency slot is free and both the request and token buckets allow
+    them. A call that cannot be queued, or waits longer than ``max_wait``,
+    raises :class:`SchedulerBusy` so the caller can degrade immediately.
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_RPM,
+        tpm: float = LLM_TPM,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        max_wait: float = LLM_MAX_WAIT_S,
+    ):
+        self.requests = TokenBucket(rpm / 60.0, max(1.0, rpm))
+        self.tokens = TokenBucket(tpm / 60.0, max(1.0, tpm))
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._stats = {"admitted": 0, "shed_queue_full": 0, "shed_timeout": 0, "errors": 0}
+        self._wait_total = 0.0
+
+    def _acquire(self, priority: int, est_tokens: int, max_wait: float) -> None:
+        entry = [priority, next(self._seq)]
+        start = time.monotonic()
+        deadline = start + max_wait
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self._stats["shed_queue_full"] += 1
+                raise SchedulerBusy("LLM queue full")
+            heapq.heappush(self._heap, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._heap[0] is entry and self._active < self.max_concurrency:
+                        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(est_tokens, now))
+                        if wait == 0:
+                            heapq.heappop(self._heap)
+                            self.requests.take(1)
+                            self.tokens.take(est_tokens)
+                            self._active += 1
+                            self._stats["admitted"] += 1
+                            self._wait_total += now - start
+                            return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._heap.remove(entry)
+                        heapq.heapify(self._heap)
+                        self._stats["shed_timeout"] += 1
+                        raise SchedulerBusy("LLM queue wait exceeded")
+                    self._cond.wait(min(remaining, wait) if wait else remaining)
+            finally:
+                # Wake the new head (or everyone after a removal)
+                self._cond.notify_all()
+
+    def _release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def run(
+        self,
+        fn: Callable[[], Any],
+        priority: int = PRIORITY_INTERACTIVE,
+        est_tokens: int = 0,
+        max_wait: Optional[float] = None,
+    ) -> Any:
+        """Run ``fn`` (one LLM request) once admitted and return its result."""
+        self._acquire(priority, est_tokens, self.max_wait if max_wait is None else max_wait)
+        try:
+            result = fn()
+        except Exception:
+            with self._cond:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            self._release()
+        usage = getattr(result, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if isinstance(actual, int):
+            with self._cond:
+                self.tokens.adjust(actual - min(est_tokens, self.tokens.capacity))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            admitted = self._stats["admitted"]
+            return {
+                **self._stats,
+                "queued": len(self._heap),
+                "active": self._active,
+                "avg_wait_ms": round(1000 * self._wait_total / admitted, 2) if admitted else 0.0,
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
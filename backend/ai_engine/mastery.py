@@ -0,0 +1,221 @@
+import os
+import json
+import math
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+from .item_stats import item_difficulty_b, lookup as lookup_item_stats
+from .question_bank import question_fingerprint
+from .storage import DATA_DIR, EXAMS_SHARDS, decompress_text, exams_shard_paths, thread_connection, transaction
+
+MASTERY_PATH = os.path.join(DATA_DIR, "mastery.db")
+EXAMS_PATH = os.path.join(DATA_DIR, "exams.db")
+ARCHIVE_PATH = os.path.join(DATA_DIR, "exams_archive.db")
+
+# Elo-style update: theta += K * (correct - p), p = sigmoid(theta - b).
+# K starts large so a new topic converges quickly, then decays with evidence.
+K_START = float(os.getenv("MASTERY_K_START", "0.4"))
+K_DECAY = float(os.getenv("MASTERY_K_DECAY", "0.05"))
+K_MIN = float(os.getenv("MASTERY_K_MIN", "0.08"))
+# Floor so a mastered topic still shows up occasionally
+MIN_TOPIC_WEIGHT = 0.05
+
+_lock = threading.Lock()
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS mastery ("
+        " user_id INTEGER NOT NULL,"
+        " topic TEXT NOT NULL,"
+        " theta REAL NOT NULL,"
+        " n INTEGER NOT NULL,"
+        " updated_at TEXT,"
+        " PRIMARY KEY (user_id, topic)) WITHOUT ROWID"
+    )
+
+
+def _connect() -> sqlite3.Connection:
+    return thread_connection(MASTERY_PATH, _create_schema)
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def _k(n: int) -> float:
+    return max(K_MIN, K_START / (1.0 + K_DECAY * n))
+
+
+def update_mastery(user_id: int, graded: Iterable[Tuple[str, bool, float]]) -> None:
+    """Apply one Elo step per graded question: ``(topic, is_correct, item_difficulty)``."""
+    graded = list(graded)
+    if not graded:
+        return
+    now = datetime.utcnow().isoformat()
+    with _lock:
+        conn = _connect()
+        with transaction(conn):
+            topics = sorted({t for t, _, _ in graded})
+            marks = ",".join("?" * len(topics))
+            state = {
+                t: (theta, n)
+                for t, theta, n in conn.execute(
+                    f"SELECT topic, theta, n FROM mastery WHERE user_id = ? AND topic IN ({marks})",
+                    [user_id, *topics],
+                )
+            }
+            for topic, correct, b in graded:
+                theta, n = state.get(topic, (0.0, 0))
+                p = _sigmoid(theta - b)
+                state[topic] = (theta + _k(n) * ((1.0 if correct else 0.0) - p), n + 1)
+            conn.executemany(
+                "INSERT INTO mastery (user_id, topic, theta, n, updated_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(user_id, topic) DO UPDATE SET theta = excluded.theta, n = excluded.n,"
+                " updated_at = excluded.updated_at",
+                [(user_id, t, theta, n, now) for t, (theta, n) in state.items() if t in topics],
+            )
+
+
+def predict_mastery(user_id: int) -> Dict[str, float]:
+    """Probability of answering an average (medium) item correctly, per topic."""
+    conn = _connect()
+    rows = conn.execute("SELECT topic, theta FROM mastery WHERE user_id = ?", (user_id,)).fetchall()
+    return {topic: _sigmoid(theta) for topic, theta in rows}
+
+
+def topic_weights(user_id: int, topics: List[str]) -> Optional[Dict[str, float]]:
+    """Quota weights favouring low predicted mastery; ``None`` when there is no history yet."""
+    mastery = predict_mastery(user_id)
+    if not mastery:
+        return None
+    # Unseen topics get the prior p=0.5
+    return {t: max(MIN_TOPIC_WEIGHT, 1.0 - mastery.get(t, 0.5)) for t in topics}
+
+
+# ---------------- Batch recompute ----------------
+
+def recompute(
+    user_ids: "np.ndarray",
+    topic_ids: "np.ndarray",
+    correct: "np.ndarray",
+    item_b: "np.ndarray",
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Replay every graded answer (in time order) for all users at once.
+
+    Answers are grouped into (user, topic) sequences; step ``s`` of every
+    sequence is applied in a single vectorized update, so the Python loop runs
+    once per position of the longest sequence rather than once per answer.
+    Returns ``(user_ids, topic_ids, theta, n)`` per (user, topic) pair.
+    """
+    import numpy as np  # batch jobs only; the API never loads it
+
+    n_topics = int(topic_ids.max()) + 1 if len(topic_ids) else 1
+    pair = user_ids.astype(np.int64) * n_topics + topic_ids
+    order = np.argsort(pair, kind="stable")  # stable keeps time order inside a pair
+    pair_sorted = pair[order]
+    uniq, start, counts = np.unique(pair_sorted, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(uniq)), counts)
+    pos = np.arange(len(pair_sorted)) - start[group]
+    y = correct[order].astype(np.float64)
+    b = item_b[order].astype(np.float64)
+
+    theta = np.zeros(len(uniq))
+    n = np.zeros(len(uniq), dtype=np.int64)
+    steps = int(counts.max()) if len(counts) else 0
+    by_step = np.argsort(pos, kind="stable")
+    bounds = np.searchsorted(pos[by_step], np.arange(steps + 1))
+    for s in range(steps):
+        idx = by_step[bounds[s]:bounds[s + 1]]
+        g = group[idx]
+        p = 1.0 / (1.0 + np.exp(-(theta[g] - b[idx])))
+        k = np.maximum(K_MIN, K_START / (1.0 + K_DECAY * n[g]))
+        theta[g] += k * (y[idx] - p)
+        n[g] += 1
+    return uniq // n_topics, uniq % n_topics, theta, n
+
+
+def _iter_graded_answers(exams_path: str, archive_path: Optional[str] = None, shards: int = EXAMS_SHARDS):
+    # Yields (user_id, topic, is_correct, question) in each user's exam order, rebuilding class-exam
+    # variants. Archived exams are all older than the hot ones, so they are replayed first;
+    # a user's hot exams all live in one shard, so shards can follow one another.
+    from .blueprint import build_variant
+
+    conn = sqlite3.connect(exams_path)
+    try:
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(exams)")}
+        blueprints: Dict[int, List[Dict[str, Any]]] = {}
+        if "blueprint_id" in cols:
+            for bid, qjson in conn.execute("SELECT id, questions_json FROM exam_blueprints"):
+                blueprints[bid] = json.loads(qjson or "[]")
+            sql = "SELECT user_id, questions_json, answers_json, blueprint_id, variant_seed FROM exams ORDER BY created_at, id"
+        else:
+            sql = "SELECT user_id, questions_json, answers_json, NULL, NULL FROM exams ORDER BY created_at, id"
+    finally:
+        conn.close()
+    paths = [p for p in exams_shard_paths(shards, exams_path) if os.path.exists(p)]
+    if archive_path and os.path.exists(archive_path):
+        paths.insert(0, archive_path)
+    for path in paths:
+        conn = sqlite3.connect(path)
+        try:
+            for user_id, qjson, ajson, bid, seed in conn.execute(sql):
+                answers = json.loads(ajson or "{}")
+                if not answers:
+                    continue  # never submitted
+                qjson = decompress_text(qjson)
+                if bid is not None and not qjson:
+                    questions = build_variant(blueprints.get(bid, []), seed)
+                else:
+                    questions = json.loads(qjson or "[]")
+                for q in questions:
+                    yield user_id, q.get("topic", "General"), answers.get(q.get("id")) == q.get("answer"), q
+        finally:
+            conn.close()
+
+
+def rebuild_from_exams(exams_path: str = EXAMS_PATH, archive_path: str = ARCHIVE_PATH, shards: int = EXAMS_SHARDS) -> int:
+    """Recompute every user's mastery from stored exams (every shard) and replace the table."""
+    import numpy as np
+
+    users: List[int] = []
+    topics: List[str] = []
+    correct: List[bool] = []
+    fingerprints: List[str] = []
+    questions: Dict[str, Dict[str, Any]] = {}
+    for user_id, topic, is_corr, q in _iter_graded_answers(exams_path, archive_path, shards):
+        fp = question_fingerprint(q)
+        users.append(user_id)
+        topics.append(topic)
+        correct.append(is_corr)
+        fingerprints.append(fp)
+        questions.setdefault(fp, q)
+    # Same item difficulty the submit path uses, from today's calibration
+    unique = list(questions.values())
+    item_stats: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(unique), 500):
+        item_stats.update(lookup_item_stats(unique[i:i + 500]))
+    topic_names = sorted(set(topics))
+    topic_index = {t: i for i, t in enumerate(topic_names)}
+    u, t, theta, n = recompute(
+        np.asarray(users, dtype=np.int64),
+        np.asarray([topic_index[x] for x in topics], dtype=np.int64),
+        np.asarray(correct, dtype=bool),
+        np.asarray([item_difficulty_b(item_stats.get(fp)) for fp in fingerprints], dtype=np.float64),
+    )
+    now = datetime.utcnow().isoformat()
+    with _lock:
+        conn = _connect()
+        with transaction(conn):
+            conn.execute("DELETE FROM mastery")
+            conn.executemany(
+                "INSERT INTO mastery (user_id, topic, theta, n, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(int(a), topic_names[int(b)], float(c), int(d), now) for a, b, c, d in zip(u, t, theta, n)],
+            )
+    return len(u)
+
+
+if __name__ == "__main__":
+    print(f"Rebuilt mastery for {rebuild_from_exams()} (user, topic) pairs")
@@ -0,0 +1,336 @@
+import os
+import json
+import hashlib
+import random
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable
+
+from .question_record import QuestionTable
+from .storage import DATA_DIR, connect_sqlite, transaction
+
+# numpy/scipy/scikit-learn dominate the API's import time, so they load on first use
+np = sparse = HashingVectorizer = None
+
+BANK_PATH = os.path.join(DATA_DIR, "question_bank.db")
+
+N_FEATURES = 2 ** 18
+# Merge index blocks (and refresh IDF weights) once this many have piled up
+MAX_BLOCKS = 16
+_numeric_lock = threading.Lock()
+
+
+def _load_numeric() -> bool:
+    global np, sparse, HashingVectorizer
+    if HashingVectorizer is None:
+        with _numeric_lock:
+            if HashingVectorizer is None:
+                try:
+                    import numpy
+                    from scipy import sparse as scipy_sparse
+                    from sklearn.feature_extraction.text import HashingVectorizer as vectorizer_cls
+                except Exception:  # pragma: no cover
+                    return False
+                np, sparse, HashingVectorizer = numpy, scipy_sparse, vectorizer_cls
+    return True
+
+
+def question_fingerprint(q: Dict[str, Any]) -> str:
+    """Identity of a question independent of its id and option order."""
+    stem = " ".join(str(q.get("question") or "").lower().split())
+    options = sorted(" ".join(str(v).lower().split()) for v in (q.get("options") or {}).values())
+    return hashlib.sha1((stem + "\x1f" + "\x1f".join(options)).encode("utf-8")).hexdigest()
+
+
+def _question_text(q: Dict[str, Any]) -> str:
+    return " ".join([str(q.get("topic") or ""), str(q.get("question") or "")] + [str(v) for v in (q.get("options") or {}).values()])
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = connect_sqlite(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS questions ("
+        " id INTEGER PRIMARY KEY,"
+        " fingerprint TEXT NOT NULL UNIQUE,"
+        " topic TEXT NOT NULL,"
+        " difficulty TEXT NOT NULL,"
+        " source TEXT,"
+        " question_json TEXT NOT NULL,"
+        " created_at TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_questions_topic_difficulty ON questions (topic, difficulty);")
+    return conn
+
+
+class _Block:
+    __slots__ = ("ids", "topics", "difficulties", "sources", "fingerprints", "questions", "raw", "matrix")
+
+    def __init__(self, ids, topics, difficulties, sources, fingerprints, questions, raw, matrix=None):
+        self.ids = ids
+        self.topics = topics
+        self.difficulties = difficulties
+        self.sources = sources
+        self.fingerprints = fingerprints
+        self.questions = questions  # QuestionTable
+        self.raw = raw  # sublinear tf, kept so blocks can be re-weighted without re-tokenizing
+        self.matrix = matrix  # l2-normalized tf-idf, column-major so a query only touches its terms' postings
+
+
+class QuestionBank:
+    """SQLite-backed store of validated questions with an in-memory TF-IDF index.
+
+    Rows are the source of truth; the index is rebuilt from them at first use
+    and then extended with any rows other processes inserted since (by id), so
+    every worker sees the same bank without coordination.
+    """
+
+    def __init__(self, path: str = BANK_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._vectorizer = None
+        self._blocks: List[_Block] = []
+        self._last_id = 0
+        self._df = None
+        self._n_docs = 0
+        self._weighted_at = 0  # n_docs at the last full re-weighting
+        self._codes: Dict[str, int] = {}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = _connect(self.path)
+        return self._conn
+
+    def _code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._codes)
+        return code
+
+    # ---------------- writes ----------------
+
+    def add_questions(self, questions: Iterable[Dict[str, Any]], difficulty: str, source: str) -> None:
+        now = datetime.utcnow().isoformat()
+        rows = [
+            (question_fingerprint(q), q.get("topic") or "General", difficulty, source, json.dumps(q, ensure_ascii=False), now)
+            for q in questions
+            if q.get("question") and q.get("options")
+        ]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._db()
+            with transaction(conn):
+                conn.executemany(
+                    "INSERT OR IGNORE INTO questions (fingerprint, topic, difficulty, source, question_json, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    # ---------------- index maintenance ----------------
+
+    def _vectorize(self, texts: List[str]):
+        if self._vectorizer is None:
+            self._vectorizer = HashingVectorizer(
+                n_features=N_FEATURES,
+                alternate_sign=False,
+                norm=None,
+                ngram_range=(1, 2),
+                token_pattern=r"(?u)\b\w+\b",
+            )
+        tf = self._vectorizer.transform(texts).tocsr()
+        tf.data = np.log1p(tf.data)  # sublinear tf
+        return tf
+
+    def _idf(self):
+        return np.log((1.0 + self._n_docs) / (1.0 + self._df)) + 1.0
+
+    def _weight(self, tf):
+        weighted = tf.multiply(self._idf()).tocsr()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms).dot(weighted).tocsc()
+
+    def _sync(self) -> None:
+        rows = self._db().execute(
+            "SELECT id, fingerprint, topic, difficulty, question_json, source FROM questions WHERE id > ? ORDER BY id",
+            (self._last_id,),
+        ).fetchall()
+        if not rows:
+            return
+        questions = [json.loads(r[4]) for r in rows]
+        tf = self._vectorize([_question_text(q) for q in questions])
+        if self._df is None:
+            self._df = np.zeros(N_FEATURES, dtype=np.float64)
+        self._df += np.bincount(tf.indices, minlength=N_FEATURES)
+        self._n_docs += len(rows)
+        block = _Block(
+            ids=np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+            topics=np.fromiter((self._code(r[2]) for r in rows), dtype=np.int32, count=len(rows)),
+            difficulties=np.fromiter((self._code(r[3]) for r in rows), dtype=np.int32, count=len(rows)),
+            sources=np.fromiter((self._code(r[5] or "") for r in rows), dtype=np.int32, count=len(rows)),
+            fingerprints={r[1]: i for i, r in enumerate(rows)},
+            questions=QuestionTable(questions),
+            raw=tf,
+        )
+        block.matrix = self._weight(tf)
+        self._blocks.append(block)
+        self._last_id = rows[-1][0]
+        if len(self._blocks) > MAX_BLOCKS:
+            if self._n_docs >= 1.25 * self._weighted_at:
+                # IDF has drifted enough to be worth re-weighting everything
+                self._blocks = [self._merge(self._blocks)]
+                self._weighted_at = self._n_docs
+            else:
+                self._blocks = [self._blocks[0], self._merge(self._blocks[1:])]
+
+    def _merge(self, blocks: List[_Block]) -> _Block:
+        raw = sparse.vstack([b.raw for b in blocks]).tocsr()
+        fingerprints: Dict[str, int] = {}
+        offset = 0
+        for b in blocks:
+            fingerprints.update((fp, row + offset) for fp, row in b.fingerprints.items())
+            offset += len(b.ids)
+        return _Block(
+            ids=np.concatenate([b.ids for b in blocks]),
+            topics=np.concatenate([b.topics for b in blocks]),
+            difficulties=np.concatenate([b.difficulties for b in blocks]),
+            sources=np.concatenate([b.sources for b in blocks]),
+            fingerprints=fingerprints,
+            questions=QuestionTable.concat(b.questions for b in blocks),
+            raw=raw,
+            matrix=self._weight(raw),
+        )
+
+    # ---------------- reads ----------------
+
+    def _mask(
+        self,
+        block: _Block,
+        topics: Optional[List[str]],
+        difficulty: Optional[str],
+        exclude: set,
+        source: Optional[str] = None,
+    ):
+        mask = np.ones(len(block.ids), dtype=bool)
+        if topics:
+            codes = [self._codes[t] for t in topics if t in self._codes]
+            mask &= np.isin(block.topics, codes)
+        if difficulty:
+            mask &= block.difficulties == self._codes.get(difficulty, -1)
+        if source:
+            mask &= block.sources == self._codes.get(source, -1)
+        for fp in exclude:
+            row = block.fingerprints.get(fp)
+            if row is not None:
+                mask[row] = False
+        return mask
+
+    def warm(self) -> None:
+        """Load the numeric stack and build the index now rather than on the first search."""
+        if _load_numeric():
+            with self._lock:
+                self._sync()
+
+    def search(
+        self,
+        query: str,
+        topics: Optional[List[str]] = None,
+        difficulty: Optional[str] = None,
+        k: int = 10,
+        exclude: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Nearest questions to ``query`` by cosine similarity of TF-IDF vectors."""
+        if k <= 0 or not _load_numeric():
+            return []
+        exclude = set(exclude or ())
+        with self._lock:
+            self._sync()
+            if not self._blocks:
+                return []
+            qvec = self._weight(self._vectorize([query])).tocsr()
+            terms, weights = qvec.indices, qvec.data
+            if not len(terms):
+                return []
+            candidates = []
+            for block in self._blocks:
+                scores = block.matrix[:, terms].dot(weights)
+                scores[~self._mask(block, topics, difficulty, exclude)] = -1.0
+                top = np.argpartition(-scores, min(k, len(scores) - 1))[:k] if len(scores) > k else np.arange(len(scores))
+                candidates.extend((scores[i], block, i) for i in top if scores[i] > 0)
+            candidates.sort(key=lambda c: -c[0])
+            # Rows are decoded back to dicts only for the winners
+            return [block.questions[i] for _, block, i in candidates[:k]]
+
+    def similar_to(
+        self,
+        questions: List[Dict[str, Any]],
+        k: int = 10,
+        topics: Optional[List[str]] = None,
+        difficulty: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Neighbours of each given question, interleaved so every one is represented."""
+        exclude = {question_fingerprint(q) for q in questions}
+        per = [self.search(_question_text(q), topics=topics or [q.get("topic")], difficulty=difficulty, k=k, exclude=exclude)
+               for q in questions]
+        out: List[Dict[str, Any]] = []
+        for rank in range(k):
+            for hits in per:
+                if rank < len(hits) and len(out) < k:
+                    fp = question_fingerprint(hits[rank])
+                    if fp not in exclude:
+                        exclude.add(fp)
+                        out.append(hits[rank])
+        return out
+
+    def sample(
+        self,
+        topic: str,
+        difficulty: Optional[str],
+        k: int,
+        exclude: Optional[Iterable[str]] = None,
+        source: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Random questions for one topic, optionally restricted to a source ("ai" / "template")."""
+        if k <= 0 or not _load_numeric():
+            return []
+        exclude = set(exclude or ())
+        with self._lock:
+            self._sync()
+            hits = [(block, np.flatnonzero(self._mask(block, [topic], difficulty, exclude, source))) for block in self._blocks]
+            total = sum(len(idx) for _, idx in hits)
+            picked = []
+            for pos in sorted(random.sample(range(total), k=min(k, total))):
+                for block, idx in hits:
+                    if pos < len(idx):
+                        picked.append(block.questions[idx[pos]])
+                        break
+                    pos -= len(idx)
+        random.shuffle(picked)
+        return picked
+
+    def count(self, topic: str, difficulty: Optional[str] = None, source: Optional[str] = None) -> int:
+        sql = "SELECT COUNT(*) FROM questions WHERE topic = ?"
+        args: List[Any] = [topic]
+        if difficulty:
+            sql += " AND difficulty = ?"
+            args.append(difficulty)
+        if source:
+            sql += " AND source = ?"
+            args.append(source)
+        with self._lock:
+            return int(self._db().execute(sql, args).fetchone()[0])
+
+
+_bank: Optional[QuestionBank] = None
+_bank_lock = threading.Lock()
+
+
+def get_bank() -> QuestionBank:
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = QuestionBank()
+    return _bank
@@ -1,8 +1,18 @@
 import os
 import json
+import time
 import random
 import string
-from typing import List, Dict, Any, Optional
+from types import SimpleNamespace
+from typing import Callable, List, Dict, Any, Optional
+
+from .llm_scheduler import get_scheduler, estimate_tokens, PRIORITY_INTERACTIVE
+from .question_bank import get_bank, question_fingerprint
+from .question_record import QuestionRecord
+from .item_stats import filter_usable
+from .json_stream import ObjectArrayStream
+from .storage import DATA_DIR, SQLiteKeyValueStore, log_ai
+from .cache_backend import CacheBackend, get_cache
 
 try:
     import tomllib  # py311+
@@ -10,28 +20,34 @@ except Exception:  # pragma: no cover
     tomllib = None
 
 OPENAI_MODEL_DEFAULT = os.getenv("OPENAI_MATH_MODEL", "gpt-4o-mini")
+# Ask for all missing topics in one completion instead of one call per topic
+OPENAI_BATCH_GENERATION = os.getenv("OPENAI_BATCH_GENERATION", "1") != "0"
+# Serve a topic from the question bank instead of the LLM once it holds this many AI questions
+QUESTION_BANK_MIN_POOL = int(os.getenv("QUESTION_BANK_MIN_POOL", "50"))
 
 # Data directories
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
 CACHE_PATH = os.path.join(DATA_DIR, "ai_question_cache.json")
+# 0 keeps cached LLM output until it is evicted or invalidated
+QUESTION_CACHE_TTL_S = float(os.getenv("QUESTION_CACHE_TTL_S", str(30 * 24 * 3600))) or None
 LOG_PATH = os.path.join(DATA_DIR, "ai_logs.log")
 
 
 DEFAULT_TOPICS = ["Algebra", "Functions", "Integrals", "Derivatives", "Geometry"]
 
+_stream_stats = {
+    "completions": 0, "questions": 0, "invalid": 0, "malformed": 0,
+    "stopped_early": 0, "truncated": 0, "salvaged": 0, "first_question_ms": 0.0,
+}
+_first_question_n = 0
+
 
 def _make_id(length: int = 8) -> str:
     return "q_" + "".join(random.choices(string.ascii_lowercase + string.digits, k=length))
 
 
 def _log_ai(message: str) -> None:
-    try:
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(message + "\n")
-    except Exception:
-        pass
+    log_ai(message)
 
 
 def _load_openai_api_key() -> Optional[str]:
@@ -52,20 +68,112 @@ def _load_openai_api_key() -> Optional[str]:
     return None
 
 
-def _read_cache() -> Dict[str, Any]:
-    if not os.path.exists(CACHE_PATH):
-        return {}
+def _bank_store(questions: List[Dict[str, Any]], difficulty: str, source: str) -> None:
+    # Every validated question feeds the bank; a bank failure never blocks generation
+    try:
+        get_bank().add_questions(questions, difficulty=difficulty, source=source)
+    except Exception as e:
+        _log_ai(f"[question_bank][store_error] {type(e).__name__}: {e}")
+
+
+def _usable(questions: List[Dict[str, Any]], difficulty: Optional[str] = None) -> List[Dict[str, Any]]:
+    # Item statistics retire broken items and enforce calibrated difficulty
+    try:
+        return filter_usable(questions, difficulty)
+    except Exception as e:
+        _log_ai(f"[item_stats][filter_error] {type(e).__name__}: {e}")
+        return questions
+
+
+def _bank_pool(topic: str, difficulty: str, count: int) -> List[Dict[str, Any]]:
+    try:
+        bank = get_bank()
+        if bank.count(topic, difficulty, source="ai") < max(QUESTION_BANK_MIN_POOL, count):
+            return []
+        # Over-sample so retired or mis-calibrated items can be dropped
+        return _usable(bank.sample(topic, difficulty, 2 * count, source="ai"), difficulty)[:count]
+    except Exception as e:
+        _log_ai(f"[question_bank][pool_error] {type(e).__name__}: {e}")
+        return []
+
+
+def _bank_retrieve(
+    topics: List[str],
+    difficulty: str,
+    k: int,
+    subtopic: Optional[str] = None,
+    similar_to: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
     try:
-        with open(CACHE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        bank = get_bank()
+        if similar_to:
+            hits = bank.similar_to(similar_to, k=2 * k, difficulty=difficulty) or bank.similar_to(similar_to, k=2 * k)
+        else:
+            hits = bank.search(subtopic, topics=topics, difficulty=difficulty, k=2 * k) or bank.search(subtopic, topics=topics, k=2 * k)
+        return (_usable(hits, difficulty) or _usable(hits))[:k]
+    except Exception as e:
+        _log_ai(f"[question_bank][retrieve_error] {type(e).__name__}: {e}")
+        return []
+
+
+def weighted_topic_counts(topics: List[str], num_questions: int, weights: Dict[str, float]) -> Dict[str, int]:
+    # Largest-remainder apportionment of num_questions by topic weight
+    total = sum(max(0.0, weights.get(t, 0.0)) for t in topics) or 1.0
+    exact = {t: num_questions * max(0.0, weights.get(t, 0.0)) / total for t in topics}
+    counts = {t: int(v) for t, v in exact.items()}
+    leftover = num_questions - sum(counts.values())
+    for t in sorted(topics, key=lambda t: exact[t] - counts[t], reverse=True)[:leftover]:
+        counts[t] += 1
+    return {t: c for t, c in counts.items() if c > 0}
+
+
+_cache_store: Optional[CacheBackend] = None
+
+
+def _cache() -> CacheBackend:
+    # Shared across workers (and nodes with CACHE_BACKEND=redis); the legacy
+    # JSON file and the old question_cache table are imported once
+    global _cache_store
+    if _cache_store is None:
+        cache = get_cache("questions")
+        if cache.get("__imported__") is None:
+            legacy = SQLiteKeyValueStore(table="question_cache")
+            legacy.import_json_file(CACHE_PATH)
+            for key, value in legacy.items():
+                cache.set(key, value, QUESTION_CACHE_TTL_S)
+            cache.set("__imported__", True)
+        _cache_store = cache
+    return _cache_store
+
+
+def warm_up() -> None:
+    """Open the shared question cache and build the bank index before the first request needs them."""
+    _cache()
+    get_bank().warm()
+
+
+def _cache_get(key: str) -> Optional[List[Dict[str, Any]]]:
+    try:
+        items = _cache().get(key)
     except Exception:
-        return {}
+        return None
+    if items is None:
+        return None
+    # Entries written before compact rows are plain dicts
+    return [QuestionRecord.from_row(q).to_dict() if isinstance(q, list) else q for q in items]
+
+
+def _cache_set(key: str, items: List[Dict[str, Any]]) -> None:
+    try:
+        # Compact rows: no per-question keys or options dict, in the shared tier or the near cache
+        _cache().set(key, [QuestionRecord.from_dict(q).to_row() for q in items], QUESTION_CACHE_TTL_S)
+    except Exception:
+        pass
 
 
-def _write_cache(cache: Dict[str, Any]) -> None:
+def _cache_delete(key: str) -> None:
     try:
-        with open(CACHE_PATH, "w", encoding="utf-8") as f:
-            json.dump(cache, f, ensure_ascii=False)
+        _cache().delete(key)
     except Exception:
         pass
 
@@ -302,7 +410,126 @@ def _generate_question(topic: str) -> Dict[str, Any]:
     }
 
 
-def _openai_generate(topic: str, difficulty: str, num_questions: int) -> List[Dict[str, Any]]:
+def _stream_questions(
+    client: Any,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    priority: int,
+    take: Callable[[Dict[str, Any]], bool],
+) -> str:
+    """Stream a completion and pass each question object to ``take`` as soon as it closes.
+
+    ``take`` returns True once it has all it needs; the rest of the stream is
+    then dropped unread. Questions that arrived before a truncation or a
+    broken connection are kept; the call only raises if none did. Returns the
+    text received, for the log.
+    """
+    parser = ObjectArrayStream()
+    parts: List[str] = []
+    state = {"finish": None, "first": None, "error": None}
+
+    def settled(usage: Any) -> SimpleNamespace:
+        # The scheduler settles its token estimate from this as soon as consume returns.
+        # Without the final usage chunk (stopped early), charge for what was read.
+        if usage is None:
+            usage = SimpleNamespace(total_tokens=estimate_tokens(messages, 0) + len("".join(parts)) // 4)
+        return SimpleNamespace(usage=usage)
+
+    def offer(obj: Dict[str, Any]) -> bool:
+        # A bad element costs only itself; it must not end the stream as an error
+        try:
+            return take(obj)
+        except Exception as e:
+            _stream_stats["invalid"] += 1
+            _log_ai(f"[question_gen][invalid_element] {type(e).__name__}: {e}")
+            return False
+
+    def consume() -> SimpleNamespace:
+        start = time.perf_counter()
+        usage = None
+        stream = client.chat.completions.create(
+            model=OPENAI_MODEL_DEFAULT,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                state["finish"] = chunk.choices[0].finish_reason or state["finish"]
+                text = chunk.choices[0].delta.content or ""
+                parts.append(text)
+                for obj in parser.feed(text):
+                    if state["first"] is None:
+                        state["first"] = (time.perf_counter() - start) * 1000
+                    if offer(obj):
+                        state["finish"] = "enough"
+                        return settled(usage)
+        except Exception as e:
+            if not parser.emitted:
+                raise
+            state["error"] = e
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        return settled(usage)
+
+    get_scheduler().run(consume, priority=priority, est_tokens=estimate_tokens(messages, max_tokens))
+    global _first_question_n
+    _stream_stats["completions"] += 1
+    _stream_stats["malformed"] += parser.malformed
+    if state["first"] is not None:
+        _stream_stats["first_question_ms"] += state["first"]
+        _first_question_n += 1
+    if state["finish"] == "enough":
+        _stream_stats["stopped_early"] += 1
+    elif state["finish"] == "length" or state["error"] is not None or parser.in_element:
+        _stream_stats["truncated"] += 1
+        if parser.emitted:
+            _stream_stats["salvaged"] += 1
+    text = "".join(parts)
+    if state["error"] is not None:
+        _log_ai(f"[question_gen][stream_error] kept={parser.emitted} reason={type(state['error']).__name__}: {state['error']}")
+    return text
+
+
+def stream_stats() -> Dict[str, Any]:
+    # first_question_ms: mean time from request to the first usable question
+    n = _first_question_n
+    return {
+        **_stream_stats,
+        "first_question_ms": round(_stream_stats["first_question_ms"] / n, 1) if n else 0.0,
+    }
+
+
+# Shared by the single-topic and multi-topic prompts
+SYSTEM_PROMPT = (
+    "You are a math question generator. Produce multiple-choice questions with one correct answer."
+    " Output JSON only. Choices labeled A-D."
+)
+QUESTION_FORMAT = {
+    "id": "string",
+    "topic": "string",
+    "question": "string",
+    "options": {"A": "string", "B": "string", "C": "string", "D": "string"},
+    "answer": "A|B|C|D",
+}
+
+
+def _instructions(extra: str = "") -> str:
+    return (
+        "Return an array named 'questions' where each element matches the format. "
+        + extra
+        + "IDs must be unique. Questions must be solvable and unambiguous."
+    )
+
+
+def _openai_client():
     # Lazy import to avoid dependency when offline
     try:
         from openai import OpenAI
@@ -312,74 +539,196 @@ def _openai_generate(topic: str, difficulty: str, num_questions: int) -> List[Di
     api_key = _load_openai_api_key()
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY not configured")
+    return OpenAI(api_key=api_key)
 
-    client = OpenAI(api_key=api_key)
 
-    system = (
-        "You are a math question generator. Produce multiple-choice questions with one correct answer."
-        " Output JSON only. Choices labeled A-D."
-    )
+def _prompt_messages(user: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": json.dumps(user, ensure_ascii=False)},
+    ]
+
+
+def _openai_generate(
+    topic: str, difficulty: str, num_questions: int, priority: int = PRIORITY_INTERACTIVE
+) -> List[Dict[str, Any]]:
+    client = _openai_client()
+
     user = {
         "topic": topic,
         "difficulty": difficulty,
         "num_questions": num_questions,
-        "format": {
-            "id": "string",
-            "topic": "string",
-            "question": "string",
-            "options": {"A": "string", "B": "string", "C": "string", "D": "string"},
-            "answer": "A|B|C|D"
-        },
-        "instructions": (
-            "Return an array named 'questions' where each element matches the format. "
-            "IDs must be unique. Questions must be solvable and unambiguous."
-        ),
+        "format": QUESTION_FORMAT,
+        "instructions": _instructions(),
     }
 
-    prompt = {
-        "role": "user",
-        "content": json.dumps(user, ensure_ascii=False),
-    }
     _log_ai(f"[question_gen][request] topic={topic} diff={difficulty} n={num_questions} payload={user}")
 
-    resp = client.chat.completions.create(
-        model=OPENAI_MODEL_DEFAULT,
-        messages=[{"role": "system", "content": system}, prompt],
-        temperature=0.7,
-        max_tokens=1200,
-    )
-    text = resp.choices[0].message.content.strip()
-    _log_ai(f"[question_gen][response] {text}")
-
-    data = json.loads(text)
-    items = data.get("questions") or data
-    # sanitize outputs and ensure schema
+    messages = _prompt_messages(user)
     questions: List[Dict[str, Any]] = []
-    for q in items:
-        qid = q.get("id") or _make_id()
-        opts = q.get("options") or {}
-        ans = q.get("answer") or q.get("correct")
-        question = {
-            "id": qid,
-            "topic": q.get("topic") or topic,
-            "question": q.get("question"),
-            "options": {k: str(v) for k, v in list(opts.items())[:4]},
-            "answer": (ans if ans in {"A", "B", "C", "D"} else "A"),
-        }
-        questions.append(question)
+
+    def take(q: Dict[str, Any]) -> bool:
+        # sanitize outputs and ensure schema, one question at a time
+        if not _well_formed(q):
+            _stream_stats["invalid"] += 1
+            return False
+        question = _sanitize_question(q, topic)
+        if _is_valid_question(question):
+            questions.append(question)
+        else:
+            _stream_stats["invalid"] += 1
+        return len(questions) >= num_questions
+
+    text = _stream_questions(client, messages, 1200, priority, take)
+    _stream_stats["questions"] += len(questions)
+    _log_ai(f"[question_gen][response] kept={len(questions)}/{num_questions} {text}")
+    # May be short; the caller tops up only the shortfall
     return questions[:num_questions]
 
 
+def _well_formed(q: Dict[str, Any]) -> bool:
+    """Field types _sanitize_question relies on; model output is not held to the schema."""
+    scalar = (str, int, type(None))
+    return (
+        isinstance(q.get("options"), dict)
+        and isinstance(q.get("question"), str)
+        and all(isinstance(q.get(k), scalar) for k in ("id", "topic", "answer", "correct"))
+    )
+
+
+def _sanitize_question(q: Dict[str, Any], topic: str) -> Dict[str, Any]:
+    qid = q.get("id") or _make_id()
+    opts = q.get("options") or {}
+    ans = q.get("answer") or q.get("correct")
+    return {
+        "id": qid,
+        "topic": q.get("topic") or topic,
+        "question": q.get("question"),
+        "options": {k: str(v) for k, v in list(opts.items())[:4]},
+        "answer": (ans if ans in {"A", "B", "C", "D"} else "A"),
+    }
+
+
+def _is_valid_question(q: Dict[str, Any]) -> bool:
+    opts = q.get("options") or {}
+    return bool(q.get("question")) and set(opts.keys()) == {"A", "B", "C", "D"} and q.get("answer") in opts
+
+
+def _openai_generate_batch(
+    topic_counts: Dict[str, int], difficulty: str, priority: int = PRIORITY_INTERACTIVE
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Generate questions for several topics in a single completion.
+
+    Returns the validated questions grouped by topic. Topics the model skipped or
+    under-delivered are simply short in the result; the caller tops them up.
+    """
+    client = _openai_client()
+
+    total = sum(topic_counts.values())
+    user = {
+        "topics": topic_counts,
+        "difficulty": difficulty,
+        "num_questions": total,
+        "format": QUESTION_FORMAT,
+        "instructions": _instructions(
+            "For every topic in 'topics', produce exactly the given number of questions and set "
+            "'topic' to that topic name verbatim. "
+        ),
+    }
+
+    _log_ai(f"[question_gen][batch_request] topics={topic_counts} diff={difficulty} payload={user}")
+
+    messages = _prompt_messages(user)
+    # Same per-question budget as the single-topic call, one shared prompt.
+    max_tokens = min(4000, 200 + 120 * total)
+    grouped: Dict[str, List[Dict[str, Any]]] = {t: [] for t in topic_counts}
+    kept = [0]
+
+    def take(q: Dict[str, Any]) -> bool:
+        if not _well_formed(q) or q.get("topic") not in grouped:
+            _stream_stats["invalid"] += 1
+            return False
+        question = _sanitize_question(q, q["topic"])
+        if not _is_valid_question(question):
+            _stream_stats["invalid"] += 1
+            return False
+        bucket = grouped[question["topic"]]
+        if len(bucket) < topic_counts[question["topic"]]:
+            bucket.append(question)
+            kept[0] += 1
+        return kept[0] >= total
+
+    text = _stream_questions(client, messages, max_tokens, priority, take)
+    _stream_stats["questions"] += kept[0]
+    _log_ai(f"[question_gen][batch_response] kept={kept[0]}/{total} {text}")
+    return grouped
+
+
+def _replace_retired_templates(
+    questions: List[Dict[str, Any]], topics: List[str], weights: Optional[List[float]] = None
+) -> List[Dict[str, Any]]:
+    def draw() -> Dict[str, Any]:
+        return _generate_question(random.choices(topics, weights=weights)[0] if weights and any(weights) else random.choice(topics))
+
+    usable = _usable(questions)
+    seen = {question_fingerprint(q) for q in usable}
+    spare: List[Dict[str, Any]] = []  # usable draws whose stem is already in the exam
+    for _ in range(5):
+        short = len(questions) - len(usable)
+        if short <= 0:
+            break
+        # Over-drawn: part of every batch is retired or repeats a stem
+        for q in _usable([draw() for _ in range(2 * short)]):
+            fp = question_fingerprint(q)
+            if fp not in seen and len(usable) < len(questions):
+                seen.add(fp)
+                usable.append(q)
+            else:
+                spare.append(q)
+    # Still short (few template variants left unretired): repeat a usable stem,
+    # under its own id, rather than serve a retired one
+    while len(usable) < len(questions):
+        usable.append(spare.pop() if spare else draw())
+    return usable
+
+
 def generate_exam(
     topics: List[str] = None,
     num_questions: int = 10,
     mode: str = "deterministic",
     difficulty: str = "medium",
     avoid_repeat: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+    subtopic: Optional[str] = None,
+    similar_to: Optional[List[Dict[str, Any]]] = None,
+    topic_weights: Optional[Dict[str, float]] = None,
 ) -> Dict[str, Any]:
     topics = topics or DEFAULT_TOPICS
     mode = (mode or "deterministic").lower()
 
+    if subtopic or similar_to:
+        # Targeted exams come from the bank by nearest-neighbour retrieval; top up the rest normally
+        picked = _bank_retrieve(topics, difficulty, num_questions, subtopic=subtopic, similar_to=similar_to)
+        if picked:
+            if len(picked) < num_questions:
+                rest = generate_exam(
+                    topics=list({q.get("topic") for q in picked if q.get("topic")} or topics),
+                    num_questions=2 * (num_questions - len(picked)),
+                    mode=mode,
+                    difficulty=difficulty,
+                    avoid_repeat=avoid_repeat,
+                    priority=priority,
+                )
+                seen_fp = {question_fingerprint(q) for q in picked}
+                for q in rest["questions"]:
+                    fp = question_fingerprint(q)
+                    if fp not in seen_fp:
+                        seen_fp.add(fp)
+                        picked.append(q)
+                if len(picked) < num_questions:
+                    picked += rest["questions"]  # templates ran out of distinct variants
+            return {"questions": picked[:num_questions], "mode": "bank"}
+
     api_key_present = _load_openai_api_key() is not None
     use_ai = mode in {"ai", "ai_adaptive"} and api_key_present
 
@@ -387,36 +736,82 @@ def generate_exam(
     seen: set[str] = set()
 
     if use_ai:
-        cache = _read_cache()
-        topic_quota = max(1, num_questions // max(1, len(topics)))
-        remainder = num_questions - (topic_quota * len(topics))
-        # For balanced distribution, assign topic_quota to each topic,
-        # and distribute the remainder one by one.
-        topic_counts = {t: topic_quota for t in topics}
-        # Distribute the remainder randomly or round-robin
-        for t in random.sample(topics, k=remainder):
-            topic_counts[t] += 1
-
-        # Generate/fetch per-topic batch and compose final set
+        if topic_weights:
+            topic_counts = weighted_topic_counts(topics, num_questions, topic_weights)
+            topics = list(topic_counts)
+        else:
+            topic_quota = max(1, num_questions // max(1, len(topics)))
+            remainder = num_questions - (topic_quota * len(topics))
+            # For balanced distribution, assign topic_quota to each topic,
+            # and distribute the remainder one by one.
+            topic_counts = {t: topic_quota for t in topics}
+            # Distribute the remainder randomly or round-robin
+            for t in random.sample(topics, k=remainder):
+                topic_counts[t] += 1
+
+        # Serve what we can from cache, then fetch every missing topic in one call
+        topic_items: Dict[str, List[Dict[str, Any]]] = {}
+        missing: Dict[str, int] = {}
         for topic in topics:
             count = topic_counts[topic]
             key = f"{topic}::{difficulty}::{count}"
+            cached = _cache_get(key)
             # Remove stale/bad cache if it doesn't match requested count
-            if key in cache and len(cache[key]) < count:
-                del cache[key]
-                _write_cache(cache)
-            if key in cache and all(q.get("topic", topic) == topic for q in cache[key]):
-                items = cache[key]
+            if cached is not None and len(cached) < count:
+                _cache_delete(key)
+                cached = None
+            if cached is not None and all(q.get("topic", topic) == topic for q in cached):
+                # Retired items drop out here and the shortfall is regenerated below
+                topic_items[topic] = _usable(cached, difficulty)
+                continue
+            pooled = _bank_pool(topic, difficulty, count)
+            if len(pooled) >= count:
+                topic_items[topic] = pooled
             else:
+                missing[topic] = count
+
+        if len(missing) > 1 and OPENAI_BATCH_GENERATION:
+            try:
+                batch = _openai_generate_batch(missing, difficulty=difficulty, priority=priority)
+            except Exception as e:
+                _log_ai(f"[question_gen][batch_fallback] topics={list(missing)} reason={type(e).__name__}: {e}")
+                batch = {}
+            for topic, items in batch.items():
+                _bank_store(items, difficulty, "ai")
+                count = missing[topic]
+                if len(items) >= count:
+                    _cache_set(f"{topic}::{difficulty}::{count}", items)
+                    topic_items[topic] = items
+                elif items:
+                    # Partial delivery: keep it, top up only the shortfall below
+                    topic_items[topic] = items
+
+        # Generate/fetch per-topic batch and compose final set
+        for topic in topics:
+            count = topic_counts[topic]
+            key = f"{topic}::{difficulty}::{count}"
+            items = topic_items.get(topic, [])
+            if len(items) < count:
                 try:
-                    items = _openai_generate(topic=topic, difficulty=difficulty, num_questions=count)
-                    # Only cache if all topics are correct
-                    if all(q.get("topic", topic) == topic for q in items):
-                        cache[key] = items
-                        _write_cache(cache)
+                    fresh = _openai_generate(
+                        topic=topic, difficulty=difficulty, num_questions=count - len(items), priority=priority
+                    )
                 except Exception as e:
                     _log_ai(f"[question_gen][fallback] topic={topic} reason={type(e).__name__}: {e}")
-                    items = [_generate_question(topic) for _ in range(count)]
+                    fresh = []
+                if fresh:
+                    _bank_store(fresh, difficulty, "ai")
+                    items = items + fresh
+                    # Only cache a full set whose topics are all correct
+                    if len(items) >= count and all(q.get("topic", topic) == topic for q in items):
+                        _cache_set(key, items)
+                if len(items) < count:
+                    # Templates only for what the model did not deliver, minus retired ones
+                    fallback = _replace_retired_templates(
+                        [_generate_question(topic) for _ in range(count - len(items))], [topic]
+                    )
+                    _bank_store(fallback, difficulty, "template")
+                    items = items + fallback
             for item in items:
                 if len(questions) >= num_questions:
                     break
@@ -426,21 +821,24 @@ def generate_exam(
                 seen.add(key_sig)
                 questions.append(item)
         while len(questions) < num_questions:
-            q = _generate_question(random.choice(topics))
-            sig = q["question"] + "|" + q["id"]
-            if avoid_repeat and sig in seen:
-                continue
-            seen.add(sig)
-            questions.append(q)
+            extra = [_generate_question(random.choice(topics)) for _ in range(num_questions - len(questions))]
+            for q in _replace_retired_templates(extra, topics):
+                sig = q["question"] + "|" + q["id"]
+                if avoid_repeat and sig in seen:
+                    continue
+                seen.add(sig)
+                questions.append(q)
+                _bank_store([q], difficulty, "template")
         return {"questions": questions[:num_questions], "mode": "ai"}
 
     if mode in {"ai", "ai_adaptive"} and not api_key_present:
         _log_ai("[question_gen][fallback] No API key; using deterministic generator")
 
+    weights = [max(0.0, topic_weights.get(t, 0.0)) for t in topics] if topic_weights else None
     for _ in range(num_questions * 3):
         if len(questions) >= num_questions:
             break
-        topic = random.choice(topics)
+        topic = random.choices(topics, weights=weights)[0] if weights and any(weights) else random.choice(topics)
         q = _generate_question(topic)
         sig = q["question"] + "|" + q["id"]
         if avoid_repeat and sig in seen:
@@ -448,6 +846,8 @@ def generate_exam(
         seen.add(sig)
         questions.append(q)
 
+    _bank_store(questions, difficulty, "template")
+    questions = _replace_retired_templates(questions, topics, weights)
     return {"questions": questions[:num_questions], "mode": "deterministic"}
 
     # Deterministic mode or no API key available
@@ -0,0 +1,207 @@
+# Compact in-memory questions.
+#
+# As a dict, a question costs around a kilobyte: the outer dict, an options
+# dict with its own "A"-"D" keys, and separate copies of option texts such as
+# "e^x" or "180°" that thousands of questions share. QuestionRecord keeps topic
+# and option texts interned, the labels as one shared tuple per label set and
+# the answer as an index into it. QuestionTable is the bulk form used by the
+# question bank: fixed-width columns in arrays, ids and stems in one UTF-8
+# buffer, and option texts as codes into a process-wide string table.
+#
+# Both turn back into the usual dict shape (to_dict / table[i]) wherever a
+# question leaves for the API, a cache or the generator; fields outside the
+# usual shape are kept as they are so the round trip is exact.
+import sys
+import operator
+import threading
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+_CORE = ("id", "topic", "question", "options", "answer")
+_label_sets: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def _labels(keys: Iterable[str]) -> Tuple[str, ...]:
+    labels = tuple(keys)
+    shared = _label_sets.get(labels)
+    if shared is None:
+        shared = _label_sets.setdefault(labels, tuple(sys.intern(k) for k in labels))
+    return shared
+
+
+def _split(q: Dict[str, Any]) -> Optional[Tuple[str, str, str, Tuple[str, ...], List[str], int, Optional[Dict[str, Any]]]]:
+    """``(id, topic, question, labels, option texts, answer index, extra)``; ``None`` if ``q`` is irregular."""
+    qid, topic, stem, options, answer = (q.get(k) for k in _CORE)
+    if not (isinstance(qid, str) and isinstance(topic, str) and isinstance(stem, str) and isinstance(options, dict)):
+        return None
+    if not all(isinstance(k, str) and isinstance(v, str) for k, v in options.items()):
+        return None
+    labels = _labels(options)
+    if answer is None and "answer" not in q:
+        index = -1
+    elif isinstance(answer, str) and answer in options:
+        index = labels.index(answer)
+    else:
+        return None
+    extra = {k: v for k, v in q.items() if k not in _CORE} or None
+    return qid, topic, stem, labels, list(options.values()), index, extra
+
+
+def _join(qid: str, topic: str, stem: str, labels: Sequence[str], texts: Sequence[str], answer: int,
+          extra: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    q: Dict[str, Any] = {"id": qid, "topic": topic, "question": stem, "options": dict(zip(labels, texts))}
+    if answer >= 0:
+        q["answer"] = labels[answer]
+    if extra:
+        q.update(extra)
+    return q
+
+
+class QuestionRecord:
+    """One question with shared strings; ``raw`` holds the dict itself when it does not fit the usual shape."""
+
+    __slots__ = ("id", "topic", "question", "labels", "options", "answer", "extra", "raw")
+
+    def __init__(self, id, topic, question, labels, options, answer=-1, extra=None, raw=None):
+        self.id = id
+        self.topic = topic
+        self.question = question
+        self.labels = labels
+        self.options = options
+        self.answer = answer
+        self.extra = extra
+        self.raw = raw
+
+    @classmethod
+    def from_dict(cls, q: Dict[str, Any]) -> "QuestionRecord":
+        parts = _split(q)
+        if parts is None:
+            return cls(None, None, None, (), (), -1, None, dict(q))
+        qid, topic, stem, labels, texts, answer, extra = parts
+        return cls(qid, sys.intern(topic), stem, labels, tuple(sys.intern(t) for t in texts), answer, extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.raw is not None:
+            return dict(self.raw)
+        return _join(self.id, self.topic, self.question, self.labels, self.options, self.answer, self.extra)
+
+    # JSON-serializable list form, for caches that store values as JSON
+    def to_row(self) -> List[Any]:
+        if self.raw is not None:
+            return [self.raw]
+        return [self.id, self.topic, self.question, list(self.labels), list(self.options), self.answer, self.extra]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "QuestionRecord":
+        if len(row) == 1:
+            return cls(None, None, None, (), (), -1, None, row[0])
+        qid, topic, stem, labels, texts, answer, extra = row
+        return cls(qid, sys.intern(topic), stem, _labels(labels), tuple(sys.intern(t) for t in texts), answer, extra)
+
+
+class _CodeTable:
+    """Append-only value <-> code table shared by every QuestionTable in the process."""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self.codes: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+
+    def code(self, value: Any) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(value)
+                if code is None:
+                    code = self.codes[value] = len(self.values)
+                    self.values.append(value)
+        return code
+
+
+_strings = _CodeTable()  # topics and option texts
+_label_table = _CodeTable()  # label tuples
+
+
+class QuestionTable:
+    """Append-only, array-backed sequence of questions; ``table[i]`` is a fresh dict."""
+
+    def __init__(self, questions: Iterable[Dict[str, Any]] = ()):
+        self._text = bytearray()  # id then stem of every row, UTF-8
+        self._ends = array("I")  # two per row: end of id, end of stem
+        self._topics = array("I")
+        self._label_sets = array("I")
+        self._option_starts = array("I")
+        self._options = array("I")
+        self._answers = array("b")
+        self._extra: Dict[int, Dict[str, Any]] = {}  # rows with fields beyond the usual shape
+        self._raw: Dict[int, Dict[str, Any]] = {}  # rows that do not fit the columns at all
+        self.extend(questions)
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def append(self, q: Dict[str, Any]) -> None:
+        row = len(self)
+        parts = _split(q)
+        if parts is None:
+            self._raw[row] = dict(q)
+            qid, topic, stem, labels, texts, answer, extra = "", "", "", (), [], -1, None
+        else:
+            qid, topic, stem, labels, texts, answer, extra = parts
+        self._text += qid.encode("utf-8")
+        self._ends.append(len(self._text))
+        self._text += stem.encode("utf-8")
+        self._ends.append(len(self._text))
+        self._topics.append(_strings.code(topic))
+        self._label_sets.append(_label_table.code(labels))
+        self._option_starts.append(len(self._options))
+        self._options.extend(_strings.code(t) for t in texts)
+        self._answers.append(answer)
+        if extra:
+            self._extra[row] = extra
+
+    def extend(self, questions: Iterable[Dict[str, Any]]) -> None:
+        for q in questions:
+            self.append(q)
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        row = operator.index(row)
+        if row < 0:
+            row += len(self)
+        raw = self._raw.get(row)
+        if raw is not None:
+            return dict(raw)
+        start = self._ends[2 * row - 1] if row else 0
+        id_end, stem_end = self._ends[2 * row], self._ends[2 * row + 1]
+        labels = _label_table.values[self._label_sets[row]]
+        first = self._option_starts[row]
+        strings = _strings.values
+        return _join(
+            self._text[start:id_end].decode("utf-8"),
+            strings[self._topics[row]],
+            self._text[id_end:stem_end].decode("utf-8"),
+            labels,
+            [strings[c] for c in self._options[first:first + len(labels)]],
+            self._answers[row],
+            self._extra.get(row),
+        )
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(len(self)):
+            yield self[row]
+
+    @classmethod
+    def concat(cls, tables: Iterable["QuestionTable"]) -> "QuestionTable":
+        out = cls()
+        for t in tables:
+            rows, options, text = len(out), len(out._options), len(out._text)
+            out._text += t._text
+            out._ends.extend(e + text for e in t._ends)
+            out._topics.extend(t._topics)
+            out._label_sets.extend(t._label_sets)
+            out._option_starts.extend(s + options for s in t._option_starts)
+            out._options.extend(t._options)
+            out._answers.extend(t._answers)
+            out._extra.update((row + rows, v) for row, v in t._extra.items())
+            out._raw.update((row + rows, v) for row, v in t._raw.items())
+        return out
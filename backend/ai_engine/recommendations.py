@@ -0,0 +1,199 @@
+# Precomputed next-exam plans.
+#
+#   python -m ai_engine.recommendations          # users who submitted since the last run
+#   python -m ai_engine.recommendations --full   # re-cluster everyone
+#
+# A full run clusters per-user topic-accuracy vectors with k-means; each plan
+# blends the student's own weak topics with those of their cluster, so a thin
+# history borrows from similar students. Incremental runs reuse the stored
+# centroids and only rewrite plans for recently active users.
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .analytics_store import get_store
+from .question_generator import DEFAULT_TOPICS, weighted_topic_counts
+from .storage import DATA_DIR, thread_connection, transaction
+
+PLANS_PATH = os.path.join(DATA_DIR, "recommendations.db")
+
+PLAN_CLUSTERS = int(os.getenv("PLAN_CLUSTERS", "8"))
+PLAN_NUM_QUESTIONS = int(os.getenv("PLAN_NUM_QUESTIONS", "10"))
+# Share of the plan driven by the student's own accuracy vs. their cluster's
+PLAN_SELF_WEIGHT = float(os.getenv("PLAN_SELF_WEIGHT", "0.7"))
+MIN_TOPIC_WEIGHT = 0.05
+
+_lock = threading.Lock()
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS exam_plans ("
+        " user_id INTEGER PRIMARY KEY,"
+        " cluster INTEGER,"
+        " difficulty TEXT NOT NULL,"
+        " weights_json TEXT NOT NULL,"  # topic -> weight, accepted by generate_exam(topic_weights=...)
+        " quotas_json TEXT NOT NULL,"  # topic -> questions out of PLAN_NUM_QUESTIONS
+        " computed_at TEXT NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS plan_model ("
+        " id INTEGER PRIMARY KEY CHECK (id = 1),"
+        " topics_json TEXT NOT NULL,"
+        " topic_means_json TEXT NOT NULL,"
+        " centroids_json TEXT NOT NULL,"
+        " fitted_at REAL NOT NULL,"
+        " last_run REAL NOT NULL)"
+    )
+
+
+def _connect() -> sqlite3.Connection:
+    # get_plan runs on every adaptive generate: one connection per thread, schema once
+    return thread_connection(PLANS_PATH, _create_schema)
+
+
+def _load_model(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+    import numpy as np  # refresh jobs only; get_plan never loads it
+
+    row = conn.execute(
+        "SELECT topics_json, topic_means_json, centroids_json, fitted_at, last_run FROM plan_model WHERE id = 1"
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "topics": json.loads(row[0]),
+        "topic_means": np.asarray(json.loads(row[1])),
+        "centroids": np.asarray(json.loads(row[2])),
+        "fitted_at": row[3],
+        "last_run": row[4],
+    }
+
+
+def _vectors(stats: Dict[int, Dict[str, float]], topics: List[str], topic_means: "np.ndarray"):
+    import numpy as np
+
+    # Topics a student has not seen yet take the cohort mean for that topic
+    users = sorted(stats)
+    X = np.tile(topic_means, (len(users), 1))
+    seen = np.zeros_like(X, dtype=bool)
+    col = {t: j for j, t in enumerate(topics)}
+    for i, uid in enumerate(users):
+        for topic, acc in stats[uid].items():
+            j = col.get(topic)
+            if j is not None:
+                X[i, j] = acc
+                seen[i, j] = True
+    return users, X, seen
+
+
+def _difficulty(mean_accuracy: float) -> str:
+    if mean_accuracy >= 80:
+        return "hard"
+    if mean_accuracy >= 55:
+        return "medium"
+    return "easy"
+
+
+def _plan_rows(users: List[int], X: "np.ndarray", seen: "np.ndarray", labels: "np.ndarray",
+               centroids: "np.ndarray", topics: List[str]) -> List[tuple]:
+    import numpy as np
+
+    now = datetime.utcnow().isoformat()
+    blended = PLAN_SELF_WEIGHT * X + (1.0 - PLAN_SELF_WEIGHT) * centroids[labels]
+    weights = np.maximum(MIN_TOPIC_WEIGHT, 1.0 - blended / 100.0)
+    rows = []
+    for i, uid in enumerate(users):
+        w = {t: round(float(weights[i, j]), 4) for j, t in enumerate(topics)}
+        own = X[i][seen[i]]
+        rows.append((
+            uid,
+            int(labels[i]),
+            _difficulty(float(own.mean()) if len(own) else float(blended[i].mean())),
+            json.dumps(w),
+            json.dumps(weighted_topic_counts(topics, PLAN_NUM_QUESTIONS, w)),
+            now,
+        ))
+    return rows
+
+
+def refresh(full: bool = False) -> Dict[str, Any]:
+    """Recompute plans; a full run refits the clusters, otherwise only active users are updated."""
+    import numpy as np
+
+    started = time.time()
+    store = get_store()
+    with _lock:
+        conn = _connect()
+        model = _load_model(conn)
+        if full or model is None:
+            stats = store.user_topic_averages()
+            if not stats:
+                return {"mode": "full", "users": 0}
+            topics = sorted({t for s in stats.values() for t in s} | set(DEFAULT_TOPICS))
+            sums: Dict[str, List[float]] = {}
+            for s in stats.values():
+                for t, acc in s.items():
+                    sums.setdefault(t, []).append(acc)
+            topic_means = np.asarray([float(np.mean(sums[t])) if t in sums else 50.0 for t in topics])
+            users, X, seen = _vectors(stats, topics, topic_means)
+            from sklearn.cluster import KMeans
+
+            k = max(1, min(PLAN_CLUSTERS, len(users)))
+            km = KMeans(n_clusters=k, n_init=10, random_state=0).fit(X)
+            labels, centroids = km.labels_, km.cluster_centers_
+            fitted_at, mode = started, "full"
+        else:
+            topics, topic_means, centroids = model["topics"], model["topic_means"], model["centroids"]
+            active = store.active_users(model["last_run"])
+            stats = store.user_topic_averages(active) if active else {}
+            users, X, seen = _vectors(stats, topics, topic_means)
+            labels = (
+                ((X[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+                if len(users) else np.zeros(0, dtype=np.int64)
+            )
+            fitted_at, mode = model["fitted_at"], "incremental"
+        rows = _plan_rows(users, X, seen, labels, centroids, topics)
+        with transaction(conn):
+            if mode == "full":
+                conn.execute("DELETE FROM exam_plans")
+            conn.executemany(
+                "INSERT OR REPLACE INTO exam_plans (user_id, cluster, difficulty, weights_json, quotas_json,"
+                " computed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            # Next incremental run picks up anything submitted after this one started
+            conn.execute(
+                "INSERT OR REPLACE INTO plan_model (id, topics_json, topic_means_json, centroids_json, fitted_at,"
+                " last_run) VALUES (1, ?, ?, ?, ?, ?)",
+                (json.dumps(topics), json.dumps(topic_means.tolist()), json.dumps(np.asarray(centroids).tolist()),
+                 fitted_at, started),
+            )
+    return {"mode": mode, "users": len(rows), "clusters": int(len(centroids)), "seconds": round(time.time() - started, 3)}
+
+
+def get_plan(user_id: int) -> Optional[Dict[str, Any]]:
+    """The precomputed next-exam plan for ``user_id`` (primary-key lookup), if any."""
+    conn = _connect()
+    row = conn.execute(
+        "SELECT cluster, difficulty, weights_json, quotas_json, computed_at FROM exam_plans WHERE user_id = ?",
+        (user_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "cluster": row[0],
+        "difficulty": row[1],
+        "weights": json.loads(row[2]),
+        "quotas": json.loads(row[3]),
+        "computed_at": row[4],
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    print(json.dumps(refresh(full="--full" in sys.argv)))
@@ -1,6 +1,11 @@
 from typing import List, Dict, Any
 import os
 import json
+import hashlib
+
+from .cache_backend import get_cache
+from .llm_scheduler import get_scheduler, estimate_tokens, PRIORITY_FEEDBACK
+from .storage import DATA_DIR, log_ai
 
 try:
     import tomllib  # py311+
@@ -8,17 +13,13 @@ except Exception:  # pragma: no cover
     tomllib = None
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
 LOG_PATH = os.path.join(DATA_DIR, "ai_logs.log")
+# Identical accuracy profiles are common on short exams; reuse their coaching text
+FEEDBACK_CACHE_TTL_S = float(os.getenv("FEEDBACK_CACHE_TTL_S", str(24 * 3600)))
 
 
 def _log_ai(message: str) -> None:
-    try:
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(message + "\n")
-    except Exception:
-        pass
+    log_ai(message)
 
 
 def _load_openai_api_key() -> str | None:
@@ -53,6 +54,7 @@ def analyze_performance(questions: List[Dict[str, Any]], answers: Dict[str, str]
         correct_text = options_dict.get(correct_label, "")
         is_corr = student_ans == correct_label
         question_feedback.append({
+            "id": qid,
             "question": q.get("question"),
             "topic": topic,
             "selected_label": student_ans,
@@ -85,18 +87,34 @@ def analyze_performance(questions: List[Dict[str, Any]], answers: Dict[str, str]
                 "overall_accuracy": overall_accuracy,
                 "topic_accuracy": topic_accuracy,
             }
-            _log_ai(f"[feedback][request] {json.dumps(payload, ensure_ascii=False)}")
-            resp = client.chat.completions.create(
-                model=os.getenv("OPENAI_FEEDBACK_MODEL", os.getenv("OPENAI_MATH_MODEL", "gpt-4o-mini")),
-                messages=[
+            model = os.getenv("OPENAI_FEEDBACK_MODEL", os.getenv("OPENAI_MATH_MODEL", "gpt-4o-mini"))
+            cache_key = hashlib.sha1(
+                f"{model}|{json.dumps(payload, sort_keys=True)}".encode("utf-8")
+            ).hexdigest()
+            cache = get_cache("feedback")
+            overall_feedback = cache.get(cache_key)
+            if overall_feedback:
+                _log_ai(f"[feedback][cache_hit] {cache_key}")
+            else:
+                _log_ai(f"[feedback][request] {json.dumps(payload, ensure_ascii=False)}")
+                messages = [
                     {"role": "system", "content": system},
                     {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-                ],
-                temperature=0.7,
-                max_tokens=200,
-            )
-            overall_feedback = resp.choices[0].message.content.strip()
-            _log_ai(f"[feedback][response] {overall_feedback}")
+                ]
+                resp = get_scheduler().run(
+                    lambda: client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=200,
+                    ),
+                    priority=PRIORITY_FEEDBACK,
+                    est_tokens=estimate_tokens(messages, 200),
+                )
+                overall_feedback = resp.choices[0].message.content.strip()
+                _log_ai(f"[feedback][response] {overall_feedback}")
+                if overall_feedback:
+                    cache.set(cache_key, overall_feedback, FEEDBACK_CACHE_TTL_S)
         except Exception as e:
             overall_feedback = None
     if not overall_feedback:
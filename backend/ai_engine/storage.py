@@ -0,0 +1,314 @@
+# Shared-state primitives that stay correct with several worker processes:
+# per-key SQLite upserts instead of whole-file rewrites, flock-guarded appends,
+# and BEGIN IMMEDIATE transactions for read-modify-write updates.
+import os
+import json
+import zlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except Exception:  # pragma: no cover - Windows; single-worker only
+    fcntl = None
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+# Every database, log and report lives here; CODEXEDU_DATA_DIR moves them (tests, containers)
+DATA_DIR = os.path.abspath(os.getenv("CODEXEDU_DATA_DIR") or os.path.join(BASE_DIR, "data"))
+STATE_DB_PATH = os.path.join(DATA_DIR, "ai_state.db")
+LOG_PATH = os.path.join(DATA_DIR, "ai_logs.log")
+EXAMS_PATH = os.path.join(DATA_DIR, "exams.db")
+# Exams are spread over this many SQLite files by user_id; shard 0 is exams.db
+# and also holds the class-exam blueprints. Change it only with backend/reshard.py.
+EXAMS_SHARDS = max(1, int(os.getenv("EXAMS_SHARDS", "1")))
+
+SQLITE_BUSY_TIMEOUT_S = float(os.getenv("SQLITE_BUSY_TIMEOUT_S", "30"))
+# JSON columns at least this long are stored zlib-compressed
+COMPRESS_MIN_CHARS = int(os.getenv("COMPRESS_MIN_CHARS", "256"))
+_ZLIB_MARKER = b"z1:"
+
+_made_dirs: set = set()
+
+
+def ensure_parent_dir(path: str) -> None:
+    """Create the directory holding ``path`` on first use instead of at import."""
+    parent = os.path.dirname(os.path.abspath(path))
+    if parent not in _made_dirs:
+        os.makedirs(parent, exist_ok=True)
+        _made_dirs.add(parent)
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Autocommit connection in WAL mode; use :func:`transaction` for writes."""
+    ensure_parent_dir(path)
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_S, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    return conn
+
+
+_thread_conns = threading.local()
+_schemas_ready: set = set()
+_schema_lock = threading.Lock()
+
+
+def thread_connection(path: str, schema: Callable[[sqlite3.Connection], None]) -> sqlite3.Connection:
+    """This thread's long-lived connection to ``path``; ``schema`` runs once per process.
+
+    For per-request lookups, which would otherwise pay for a connect, the
+    PRAGMAs and the CREATE statements on every call. Never close it.
+    """
+    conns = getattr(_thread_conns, "by_path", None)
+    if conns is None:
+        conns = _thread_conns.by_path = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect_sqlite(path)
+    if path not in _schemas_ready:
+        with _schema_lock:
+            if path not in _schemas_ready:
+                schema(conn)
+                _schemas_ready.add(path)
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # IMMEDIATE takes the write lock up front, so reads inside the block cannot
+    # be invalidated by another process before our write lands.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def compress_text(value: Optional[str]) -> Any:
+    """Column value for ``value``: a marked zlib BLOB, or the text itself when short."""
+    if value is None or len(value) < COMPRESS_MIN_CHARS:
+        return value
+    return _ZLIB_MARKER + zlib.compress(value.encode("utf-8"), 6)
+
+
+def decompress_text(value: Any) -> Optional[str]:
+    # Rows written before compression was introduced are plain TEXT and pass through
+    if isinstance(value, (bytes, memoryview)):
+        data = bytes(value)
+        if data.startswith(_ZLIB_MARKER):
+            return zlib.decompress(data[len(_ZLIB_MARKER):]).decode("utf-8")
+        return data.decode("utf-8")
+    return value
+
+
+def shard_for_user(user_id: int, shards: int = EXAMS_SHARDS) -> int:
+    """Exams shard of ``user_id`` (jump consistent hash).
+
+    Growing from N to M shards moves only about (M - N) / M of the users, and
+    every user that moves goes to one of the new shards.
+    """
+    key = (int(user_id) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF  # spread sequential ids
+    b, j = -1, 0
+    while j < shards:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def exams_shard_path(shard: int, base: str = EXAMS_PATH) -> str:
+    # exams.db, exams-1.db, exams-2.db, ...
+    if shard == 0:
+        return base
+    root, ext = os.path.splitext(base)
+    return f"{root}-{shard}{ext}"
+
+
+def exams_shard_paths(shards: int = EXAMS_SHARDS, base: str = EXAMS_PATH) -> List[str]:
+    return [exams_shard_path(k, base) for k in range(shards)]
+
+
+class SQLiteKeyValueStore:
+    """JSON values in a single SQLite table; each write touches one row."""
+
+    def __init__(self, path: str = STATE_DB_PATH, table: str = "kv"):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.path)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at TEXT)"
+                " WITHOUT ROWID"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._db().execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        self._db().execute(
+            f"INSERT INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (key, json.dumps(value, ensure_ascii=False), datetime.utcnow().isoformat()),
+        )
+
+    def delete(self, key: str) -> None:
+        self._db().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key, value in self._db().execute(f"SELECT key, value FROM {self.table}").fetchall():
+            yield key, json.loads(value)
+
+    def is_empty(self) -> bool:
+        return self._db().execute(f"SELECT 1 FROM {self.table} LIMIT 1").fetchone() is None
+
+    def import_json_file(self, path: str) -> int:
+        """One-time import of a legacy JSON dict file; returns the number of keys imported."""
+        if not os.path.exists(path) or not self.is_empty():
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return 0
+        conn = self._db()
+        with transaction(conn):
+            for key, value in data.items():
+                conn.execute(
+                    f"INSERT OR IGNORE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), datetime.utcnow().isoformat()),
+                )
+        return len(data)
+
+
+class LockedAppendLog:
+    """Append-only text file shared by processes.
+
+    Each call writes its records with a single ``write`` under an exclusive
+    ``flock``, so lines from different workers never interleave. Readers take
+    a shared lock and therefore never observe a half-written record.
+    """
+
+    def __init__(self, path: str, header: Optional[str] = None):
+        self.path = path
+        self.header = header
+
+    def append(self, records: List[str]) -> None:
+        if not records:
+            return
+        data = "".join(r if r.endswith("\n") else r + "\n" for r in records)
+        ensure_parent_dir(self.path)
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                # Size is checked under the lock so concurrent first writers add one header
+                if self.header is not None and os.fstat(f.fileno()).st_size == 0:
+                    data = self.header + "\n" + data
+                f.write(data)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def reader(self) -> Iterator[Any]:
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+_ai_log = LockedAppendLog(LOG_PATH)
+
+
+def log_ai(message: str) -> None:
+    try:
+        _ai_log.append([message])
+    except Exception:
+        pass
+
+
+# ---------------- Multi-worker stress check ----------------
+
+def _stress_worker(args) -> None:
+    base, worker, rounds = args
+    kv = SQLiteKeyValueStore(os.path.join(base, "state.db"))
+    csv_log = LockedAppendLog(os.path.join(base, "dataset.csv"), header="user_id,topic,accuracy")
+    text_log = LockedAppendLog(os.path.join(base, "ai.log"))
+    counter = connect_sqlite(os.path.join(base, "counter.db"))
+    for i in range(rounds):
+        kv.set(f"w{worker}:{i}", {"worker": worker, "i": i, "pad": "x" * 200})
+        csv_log.append([f"{worker},Topic{i % 5},{i}.0", f"{worker},Topic{(i + 1) % 5},{i}.5"])
+        text_log.append([f"[stress] worker={worker} i={i} " + "y" * 300])
+        with transaction(counter):
+            (n,) = counter.execute("SELECT n FROM counter").fetchone()
+            counter.execute("UPDATE counter SET n = ?", (n + 1,))
+
+
+def stress(workers: int = 8, rounds: int = 200, base: Optional[str] = None) -> Dict[str, Any]:
+    """Run ``workers`` processes writing every store concurrently and verify nothing was lost.
+
+    Files go to ``base`` (a fresh temporary directory by default).
+    """
+    import tempfile
+    import multiprocessing
+
+    base = base or tempfile.mkdtemp(prefix="codexedu-stress-")
+    conn = connect_sqlite(os.path.join(base, "counter.db"))
+    conn.execute("CREATE TABLE counter (n INTEGER)")
+    conn.execute("INSERT INTO counter VALUES (0)")
+    SQLiteKeyValueStore(os.path.join(base, "state.db"))._db()
+    # Spawned, like real server workers: a forked child inherits this process's
+    # SQLite lock and shared-memory bookkeeping and can corrupt the WAL
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        pool.map(_stress_worker, [(base, w, rounds) for w in range(workers)])
+
+    kv = SQLiteKeyValueStore(os.path.join(base, "state.db"))
+    missing = sum(1 for w in range(workers) for i in range(rounds) if kv.get(f"w{w}:{i}") is None)
+    with open(os.path.join(base, "dataset.csv"), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    bad_csv = sum(1 for line in lines[1:] if len(line.split(",")) != 3)
+    with open(os.path.join(base, "ai.log"), encoding="utf-8") as f:
+        log_lines = f.read().splitlines()
+    bad_log = sum(1 for line in log_lines if not (line.startswith("[stress]") and line.endswith("y")))
+    counter = conn.execute("SELECT n FROM counter").fetchone()[0]
+    expected = workers * rounds
+    result = {
+        "workers": workers,
+        "kv_missing": missing,
+        "csv_header_ok": lines[0] == "user_id,topic,accuracy",
+        "csv_rows": len(lines) - 1,
+        "csv_expected": 2 * expected,
+        "csv_torn": bad_csv,
+        "log_lines": len(log_lines),
+        "log_torn": bad_log,
+        "counter": counter,
+        "counter_expected": expected,
+    }
+    result["ok"] = (
+        missing == 0 and result["csv_header_ok"] and bad_csv == 0 and bad_log == 0
+        and result["csv_rows"] == 2 * expected and len(log_lines) == expected and counter == expected
+    )
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    print(json.dumps(stress(workers=n), indent=2))
@@ -0,0 +1,126 @@
+# Move old submitted exams from the exams shards into exams_archive.db.
+#
+#   python archive.py --days 180 [--batch 500] [--vacuum]
+#   python archive.py --sweep [--hours 24]   # delete exams never submitted
+#
+# Each batch is copied into the archive first and deleted from the hot table
+# second. A crash in between leaves a row in both databases; the next run's
+# INSERT OR IGNORE makes the copy idempotent and then finishes the delete.
+# Archived rows keep their ids (unique across shards), so /exam/{id} finds
+# them in the archive. Each pass runs over every shard in turn.
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Set
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import ARCHIVE_DB_URL, EXAMS_SHARD_URLS, init_databases  # noqa: E402
+from exam_cache import bump_user_version  # noqa: E402
+from ai_engine.storage import compress_text, connect_sqlite, decompress_text, transaction  # noqa: E402
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+# Generated but never submitted exams are deleted after this long
+UNSUBMITTED_TTL_H = float(os.getenv("UNSUBMITTED_TTL_H", "24"))
+# How often the API runs the sweep in the background (0 = only via this CLI)
+SWEEP_INTERVAL_S = float(os.getenv("SWEEP_INTERVAL_S", "3600"))
+COLUMNS = [
+    "id", "user_id", "created_at", "questions_json", "answers_json", "score", "topic_stats_json",
+    "feedback_json", "blueprint_id", "variant_seed", "submitted",
+]
+HEAVY = {"questions_json", "feedback_json"}
+
+
+def archive_exams(days: int = ARCHIVE_AFTER_DAYS, batch: int = 500, vacuum: bool = False) -> Dict[str, int]:
+    init_databases()
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat(sep=" ")
+    cold = connect_sqlite(ARCHIVE_DB_URL.replace("sqlite:///", ""))
+    moved = remaining = 0
+    try:
+        for url in EXAMS_SHARD_URLS:
+            hot = connect_sqlite(url.replace("sqlite:///", ""))
+            try:
+                shard_moved = _archive_shard(hot, cold, cutoff, batch)
+                if vacuum and shard_moved:
+                    hot.execute("VACUUM")  # return freed pages so the hot file (and its cache footprint) shrinks
+                remaining += hot.execute("SELECT COUNT(*) FROM exams").fetchone()[0]
+            finally:
+                hot.close()
+            moved += shard_moved
+        archived = cold.execute("SELECT COUNT(*) FROM exams").fetchone()[0]
+    finally:
+        cold.close()
+    return {"moved": moved, "hot_exams": remaining, "archived_exams": archived}
+
+
+def move_rows(src: sqlite3.Connection, dst: sqlite3.Connection, rows: List[tuple]) -> None:
+    """Copy exam ``rows`` (in COLUMNS order) into ``dst``, then delete them from ``src``."""
+    heavy = [i for i, c in enumerate(COLUMNS) if c in HEAVY]
+    # Rows written before column compression are compressed on the way out
+    packed = [tuple(compress_text(decompress_text(v)) if i in heavy else v for i, v in enumerate(row)) for row in rows]
+    with transaction(dst):
+        dst.executemany(
+            f"INSERT OR IGNORE INTO exams ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", packed
+        )
+    ids = [row[0] for row in rows]
+    with transaction(src):
+        src.execute(f"DELETE FROM exams WHERE id IN ({', '.join('?' * len(ids))})", ids)
+
+
+def _archive_shard(hot: sqlite3.Connection, cold: sqlite3.Connection, cutoff: str, batch: int) -> int:
+    cols = ", ".join(COLUMNS)
+    moved = last_id = 0
+    while True:
+        rows = hot.execute(
+            f"SELECT {cols} FROM exams WHERE submitted = 1 AND created_at < ? AND id > ? ORDER BY id LIMIT ?",
+            (cutoff, last_id, batch),
+        ).fetchall()
+        if not rows:
+            return moved
+        last_id = rows[-1][0]
+        move_rows(hot, cold, rows)
+        moved += len(rows)
+
+
+def sweep_unsubmitted(hours: float = UNSUBMITTED_TTL_H, batch: int = 500) -> Dict[str, int]:
+    """Delete exams that were generated but not submitted within ``hours``."""
+    init_databases()
+    cutoff = (datetime.utcnow() - timedelta(hours=hours)).isoformat(sep=" ")
+    users: Set[int] = set()
+    deleted = 0
+    for url in EXAMS_SHARD_URLS:
+        hot = connect_sqlite(url.replace("sqlite:///", ""))
+        try:
+            while True:
+                # Served by ix_exams_submitted_created_at; each batch is its own short write
+                rows = hot.execute(
+                    "SELECT id, user_id FROM exams WHERE submitted = 0 AND created_at < ? LIMIT ?", (cutoff, batch)
+                ).fetchall()
+                if not rows:
+                    break
+                ids = [row[0] for row in rows]
+                with transaction(hot):
+                    hot.execute(f"DELETE FROM exams WHERE submitted = 0 AND id IN ({', '.join('?' * len(ids))})", ids)
+                users.update(row[1] for row in rows)
+                deleted += len(ids)
+        finally:
+            hot.close()
+    for user_id in users:
+        bump_user_version(user_id)  # their cached exam lists still show the deleted rows
+    return {"deleted": deleted, "users": len(users)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old submitted exams into the archive database")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true")
+    parser.add_argument("--sweep", action="store_true", help="delete unsubmitted exams instead of archiving")
+    parser.add_argument("--hours", type=float, default=UNSUBMITTED_TTL_H)
+    args = parser.parse_args()
+    if args.sweep:
+        print(sweep_unsubmitted(args.hours, args.batch))
+    else:
+        print(archive_exams(args.days, args.batch, args.vacuum))
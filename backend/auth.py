@@ -1,20 +1,37 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import os
+import time
 import jwt
-from passlib.hash import pbkdf2_sha256
 
 from database import UsersSession, User
+from passwords import hash_password_async, verify_password_async
+from ai_engine.cache_backend import MemoryCache, get_cache
 
 
 router = APIRouter()
+security = HTTPBearer()
 
 JWT_SECRET = os.getenv("JWT_SECRET", "dev_secret_change_me")
 JWT_ALG = "HS256"
 JWT_EXP_MINUTES = int(os.getenv("JWT_EXP_MINUTES", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_VERSION_TTL_S = float(os.getenv("AUTH_VERSION_TTL_S", "3600"))
+
+# Verified tokens, local to this process: token -> (user id, token version, exp).
+# Entries expire with the token, so a hit never outlives the signature check.
+_verified = MemoryCache(maxsize=AUTH_CACHE_SIZE)
+# Current token version per user (-1 once the user is gone), in the shared cache
+# so a logout in one worker reaches the others
+_versions = None
+_stats = {"hits": 0, "misses": 0, "rejected": 0}
 
 
 class RegisterRequest(BaseModel):
@@ -28,22 +45,19 @@ class LoginRequest(BaseModel):
     password: str
 
 
+class ChangePasswordRequest(BaseModel):
+    current_password: str
+    new_password: str
+
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
 
-def hash_password(password: str) -> str:
-    return pbkdf2_sha256.hash(password)
-
-
-def verify_password(password: str, password_hash: str) -> bool:
-    return pbkdf2_sha256.verify(password, password_hash)
-
-
-def create_access_token(sub: str) -> str:
+def create_access_token(sub: str, version: int = 0) -> str:
     exp = datetime.utcnow() + timedelta(minutes=JWT_EXP_MINUTES)
-    payload = {"sub": sub, "exp": exp}
+    payload = {"sub": sub, "exp": exp, "ver": version}
     token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
     return token
 
@@ -55,38 +69,176 @@ def decode_access_token(token: str) -> Optional[dict]:
         return None
 
 
-@router.post("/register", response_model=TokenResponse)
-def register(body: RegisterRequest):
+def verify_token(token: str) -> Optional[Tuple[int, int, float]]:
+    """``(user_id, token version, exp)`` of a valid token, checking the signature once per process."""
+    entry = _verified.get(token)
+    if entry is not None and entry[2] > time.time():
+        _stats["hits"] += 1
+        return entry
+    _stats["misses"] += 1
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    try:
+        # Tokens issued before versioning carry no "ver" and match version 0
+        entry = (int(payload["sub"]), int(payload.get("ver", 0)), float(payload["exp"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+    ttl = entry[2] - time.time()
+    if ttl <= 0:
+        return None
+    _verified.set(token, entry, ttl)
+    return entry
+
+
+def _version_store():
+    global _versions
+    if _versions is None:
+        _versions = get_cache("auth_versions")
+    return _versions
+
+
+def token_version(user_id: int) -> Optional[int]:
+    """Current token version of ``user_id``, or None if the user no longer exists."""
+    versions = _version_store()
+    version = versions.get(str(user_id))
+    if version is None:
+        session: Session = UsersSession()
+        try:
+            row = session.query(User.token_version).filter(User.id == user_id).first()
+        finally:
+            session.close()
+        version = -1 if row is None else int(row[0] or 0)
+        # Only fills a gap: a revoke that committed after our read has already
+        # published its newer version, which must not be overwritten by this one
+        if not versions.add(str(user_id), version, AUTH_VERSION_TTL_S):
+            version = versions.get(str(user_id))
+            if version is None:
+                return token_version(user_id)
+    return None if int(version) < 0 else int(version)
+
+
+def _bump_token_version(session: Session, user_id: int) -> int:
+    # Single UPDATE so concurrent bumps from several workers cannot collide
+    session.execute(
+        update(User).where(User.id == user_id).values(token_version=func.coalesce(User.token_version, 0) + 1)
+    )
+    return int(session.query(User.token_version).filter(User.id == user_id).scalar() or 0)
+
+
+def _publish_token_version(user_id: int, version: int) -> None:
+    _version_store().set(str(user_id), version, AUTH_VERSION_TTL_S)
+
+
+def revoke_tokens(user_id: int) -> int:
+    """Invalidate every token issued to ``user_id`` so far; returns the new version."""
     session: Session = UsersSession()
     try:
-        exists = session.query(User).filter(User.email == body.email).first()
-        if exists:
-            raise HTTPException(status_code=400, detail="Email already registered")
-        user = User(
-            name=body.name,
-            email=body.email,
-            password_hash=hash_password(body.password),
-            role="student",
-        )
-        session.add(user)
+        version = _bump_token_version(session, user_id)
         session.commit()
+    finally:
+        session.close()
+    _publish_token_version(user_id, version)
+    return version
+
+
+def authenticate(token: str) -> Optional[int]:
+    entry = verify_token(token)
+    if entry is None or token_version(entry[0]) != entry[1]:
+        _stats["rejected"] += 1
+        return None
+    return entry[0]
+
+
+def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
+    user_id = authenticate(credentials.credentials)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return user_id
+
+
+def auth_stats() -> Dict[str, int]:
+    return dict(_stats)
+
+
+# The routes are async so hashing waits on the password pool without holding
+# a threadpool thread; database work still runs in the threadpool.
+
+def _user_by(**filters) -> Optional[User]:
+    session: Session = UsersSession()
+    try:
+        return session.query(User).filter_by(**filters).first()
+    finally:
+        session.close()
+
+
+def _add_user(name: str, email: str, password_hash: str) -> User:
+    session: Session = UsersSession()
+    try:
+        user = User(name=name, email=email, password_hash=password_hash, role="student")
+        session.add(user)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another request registered the same email while we were hashing
+            raise HTTPException(status_code=400, detail="Email already registered")
         session.refresh(user)
-        token = create_access_token(str(user.id))
-        return TokenResponse(access_token=token)
+        return user
     finally:
         session.close()
 
 
-@router.post("/login", response_model=TokenResponse)
-def login(body: LoginRequest):
+def _set_password_hash(user_id: int, password_hash: str, revoke: bool = False) -> Optional[int]:
     session: Session = UsersSession()
     try:
-        user = session.query(User).filter(User.email == body.email).first()
-        if not user or not verify_password(body.password, user.password_hash):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-        token = create_access_token(str(user.id))
-        return TokenResponse(access_token=token)
+        session.execute(update(User).where(User.id == user_id).values(password_hash=password_hash))
+        version = _bump_token_version(session, user_id) if revoke else None
+        session.commit()
     finally:
         session.close()
+    if version is not None:
+        _publish_token_version(user_id, version)
+    return version
+
 
+@router.post("/register", response_model=TokenResponse)
+async def register(body: RegisterRequest):
+    if await run_in_threadpool(_user_by, email=body.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    password_hash = await hash_password_async(body.password)
+    user = await run_in_threadpool(_add_user, body.name, body.email, password_hash)
+    token = create_access_token(str(user.id), user.token_version or 0)
+    return TokenResponse(access_token=token)
 
+
+@router.post("/login", response_model=TokenResponse)
+async def login(body: LoginRequest):
+    user = await run_in_threadpool(_user_by, email=body.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    ok, new_hash = await verify_password_async(body.password, user.password_hash)
+    if not ok:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # PASSWORD_ROUNDS changed since this hash was made
+        await run_in_threadpool(_set_password_hash, user.id, new_hash)
+    token = create_access_token(str(user.id), user.token_version or 0)
+    return TokenResponse(access_token=token)
+
+
+@router.post("/logout")
+def logout(user_id: int = Depends(get_current_user_id)):
+    # Signs out every session of the user, not just the calling one
+    revoke_tokens(user_id)
+    return {"status": "ok"}
+
+
+@router.post("/password", response_model=TokenResponse)
+async def change_password(body: ChangePasswordRequest, user_id: int = Depends(get_current_user_id)):
+    user = await run_in_threadpool(_user_by, id=user_id)
+    if not user or not (await verify_password_async(body.current_password, user.password_hash))[0]:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    password_hash = await hash_password_async(body.new_password)
+    version = await run_in_threadpool(_set_password_hash, user_id, password_hash, True)
+    # Tokens issued with the old password stop working; the caller gets a fresh one
+    return TokenResponse(access_token=create_access_token(str(user_id), version))
@@ -0,0 +1,334 @@
+# Micro-benchmarks for hot API paths.
+#
+#   python bench.py responses [--questions 10] [--exams 50] [--repeat 2000]
+#   python bench.py auth [--repeat 20000]
+#   python bench.py login [--burst 200] [--threads 40] [--rounds 29000]
+#   python bench.py questions [--n 50000]
+#   python bench.py shards [--writers 8] [--ops 300] [--shards 1 2 4] [--synchronous NORMAL]
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import auth  # noqa: E402
+import passwords  # noqa: E402
+from database import Exam  # noqa: E402
+from exam_views import exam_detail_v1, exam_detail_v2, exam_list_v2, exam_summary_v1  # noqa: E402
+import serialization  # noqa: E402
+from ai_engine.question_generator import DEFAULT_TOPICS, _generate_question  # noqa: E402
+from ai_engine.question_record import QuestionRecord, QuestionTable  # noqa: E402
+from ai_engine.storage import compress_text, connect_sqlite, exams_shard_paths, shard_for_user, transaction  # noqa: E402
+
+
+def _timeit(fn: Callable[[], Any], repeat: int) -> float:
+    """Mean microseconds per call."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1e6 / repeat
+
+
+def _fake_exam(exam_id: int, n_questions: int, rng: random.Random) -> Exam:
+    topics = ["Algebra", "Functions", "Integrals", "Derivatives", "Geometry"]
+    questions, answers, feedback = [], {}, []
+    for i in range(n_questions):
+        options = {label: f"Option {label}: {rng.randint(1, 999)} * x^{rng.randint(1, 4)} + {rng.randint(1, 99)}" for label in "ABCD"}
+        q = {
+            "id": f"q_{exam_id}_{i}",
+            "topic": rng.choice(topics),
+            "question": f"Compute the derivative of f(x) = {rng.randint(2, 9)}x^{rng.randint(2, 5)} at x = {rng.randint(1, 9)}.",
+            "options": options,
+            "answer": rng.choice("ABCD"),
+            "difficulty": "medium",
+        }
+        questions.append(q)
+        answers[q["id"]] = rng.choice("ABCD")
+        feedback.append({
+            "id": q["id"],
+            "question": q["question"],
+            "topic": q["topic"],
+            "selected_label": answers[q["id"]],
+            "selected_text": options[answers[q["id"]]],
+            "correct_label": q["answer"],
+            "correct_text": options[q["answer"]],
+            "is_correct": answers[q["id"]] == q["answer"],
+        })
+    return Exam(
+        id=exam_id,
+        user_id=1,
+        created_at=datetime.utcnow(),
+        questions_json=json.dumps(questions),
+        answers_json=json.dumps(answers),
+        score=round(100.0 * sum(f["is_correct"] for f in feedback) / n_questions, 2),
+        topic_stats_json=json.dumps({t: 50.0 for t in {q["topic"] for q in questions}}),
+        feedback_json=json.dumps(feedback),
+        submitted=True,
+    )
+
+
+def _v1_encode(obj: Any) -> bytes:
+    # What FastAPI's JSONResponse does with a returned dict
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def bench_responses(n_questions: int, n_exams: int, repeat: int) -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    exams = [_fake_exam(i, n_questions, rng) for i in range(1, n_exams + 1)]
+    one = exams[0]
+    cases = {
+        "exam detail v1": lambda: _v1_encode(exam_detail_v1(one, json.loads(one.questions_json))),
+        "exam detail v2": lambda: exam_detail_v2(one),
+        f"exam list v1 ({n_exams})": lambda: _v1_encode([exam_summary_v1(r) for r in exams]),
+        f"exam list v2 ({n_exams})": lambda: exam_list_v2(exams),
+    }
+    rows = []
+    for name, fn in cases.items():
+        body = fn()
+        row = {
+            "case": name,
+            "bytes": len(body),
+            "gzip": len(serialization.compress(body, "gzip")),
+            "encode_us": round(_timeit(fn, repeat), 1),
+        }
+        if serialization.brotli is not None:
+            row["br"] = len(serialization.compress(body, "br"))
+        rows.append(row)
+    return rows
+
+
+def bench_auth(repeat: int) -> List[Dict[str, Any]]:
+    # A user id no real account has; its version is seeded so no users.db row is needed
+    user_id = 2 ** 31 - 1
+    auth._version_store().set(str(user_id), 0, 60)
+    token = auth.create_access_token(str(user_id))
+    cases = {
+        "pyjwt decode (before)": lambda: auth.decode_access_token(token),
+        "verified-token cache": lambda: auth.verify_token(token),
+        "get_current_user_id": lambda: auth.authenticate(token),
+    }
+    assert auth.authenticate(token) == user_id
+    return [{"case": name, "us_per_request": round(_timeit(fn, repeat), 2)} for name, fn in cases.items()]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def _cotenant_latencies(fn: Callable[[], Any], until: Callable[[], bool]) -> List[float]:
+    """Run ``fn`` every 2ms until ``until()``; microseconds per call."""
+    out = []
+    while not until():
+        start = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - start) * 1e6)
+        time.sleep(0.002)
+    return out
+
+
+def bench_login(burst: int, threads: int, rounds: int) -> List[Dict[str, Any]]:
+    """Login throughput, and the latency of an /exam/me-sized encode running beside the burst."""
+    rng = random.Random(0)
+    exams = [_fake_exam(i, 10, rng) for i in range(1, 51)]
+    cotenant = lambda: exam_list_v2(exams)  # noqa: E731
+    passwords.PASSWORD_ROUNDS = rounds
+    stored = passwords._hash("correct horse", rounds)
+
+    idle_until = time.perf_counter() + 1.0
+    idle = _cotenant_latencies(cotenant, lambda: time.perf_counter() > idle_until)
+    rows = [{"mode": "no burst", "logins_per_s": "", "p50_us": round(_percentile(idle, 0.5)), "p99_us": round(_percentile(idle, 0.99))}]
+    for mode, workers in (("request threadpool", 0), (f"process pool ({max(passwords.PASSWORD_WORKERS, 1)})", max(passwords.PASSWORD_WORKERS, 1))):
+        passwords.shutdown()
+        passwords.PASSWORD_WORKERS = workers
+        passwords.warm_up()
+        done = threading.Event()
+        elapsed = []
+
+        def run_burst() -> None:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as ex:
+                assert all(ok for ok, _ in ex.map(lambda _: passwords.verify_password("correct horse", stored), range(burst)))
+            elapsed.append(time.perf_counter() - start)
+            done.set()
+
+        t = threading.Thread(target=run_burst)
+        t.start()
+        lat = _cotenant_latencies(cotenant, done.is_set)
+        t.join()
+        rows.append({
+            "mode": mode,
+            "logins_per_s": round(burst / elapsed[0], 1),
+            "p50_us": round(_percentile(lat, 0.5)),
+            "p99_us": round(_percentile(lat, 0.99)),
+        })
+    passwords.shutdown()
+    return rows
+
+
+def _traced_bytes(build: Callable[[], Any]) -> int:
+    """Bytes still allocated by ``build()`` while its result is alive."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def bench_questions(n: int) -> List[Dict[str, Any]]:
+    """Memory per question held as dicts (as loaded from the bank), records and a table."""
+    random.seed(0)
+    rows = [json.dumps(_generate_question(random.choice(DEFAULT_TOPICS)), ensure_ascii=False) for _ in range(n)]
+    cases = {
+        "dicts": lambda: [json.loads(r) for r in rows],
+        "QuestionRecord": lambda: [QuestionRecord.from_dict(json.loads(r)) for r in rows],
+        "cached rows": lambda: json.loads(json.dumps([QuestionRecord.from_dict(json.loads(r)).to_row() for r in rows])),
+        "QuestionTable": lambda: QuestionTable(json.loads(r) for r in rows),
+    }
+    dicts = [json.loads(r) for r in rows]
+    table = QuestionTable(dicts)
+    fetch = {
+        "dicts": lambda: [dict(dicts[i]) for i in range(0, 10 * 97, 97)],
+        "QuestionTable": lambda: [table[i] for i in range(0, 10 * 97, 97)],
+    }
+    out = []
+    base = None
+    for name, build in cases.items():
+        per_item = _traced_bytes(build) / n
+        base = base or per_item
+        out.append({
+            "form": name,
+            "bytes_per_question": round(per_item, 1),
+            "questions_per_mb": int(2 ** 20 / per_item),
+            "vs_dicts": f"{base / per_item:.1f}x",
+            "fetch_10_us": round(_timeit(fetch[name], 2000), 1) if name in fetch else "",
+        })
+    return out
+
+
+def _submit_writer(args) -> List[float]:
+    """One API worker's submits: a short write transaction on the user's shard each; ms per commit."""
+    paths, users, ops, synchronous, seed = args
+    rng = random.Random(seed)
+    conns = []
+    for path in paths:
+        conn = connect_sqlite(path)
+        conn.execute(f"PRAGMA synchronous={synchronous};")
+        conns.append(conn)
+    feedback = compress_text(json.dumps([{"id": f"q{i}", "topic": "Algebra", "is_correct": i % 2 == 0} for i in range(10)] * 4))
+    lat = []
+    for _ in range(ops):
+        user_id, exam_id = rng.choice(users)
+        conn = conns[shard_for_user(user_id, len(paths))]
+        start = time.perf_counter()
+        with transaction(conn):
+            conn.execute(
+                "UPDATE exams SET answers_json = ?, score = ?, topic_stats_json = ?, feedback_json = ?, submitted = 1"
+                " WHERE id = ?",
+                (json.dumps({f"q{i}": "A" for i in range(10)}), rng.random() * 100, '{"Algebra": 0.5}', feedback, exam_id),
+            )
+        lat.append((time.perf_counter() - start) * 1000)
+    for conn in conns:
+        conn.close()
+    return lat
+
+
+def bench_shards(writers: int, ops: int, shard_counts: List[int], synchronous: str) -> List[Dict[str, Any]]:
+    """Concurrent submit commits per second against 1..N exams shards (throwaway files)."""
+    rows = []
+    n_users = 2000
+    for shards in shard_counts:
+        base = tempfile.mkdtemp(prefix="codexedu-shards-")
+        try:
+            paths = exams_shard_paths(shards, os.path.join(base, "exams.db"))
+            for path in paths:
+                # The real table, indexes included, since they are part of every write
+                engine = create_engine(f"sqlite:///{path}")
+                Exam.__table__.create(engine)
+                engine.dispose()
+            conns = [connect_sqlite(p) for p in paths]
+            users = []
+            for user_id in range(1, n_users + 1):
+                conn = conns[shard_for_user(user_id, shards)]
+                conn.execute(
+                    "INSERT INTO exams (id, user_id, created_at, questions_json, answers_json, submitted) VALUES (?, ?, ?, ?, '{}', 0)",
+                    (user_id, user_id, datetime.utcnow().isoformat(sep=" "), compress_text(json.dumps([{"q": "x" * 80}] * 10))),
+                )
+                users.append((user_id, user_id))
+            for conn in conns:
+                conn.close()
+            start = time.perf_counter()
+            with ProcessPoolExecutor(writers) as pool:
+                lat = [
+                    ms
+                    for part in pool.map(_submit_writer, [(paths, users, ops, synchronous, w) for w in range(writers)])
+                    for ms in part
+                ]
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(base, ignore_errors=True)
+        rows.append({
+            "shards": shards,
+            "writers": writers,
+            "commits_per_s": round(len(lat) / elapsed),
+            "p50_ms": round(_percentile(lat, 0.5), 2),
+            "p99_ms": round(_percentile(lat, 0.99), 2),
+        })
+    return rows
+
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r.get(c, "")).ljust(widths[c]) for c in cols))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CodexEDU micro-benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("responses", help="v1 vs v2 exam payload size and encode time")
+    p.add_argument("--questions", type=int, default=10)
+    p.add_argument("--exams", type=int, default=50)
+    p.add_argument("--repeat", type=int, default=2000)
+    p = sub.add_parser("auth", help="per-request cost of bearer token authentication")
+    p.add_argument("--repeat", type=int, default=20000)
+    p = sub.add_parser("login", help="login burst: hashing throughput and co-tenant request latency")
+    p.add_argument("--burst", type=int, default=200)
+    p.add_argument("--threads", type=int, default=40)
+    p.add_argument("--rounds", type=int, default=passwords.PASSWORD_ROUNDS)
+    p = sub.add_parser("questions", help="memory per pooled question: dicts vs compact records")
+    p.add_argument("--n", type=int, default=50000)
+    p = sub.add_parser("shards", help="concurrent submit throughput against 1..N exams shards")
+    p.add_argument("--writers", type=int, default=8, help="writer processes (API workers)")
+    p.add_argument("--ops", type=int, default=300, help="submits per writer")
+    p.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args()
+    if args.cmd == "shards":
+        _print_table(bench_shards(args.writers, args.ops, args.shards, args.synchronous))
+    elif args.cmd == "login":
+        _print_table(bench_login(args.burst, args.threads, args.rounds))
+    elif args.cmd == "questions":
+        _print_table(bench_questions(args.n))
+    elif args.cmd == "auth":
+        _print_table(bench_auth(args.repeat))
+    elif args.cmd == "responses":
+        print(f"json encoder: {'orjson' if serialization.orjson is not None else 'stdlib json'}")
+        _print_table(bench_responses(args.questions, args.exams, args.repeat))
@@ -1,21 +1,108 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import create_engine, event, Boolean, Column, Index, Integer, String, DateTime, Float, Text, ForeignKey
+from sqlalchemy.orm import declarative_base, deferred, sessionmaker
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, TypeVar
 import os
+import sqlite3
+import threading
 
-# Ensure data directory
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
+from ai_engine.storage import (
+    DATA_DIR,
+    EXAMS_SHARDS,
+    compress_text,
+    connect_sqlite,
+    decompress_text,
+    ensure_parent_dir,
+    exams_shard_path,
+    shard_for_user,
+    transaction,
+)
 
 USERS_DB_URL = f"sqlite:///{os.path.join(DATA_DIR, 'users.db')}"
-EXAMS_DB_URL = f"sqlite:///{os.path.join(DATA_DIR, 'exams.db')}"
+# Each shard hands out exam ids from its own range (shard << SHARD_ID_BITS), so
+# ids stay unique when rows move between shards or into the archive
+SHARD_ID_BITS = 40
 
-UsersEngine = create_engine(USERS_DB_URL, connect_args={"check_same_thread": False})
-ExamsEngine = create_engine(EXAMS_DB_URL, connect_args={"check_same_thread": False})
 
-UsersSession = sessionmaker(bind=UsersEngine, autoflush=False, autocommit=False)
-ExamsSession = sessionmaker(bind=ExamsEngine, autoflush=False, autocommit=False)
+def exams_db_url(shard: int) -> str:
+    return f"sqlite:///{exams_shard_path(shard, os.path.join(DATA_DIR, 'exams.db'))}"
+
+
+EXAMS_DB_URL = exams_db_url(0)
+EXAMS_SHARD_URLS = [exams_db_url(k) for k in range(EXAMS_SHARDS)]
+# Submitted exams past the archive cutoff (see archive.py)
+ARCHIVE_DB_URL = f"sqlite:///{os.path.join(DATA_DIR, 'exams_archive.db')}"
+
+
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    # WAL lets readers in other worker processes proceed while one writes
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL;")
+    cur.execute("PRAGMA synchronous=NORMAL;")
+    cur.close()
+
+
+_engines: Dict[str, object] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(url: str):
+    """Engine for ``url``, created (along with the data directory) on first use."""
+    engine = _engines.get(url)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(url)
+            if engine is None:
+                ensure_parent_dir(url.replace("sqlite:///", ""))
+                engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+                event.listen(engine, "connect", _sqlite_pragmas)
+                _engines[url] = engine
+    return engine
+
+
+class _LazySession:
+    """``sessionmaker`` stand-in that binds to its engine on the first ``Session()`` call.
+
+    The schema is brought up to date first, so scripts that skip the app's
+    startup hook still see migrated tables.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._factory = None
+
+    def __call__(self, **kwargs):
+        if self._factory is None:
+            init_databases()
+            self._factory = sessionmaker(bind=get_engine(self.url), autoflush=False, autocommit=False)
+        return self._factory(**kwargs)
+
+
+class _ShardedSessions:
+    """``ExamsSession(user_id)`` opens a session on that user's shard.
+
+    Without a user it opens shard 0, which holds the blueprints. Queries that
+    span users go through :func:`fan_out`.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.shards = [_LazySession(url) for url in urls]
+
+    def for_user(self, user_id: int) -> _LazySession:
+        return self.shards[shard_for_user(user_id, len(self.shards))]
+
+    def __call__(self, user_id: Optional[int] = None, **kwargs):
+        if user_id is None:
+            return self.shards[0](**kwargs)
+        return self.for_user(user_id)(**kwargs)
+
+
+UsersSession = _LazySession(USERS_DB_URL)
+ExamsSession = _ShardedSessions(EXAMS_SHARD_URLS)
+ArchiveSession = _LazySession(ARCHIVE_DB_URL)
 
 BaseUsers = declarative_base()
 BaseExams = declarative_base()
@@ -30,6 +117,20 @@ class User(BaseUsers):
     password_hash = Column(String(255), nullable=False)
     role = Column(String(50), default="student")
     created_at = Column(DateTime, default=datetime.utcnow)
+    token_version = Column(Integer, default=0)  # bumped on logout / password change; older tokens stop working
+
+
+class CompressedText(TypeDecorator):
+    """JSON text stored as a zlib BLOB once it is long enough; legacy plain TEXT still reads."""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
 
 
 class Exam(BaseExams):
@@ -38,23 +139,170 @@ class Exam(BaseExams):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    questions_json = Column(Text)  # List[Question]
+    # Heavy columns load only when accessed (or with undefer_group("heavy"))
+    questions_json = deferred(Column(CompressedText), group="heavy")  # List[Question]
     answers_json = Column(Text)  # Dict[question_id, selected_option]
     score = Column(Float, default=0.0)  # percentage 0-100
     topic_stats_json = Column(Text)  # Dict[topic, accuracy]
-    feedback_json = Column(Text, nullable=True)  # per-question feedback list
+    feedback_json = deferred(Column(CompressedText, nullable=True), group="heavy")  # per-question feedback list
+    blueprint_id = Column(Integer, nullable=True, index=True)  # set for class exams
+    variant_seed = Column(Integer, nullable=True)  # questions rebuilt from blueprint + seed
+    submitted = Column(Boolean, default=False)  # answers graded; the row no longer changes
 
+    # Archiving and the unsubmitted-exam sweeper both scan by (submitted, age)
+    __table_args__ = (Index("ix_exams_submitted_created_at", "submitted", "created_at"),)
 
-def init_databases() -> None:
-    BaseUsers.metadata.create_all(UsersEngine)
-    BaseExams.metadata.create_all(ExamsEngine)
-    # Safe migration for feedback_json
-    import sqlite3
+
+@event.listens_for(Exam, "before_insert")
+def _allocate_exam_id(mapper, connection, target) -> None:
+    # Next id from this file's counter, taken inside the inserting transaction
+    if target.id is None:
+        target.id = connection.exec_driver_sql(
+            "UPDATE exam_id_counter SET next_id = next_id + 1 RETURNING next_id - 1"
+        ).scalar_one()
+
+
+class ExamBlueprint(BaseExams):
+    __tablename__ = "exam_blueprints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, index=True)
+    title = Column(String(200), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    mode = Column(String(50), default="deterministic")
+    questions_json = Column(Text)  # canonical List[Question]
+
+
+# Schema changes made after a database's tables were first created. Each
+# database records how many steps it has applied in PRAGMA user_version
+# (version 1 = tables created), so a warm boot costs one pragma read. Steps
+# check before altering because databases created before versioning already
+# carry some of these columns.
+def _add_column(conn: sqlite3.Connection, table: str, column: str, ddl: str) -> bool:
+    if column in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+
+def _users_add_token_version(conn: sqlite3.Connection) -> None:
+    _add_column(conn, "users", "token_version", "INTEGER DEFAULT 0")
+
+
+USERS_MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _users_add_token_version,
+]
+
+
+def _exams_add_feedback(conn: sqlite3.Connection) -> None:
+    _add_column(conn, "exams", "feedback_json", "TEXT DEFAULT '[]'")
+
+
+def _exams_add_submitted(conn: sqlite3.Connection) -> None:
+    if _add_column(conn, "exams", "submitted", "BOOLEAN DEFAULT 0"):
+        # Older rows count as submitted once they carry answers
+        conn.execute("UPDATE exams SET submitted = 1 WHERE answers_json IS NOT NULL AND answers_json NOT IN ('', '{}')")
+
+
+def _exams_add_blueprint(conn: sqlite3.Connection) -> None:
+    _add_column(conn, "exams", "blueprint_id", "INTEGER")
+    _add_column(conn, "exams", "variant_seed", "INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_exams_blueprint_id ON exams (blueprint_id)")
+
+
+def _exams_add_submitted_index(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_exams_submitted_created_at ON exams (submitted, created_at)")
+
+
+def _exams_add_id_counter(conn: sqlite3.Connection, first_id: int = 1) -> None:
+    # Ids come from a counter rather than MAX(id) + 1, so archiving or moving the
+    # newest rows never lets an id be handed out twice
+    conn.execute("CREATE TABLE IF NOT EXISTS exam_id_counter (next_id INTEGER NOT NULL)")
+    if conn.execute("SELECT 1 FROM exam_id_counter").fetchone() is None:
+        (next_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM exams").fetchone()
+        conn.execute("INSERT INTO exam_id_counter (next_id) VALUES (?)", (max(next_id, first_id),))
+
+
+EXAMS_MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _exams_add_feedback,
+    _exams_add_submitted,
+    _exams_add_blueprint,
+    _exams_add_submitted_index,
+    _exams_add_id_counter,
+]
+
+
+def shard_migrations(shard: int) -> List[Callable[[sqlite3.Connection], None]]:
+    """EXAMS_MIGRATIONS with the id counter of ``shard`` starting in its own range."""
+    first_id = (shard << SHARD_ID_BITS) + 1
+    return [partial(step, first_id=first_id) if step is _exams_add_id_counter else step for step in EXAMS_MIGRATIONS]
+
+
+def _migrate(url: str, create: Callable[[], None], migrations: List[Callable[[sqlite3.Connection], None]]) -> None:
+    target = 1 + len(migrations)
+    conn = connect_sqlite(url.replace("sqlite:///", ""))
     try:
-        conn = sqlite3.connect(EXAMS_DB_URL.replace('sqlite:///', ''))
-        with conn:
-            conn.execute("ALTER TABLE exams ADD COLUMN feedback_json TEXT DEFAULT '[]';")
-    except Exception:
-        pass
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+            return
+        create()
+        with transaction(conn):
+            # Re-read under the write lock; another worker may have just migrated
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for step in migrations[max(version - 1, 0):]:
+                step(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+    finally:
+        conn.close()
+
+
+def init_exams_shard(shard: int) -> None:
+    # Shards past 0 only hold exams; blueprints stay in shard 0
+    url = exams_db_url(shard)
+    _migrate(url, partial(Exam.__table__.create, get_engine(url), checkfirst=True), shard_migrations(shard))
+
+
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def init_databases() -> None:
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        _migrate(USERS_DB_URL, lambda: BaseUsers.metadata.create_all(get_engine(USERS_DB_URL)), USERS_MIGRATIONS)
+        _migrate(EXAMS_DB_URL, lambda: BaseExams.metadata.create_all(get_engine(EXAMS_DB_URL)), EXAMS_MIGRATIONS)
+        for shard in range(1, len(EXAMS_SHARD_URLS)):
+            init_exams_shard(shard)
+        # The archive only holds exams, always in the current column layout
+        _migrate(ARCHIVE_DB_URL, lambda: Exam.__table__.create(get_engine(ARCHIVE_DB_URL), checkfirst=True), EXAMS_MIGRATIONS)
+        _initialized = True
+
+
+T = TypeVar("T")
+_fan_out_pool: Optional[ThreadPoolExecutor] = None
+
+
+def fan_out(fn: Callable[[Any], T]) -> List[T]:
+    """Run ``fn(session)`` on every exams shard at once; results in shard order.
+
+    For admin and analytics views that span users. Each call gets its own
+    session, closed afterwards.
+    """
 
+    def run(make_session: _LazySession) -> T:
+        session = make_session()
+        try:
+            return fn(session)
+        finally:
+            session.close()
 
+    if len(ExamsSession.shards) == 1:
+        return [run(ExamsSession.shards[0])]
+    global _fan_out_pool
+    with _engines_lock:
+        if _fan_out_pool is None:
+            _fan_out_pool = ThreadPoolExecutor(max_workers=len(ExamsSession.shards), thread_name_prefix="exams-shard")
+    return list(_fan_out_pool.map(run, ExamsSession.shards))
@@ -0,0 +1,147 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from ai_engine.cache_backend import get_cache
+from serialization import compress, dumps, negotiate_encoding
+
+# Total size of the cached bodies, counting each compressed form
+EXAM_CACHE_BYTES = int(os.getenv("EXAM_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+class _ResponseCache:
+    """LRU of encoded responses, bounded by the bytes they hold rather than their count.
+
+    Entries are ``(user version, digest, body, {encoding: compressed body})``.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(entry: tuple) -> int:
+        return len(entry[2]) + sum(len(v) for v in entry[3].values())
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: tuple) -> None:
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= self._size(old)
+            self._data[key] = entry
+            self.bytes += self._size(entry)
+            self._evict()
+
+    def add_encoding(self, key: str, entry: tuple, encoding: str, data: bytes) -> None:
+        with self._lock:
+            if encoding in entry[3]:
+                return
+            entry[3][encoding] = data
+            if self._data.get(key) is entry:
+                self.bytes += len(data)
+                self._evict()
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and self._data:
+            _, old = self._data.popitem(last=False)
+            self.bytes -= self._size(old)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Serialized responses, local to this process
+_responses = _ResponseCache(EXAM_CACHE_BYTES)
+# Per-user version counters live in the shared cache so every worker sees a bump.
+# They are read from the shared tier itself: a near-cache copy could lag a bump
+# made by another worker and keep serving (and 304-ing) the old body. The
+# backend is opened on first use rather than at import
+_versions = None
+_stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+
+def _version_store():
+    global _versions
+    if _versions is None:
+        _versions = get_cache("exam_versions", near=False)
+    return _versions
+
+
+def user_version(user_id: int) -> int:
+    versions = _version_store()
+    version = versions.get(str(user_id))
+    if version is None:
+        # Start from the clock, not 0: a counter lost and restarted low could match the
+        # version of an entry still in _responses and serve that stale body
+        version = int(time.time() * 1000)
+        versions.set(str(user_id), version)
+    return int(version)
+
+
+def bump_user_version(user_id: int) -> None:
+    """Invalidate every cached response of ``user_id`` (new exam, submit, ...)."""
+    versions = _version_store()
+    try:
+        versions.incr(str(user_id))
+    except Exception:
+        versions.delete(str(user_id))
+
+
+def _if_none_match(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (t.strip() for t in header.split(","))
+
+
+def cached_json(request: Request, key: Tuple[Any, ...], user_id: int, build: Callable[[], Any]) -> Response:
+    """Serve ``build()`` (an object, or pre-encoded JSON bytes) with a strong ETag.
+
+    The encoded body, and each compressed form of it, is reused until the
+    user's version moves.
+    """
+    version = user_version(user_id)
+    entry = _responses.get(repr(key))
+    if entry is not None and entry[0] == version:
+        _stats["hits"] += 1
+    else:
+        _stats["misses"] += 1
+        payload = build()
+        body = payload if isinstance(payload, bytes) else dumps(payload)
+        entry = (version, hashlib.sha1(body).hexdigest(), body, {})
+        _responses.set(repr(key), entry)
+    _, digest, body, compressed = entry
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), len(body))
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if encoding:
+        if encoding not in compressed:
+            _responses.add_encoding(repr(key), entry, encoding, compress(body, encoding))
+        body = compressed[encoding]
+        headers["Content-Encoding"] = encoding
+        # Strong ETags are per representation
+        headers["ETag"] = f'"{digest}-{encoding}"'
+    else:
+        headers["ETag"] = f'"{digest}"'
+    if _if_none_match(request, headers["ETag"]):
+        _stats["not_modified"] += 1
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def exam_cache_stats() -> dict:
+    return {**_stats, "entries": len(_responses), "bytes": _responses.bytes}
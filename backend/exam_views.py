@@ -0,0 +1,69 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from serialization import RawJSON, dumps, json_object, raw
+
+# v1 repeats question and option texts in every feedback item; v2 refers to
+# questions by id and splices stored JSON columns into the body unchanged.
+
+
+def _feedback(r) -> List[Dict[str, Any]]:
+    try:
+        if getattr(r, "feedback_json", None):
+            return json.loads(r.feedback_json)
+    except Exception:
+        pass
+    return []
+
+
+def exam_detail_v1(r, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "id": r.id,
+        "created_at": r.created_at.isoformat() + "Z",
+        "questions": questions,
+        "answers": json.loads(r.answers_json or "{}"),
+        "score": r.score,
+        "topic_accuracy": json.loads(r.topic_stats_json or "{}"),
+        "feedback": _feedback(r),
+    }
+
+
+def exam_summary_v1(r) -> Dict[str, Any]:
+    return {
+        "id": r.id,
+        "created_at": r.created_at.isoformat() + "Z",
+        "score": r.score,
+        "topic_accuracy": json.loads(r.topic_stats_json or "{}"),
+        "feedback": _feedback(r),
+    }
+
+
+def exam_detail_v2(r, questions: Optional[List[Dict[str, Any]]] = None) -> bytes:
+    """``questions`` is only passed for exams whose questions are not stored (class-exam variants)."""
+    questions_blob = raw(r.questions_json, "[]") if questions is None else RawJSON(dumps(questions))
+    # Graded feedback already carries question ids; the questions column is never parsed
+    feedback = [{"id": fb.get("id"), "is_correct": bool(fb.get("is_correct"))} for fb in _feedback(r)]
+    return json_object([
+        ("id", r.id),
+        ("created_at", r.created_at.isoformat() + "Z"),
+        ("submitted", bool(getattr(r, "submitted", False))),
+        ("score", r.score),
+        ("questions", questions_blob),
+        ("answers", raw(r.answers_json, "{}")),
+        ("topic_accuracy", raw(r.topic_stats_json, "{}")),
+        ("feedback", feedback),
+    ])
+
+
+def exam_summary_v2(r) -> bytes:
+    return json_object([
+        ("id", r.id),
+        ("created_at", r.created_at.isoformat() + "Z"),
+        ("submitted", bool(getattr(r, "submitted", False))),
+        ("score", r.score),
+        ("topic_accuracy", raw(r.topic_stats_json, "{}")),
+    ])
+
+
+def exam_list_v2(rows) -> bytes:
+    return b"[" + b",".join(exam_summary_v2(r) for r in rows) + b"]"
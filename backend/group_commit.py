@@ -0,0 +1,184 @@
+# Group commit for /exam/submit.
+#
+# Every submit used to pay for its own exams commit, with its analytics rows
+# sitting in a memory buffer until the next timed flush. Submits now hand
+# their graded exam update and analytics rows to this batcher and wait. A
+# batch closes GROUP_COMMIT_WINDOW_MS after its first item or at
+# GROUP_COMMIT_MAX_ITEMS items. It is written as one transaction per exams
+# shard, then one per analytics day partition. Each submit's future resolves
+# only once its own rows are committed. While a batch commits, the next one
+# fills, so batches grow with load instead of commits queueing on the write
+# lock.
+import os
+import time
+import asyncio
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, func, select
+
+from database import Exam, ExamsSession, get_engine
+from ai_engine.analytics_store import get_store as get_analytics_store
+from ai_engine.storage import log_ai
+
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "1") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_ITEMS = int(os.getenv("GROUP_COMMIT_MAX_ITEMS", "64"))
+# Recent batches kept for the latency percentiles in /metrics
+_SAMPLES = 1000
+
+_pending: List["_Item"] = []
+_flusher: Optional["asyncio.Task[None]"] = None
+_full: Optional[asyncio.Event] = None
+_stats = {"batches": 0, "items": 0, "max_batch": 0, "failed": 0}
+_batch_sizes: Deque[int] = deque(maxlen=_SAMPLES)
+_commit_ms: Deque[float] = deque(maxlen=_SAMPLES)
+_wait_ms: Deque[float] = deque(maxlen=_SAMPLES)
+
+
+class _Item:
+    __slots__ = ("user_id", "exam_id", "values", "topic_accuracy", "enqueued", "future")
+
+    def __init__(self, user_id: int, exam_id: int, values: Dict[str, Any], topic_accuracy: Dict[str, float]):
+        self.user_id = user_id
+        self.exam_id = exam_id
+        self.values = values
+        self.topic_accuracy = topic_accuracy
+        self.enqueued = time.perf_counter()
+        self.future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+
+
+def _write_exams(url: str, items: List[_Item]) -> None:
+    table = Exam.__table__
+    stmt = table.update().where(
+        table.c.id == bindparam("_id"),
+        table.c.user_id == bindparam("_user_id"),
+        # Only the first submit of an exam lands; a concurrent second one matches nothing
+        func.coalesce(table.c.submitted, False) == False,  # noqa: E712
+    )
+    # executemany needs the same columns in every parameter set
+    by_columns: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for item in items:
+        by_columns[tuple(sorted(item.values))].append({"_id": item.exam_id, "_user_id": item.user_id, **item.values})
+    with get_engine(url).begin() as conn:
+        updated = sum(conn.execute(stmt, params).rowcount for params in by_columns.values())
+        if updated != len(items):
+            # Raising here rolls the whole batch back; the caller narrows it down item by item
+            if len(items) == 1:
+                exists = conn.execute(
+                    select(table.c.id).where(table.c.id == items[0].exam_id, table.c.user_id == items[0].user_id)
+                ).first()
+                if exists is not None:
+                    raise HTTPException(status_code=409, detail="Exam already submitted")
+            # Swept or archived since the submit read it
+            raise HTTPException(status_code=404, detail="Exam not found for this user")
+
+
+def _commit(batch: List[_Item]) -> List[Optional[BaseException]]:
+    """Write ``batch``; the error for each item, ``None`` where it committed."""
+    errors: List[Optional[BaseException]] = [None] * len(batch)
+    by_shard: Dict[str, List[int]] = defaultdict(list)
+    for i, item in enumerate(batch):
+        by_shard[ExamsSession.for_user(item.user_id).url].append(i)
+    for url, indexes in by_shard.items():
+        try:
+            _write_exams(url, [batch[i] for i in indexes])
+        except Exception as e:
+            if len(indexes) == 1:
+                errors[indexes[0]] = e
+                continue
+            # One bad row must not fail the others: retry them one at a time
+            for i in indexes:
+                try:
+                    _write_exams(url, [batch[i]])
+                except Exception as item_error:
+                    errors[i] = item_error
+    committed = [(item.user_id, item.topic_accuracy, item.exam_id) for item, e in zip(batch, errors) if e is None]
+    try:
+        get_analytics_store().write(committed)
+    except Exception as e:
+        # The exams are graded and stored; the store keeps these rows for its next flush
+        log_ai(f"[group_commit][analytics_error] {type(e).__name__}: {e}")
+    return errors
+
+
+async def _flush_loop() -> None:
+    while _pending:
+        deadline = _pending[0].enqueued + GROUP_COMMIT_WINDOW_MS / 1000.0
+        while len(_pending) < GROUP_COMMIT_MAX_ITEMS:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            _full.clear()
+            try:
+                await asyncio.wait_for(_full.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        batch = _pending[:GROUP_COMMIT_MAX_ITEMS]
+        del _pending[:GROUP_COMMIT_MAX_ITEMS]
+        start = time.perf_counter()
+        try:
+            errors = await run_in_threadpool(_commit, batch)
+        except Exception as e:
+            errors = [e] * len(batch)
+        done = time.perf_counter()
+        _stats["batches"] += 1
+        _stats["items"] += len(batch)
+        _stats["max_batch"] = max(_stats["max_batch"], len(batch))
+        _batch_sizes.append(len(batch))
+        _commit_ms.append((done - start) * 1000)
+        for item, error in zip(batch, errors):
+            _wait_ms.append((done - item.enqueued) * 1000)
+            if item.future.done():
+                continue  # the request was cancelled; its rows are committed regardless
+            if error is None:
+                item.future.set_result(None)
+            else:
+                _stats["failed"] += 1
+                item.future.set_exception(error)
+        await asyncio.sleep(0)  # let resolved submits run before the next window
+
+
+async def write_submission(
+    user_id: int, exam_id: int, values: Dict[str, Any], topic_accuracy: Dict[str, float]
+) -> None:
+    """Store a graded submission: ``values`` are Exam columns, ``topic_accuracy`` the analytics rows.
+
+    Returns once both are committed, as part of a group commit with other
+    submits in this worker.
+    """
+    global _flusher, _full
+    item = _Item(user_id, exam_id, values, topic_accuracy)
+    if not GROUP_COMMIT:
+        errors = await run_in_threadpool(_commit, [item])
+        if errors[0] is not None:
+            raise errors[0]
+        return
+    _pending.append(item)
+    loop = asyncio.get_running_loop()
+    if _flusher is None or _flusher.done() or _flusher.get_loop() is not loop:
+        _full = asyncio.Event()
+        _flusher = asyncio.create_task(_flush_loop())
+    elif len(_pending) >= GROUP_COMMIT_MAX_ITEMS:
+        _full.set()
+    await asyncio.shield(item.future)
+
+
+def _percentile(values: Deque[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else 0.0
+
+
+def group_commit_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "pending": len(_pending),
+        "avg_batch": round(_stats["items"] / _stats["batches"], 2) if _stats["batches"] else 0.0,
+        "batch_p50": _percentile(_batch_sizes, 0.5),
+        "commit_ms_p50": _percentile(_commit_ms, 0.5),
+        "commit_ms_p99": _percentile(_commit_ms, 0.99),
+        "wait_ms_p50": _percentile(_wait_ms, 0.5),
+        "wait_ms_p99": _percentile(_wait_ms, 0.99),
+    }
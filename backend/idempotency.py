@@ -0,0 +1,94 @@
+# Replay of repeated POSTs (Streamlit reruns, double clicks).
+#
+# A request is identified by its Idempotency-Key header or, without one, by a
+# fingerprint of its body; either way it is scoped to the user. The first
+# response is kept in the shared cache for IDEMPOTENCY_WINDOW_S, and a repeat
+# inside the window gets that response back without running the handler again.
+# Duplicates that arrive while the first is still running wait for it rather
+# than starting their own (within one worker; across workers the cache entry
+# only exists once the first request finishes).
+import os
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ai_engine.cache_backend import get_cache
+
+IDEMPOTENCY_WINDOW_S = float(os.getenv("IDEMPOTENCY_WINDOW_S", "600"))
+
+_store = None
+_inflight: Dict[str, "_Pending"] = {}
+_stats = {"replayed": 0, "joined": 0, "executed": 0}
+
+
+class _Pending:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+def _cache():
+    global _store
+    if _store is None:
+        _store = get_cache("idempotency")
+    return _store
+
+
+def request_key(scope: str, user_id: int, header_key: Optional[str], body: Dict[str, Any]) -> Tuple[str, str]:
+    """``(cache key, body fingerprint)`` for a request to ``scope`` by ``user_id``."""
+    fingerprint = hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    if header_key:
+        return f"{scope}:{user_id}:key:{header_key[:128]}", fingerprint
+    return f"{scope}:{user_id}:body:{fingerprint}", fingerprint
+
+
+async def run_once(
+    key: str,
+    fingerprint: str,
+    produce: Callable[[], Awaitable[Dict[str, Any]]],
+    still_valid: Callable[[Dict[str, Any]], Awaitable[bool]],
+) -> Tuple[Dict[str, Any], bool]:
+    """Return ``(response, replayed)``; ``produce`` runs only if no valid earlier response exists.
+
+    ``still_valid`` lets the caller refuse a replay whose result has since been
+    used up (e.g. an exam that was submitted or swept).
+    """
+    entry = _cache().get(key)
+    if entry is not None:
+        if entry.get("fingerprint") != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if await still_valid(entry["response"]):
+            _stats["replayed"] += 1
+            return entry["response"], True
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        _stats["joined"] += 1
+        await pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result, True
+
+    pending = _inflight[key] = _Pending()
+    try:
+        response = await produce()
+        _cache().set(key, {"fingerprint": fingerprint, "response": response}, IDEMPOTENCY_WINDOW_S)
+        pending.result = response
+        _stats["executed"] += 1
+        return response, False
+    except BaseException as e:
+        pending.error = e
+        raise
+    finally:
+        pending.done.set()
+        _inflight.pop(key, None)
+
+
+def idempotency_stats() -> Dict[str, int]:
+    return {**_stats, "in_flight": len(_inflight)}
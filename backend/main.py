@@ -1,17 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
 import json
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
-
-from auth import router as auth_router, decode_access_token
-from database import ExamsSession, Exam, init_databases
-from ai_engine.question_generator import generate_exam
+from functools import lru_cache
+from sqlalchemy.orm import undefer, undefer_group
+
+from admission import AdmissionMiddleware, admission_stats
+from archive import SWEEP_INTERVAL_S, sweep_unsubmitted
+from auth import router as auth_router, auth_stats, get_current_user_id
+from database import ArchiveSession, ExamsSession, Exam, ExamBlueprint, fan_out, init_databases
+from exam_cache import cached_json, bump_user_version, exam_cache_stats
+from exam_views import exam_detail_v1, exam_detail_v2, exam_list_v2, exam_summary_v1
+from group_commit import group_commit_stats, write_submission
+from idempotency import idempotency_stats, request_key, run_once
+from passwords import shutdown as shutdown_password_pool
+from prefetch import prefetch_stats, remember as remember_generate, speculate, take as take_prefetched
+from startup import WARMUP, startup_timings, timed, warm_up
+from ai_engine.question_generator import generate_exam, stream_stats
+from ai_engine.blueprint import variant_seed, build_variant
+from ai_engine.llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_REFILL, get_scheduler
+from ai_engine.cache_backend import cache_stats
 from ai_engine.report_analyzer import analyze_performance
-from ai_engine.dataset_builder import append_result_to_dataset
+from ai_engine.analytics_store import get_store as get_analytics_store
+from ai_engine.cohort_report import load_report as load_cohort_report
+from ai_engine.mastery import update_mastery, topic_weights
+from ai_engine.recommendations import get_plan
+from ai_engine.item_stats import record_responses, lookup as lookup_item_stats, item_difficulty_b
+from ai_engine.question_bank import question_fingerprint
 
 
 class GenerateExamRequest(BaseModel):
@@ -19,6 +40,17 @@ class GenerateExamRequest(BaseModel):
     mode: Optional[str] = "ai"  # deterministic | ai | ai_adaptive (AI default if available)
     difficulty: Optional[str] = "medium"    # easy | medium | hard
     num_questions: Optional[int] = 10
+    blueprint_id: Optional[int] = None  # take a class exam instead of generating one
+    subtopic: Optional[str] = None  # e.g. "chain rule"; served from the question bank
+    similar_to_exam_id: Optional[int] = None  # practice questions similar to ones missed in that exam
+
+
+class CreateBlueprintRequest(BaseModel):
+    title: Optional[str] = None
+    topics: Optional[List[str]] = None
+    mode: Optional[str] = "ai"
+    difficulty: Optional[str] = "medium"
+    num_questions: Optional[int] = 10
 
 
 class SubmitExamRequest(BaseModel):
@@ -27,21 +59,37 @@ class SubmitExamRequest(BaseModel):
     answers: Dict[str, str]  # question_id -> selected_option (e.g., "A")
 
 
-security = HTTPBearer()
-
-
-def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
-    token = credentials.credentials
-    payload = decode_access_token(token)
-    if payload is None:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    return int(payload.get("sub"))
+async def _sweep_periodically() -> None:
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_S)
+        try:
+            await run_in_threadpool(sweep_unsubmitted)
+        except Exception:
+            pass  # retried next interval
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Only the schema check blocks startup; cache warm-up runs while requests are served
+    with timed("init_databases"):
+        await run_in_threadpool(init_databases)
+    tasks = []
+    if WARMUP:
+        tasks.append(asyncio.create_task(run_in_threadpool(warm_up)))
+    if SWEEP_INTERVAL_S > 0:
+        tasks.append(asyncio.create_task(_sweep_periodically()))
+    yield
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+    shutdown_password_pool()
 
 
 def create_app() -> FastAPI:
-    init_databases()
-    app = FastAPI(title="CodexEDU API", version="0.1.0")
+    app = FastAPI(title="CodexEDU API", version="0.1.0", lifespan=lifespan)
 
+    # Added first so CORS wraps it and 429/503 responses still carry CORS headers
+    app.add_middleware(AdmissionMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -56,56 +104,193 @@ def create_app() -> FastAPI:
     async def health() -> Dict[str, str]:
         return {"status": "ok"}
 
+    @app.get("/metrics")
+    async def metrics() -> Dict[str, Any]:
+        return {
+            "llm_scheduler": get_scheduler().stats(),
+            "llm_stream": stream_stats(),
+            "cache": cache_stats(),
+            "exam_cache": exam_cache_stats(),
+            "auth": auth_stats(),
+            "admission": admission_stats(),
+            "idempotency": idempotency_stats(),
+            "prefetch": prefetch_stats(),
+            "group_commit": group_commit_stats(),
+            "startup": startup_timings(),
+        }
+
     def _compute_weak_topics(user_id: int, default_topics: List[str]) -> List[str]:
-        # Read ai_dataset.csv and compute average accuracy per topic for this user
-        import csv
-        import os
-        data_path = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)), "data", "ai_dataset.csv")
-        if not os.path.exists(data_path):
-            return default_topics
-        topic_scores: Dict[str, List[float]] = {}
+        # Average accuracy per topic for this user, aggregated inside the analytics store
         try:
-            with open(data_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if str(row.get("user_id")) != str(user_id):
-                        continue
-                    topic = row.get("topic")
-                    try:
-                        acc = float(row.get("accuracy", 0))
-                    except Exception:
-                        acc = 0.0
-                    topic_scores.setdefault(topic, []).append(acc)
+            topic_scores = get_analytics_store().topic_averages(user_id=user_id)
         except Exception:
             return default_topics
 
         if not topic_scores:
             return default_topics
         # Average accuracy, sort ascending to prioritize weak topics
-        avg = sorted(((t, sum(v)/len(v)) for t, v in topic_scores.items()), key=lambda x: x[1])
+        avg = sorted(topic_scores.items(), key=lambda x: x[1])
         # Take bottom half or at least 2 topics
         k = max(2, len(avg)//2)
         return [t for t, _ in avg[:k]]
 
-    @app.post("/exam/generate")
-    async def generate_exam_endpoint(body: GenerateExamRequest, user_id: int = Depends(get_current_user_id)):
-        topics = body.topics or ["Algebra", "Functions", "Integrals", "Derivatives", "Geometry"]
-        mode = (body.mode or "deterministic").lower()
-        difficulty = (body.difficulty or "medium").lower()
-        num_q = int(body.num_questions or 10)
-
-        if mode == "ai_adaptive":
-            topics = _compute_weak_topics(user_id=user_id, default_topics=topics)
+    @lru_cache(maxsize=64)
+    def _blueprint_questions(blueprint_id: int) -> tuple:
+        # Blueprints are immutable once created, so the parsed set can be shared
+        session = ExamsSession()
+        try:
+            bp = session.query(ExamBlueprint).filter(ExamBlueprint.id == blueprint_id).first()
+            if not bp:
+                raise HTTPException(status_code=404, detail="Blueprint not found")
+            return bp.mode, tuple(json.loads(bp.questions_json or "[]"))
+        finally:
+            session.close()
 
-        exam = generate_exam(
-            topics=topics,
-            num_questions=num_q,
-            mode=mode,
-            difficulty=difficulty,
+    def _exam_questions(r: Exam) -> List[Dict[str, Any]]:
+        if r.blueprint_id is not None and not r.questions_json:
+            _, questions = _blueprint_questions(r.blueprint_id)
+            return build_variant(list(questions), r.variant_seed)
+        return json.loads(r.questions_json or "[]")
+
+    @app.post("/exam/blueprint")
+    async def create_blueprint_endpoint(body: CreateBlueprintRequest, user_id: int = Depends(get_current_user_id)):
+        exam = await run_in_threadpool(
+            generate_exam,
+            topics=body.topics or ["Algebra", "Functions", "Integrals", "Derivatives", "Geometry"],
+            num_questions=int(body.num_questions or 10),
+            mode=(body.mode or "deterministic").lower(),
+            difficulty=(body.difficulty or "medium").lower(),
             avoid_repeat=True,
         )
+        session = ExamsSession()
+        try:
+            bp = ExamBlueprint(
+                owner_id=user_id,
+                title=body.title,
+                created_at=datetime.utcnow(),
+                mode=exam["mode"],
+                questions_json=json.dumps(exam["questions"]),
+            )
+            session.add(bp)
+            session.commit()
+            session.refresh(bp)
+            blueprint_id = bp.id
+        finally:
+            session.close()
+        return {"blueprint_id": blueprint_id, **exam}
 
+    def _blueprint_results(blueprint_id: int, user_id: int) -> List[Dict[str, Any]]:
         session = ExamsSession()
+        try:
+            owner = session.query(ExamBlueprint.owner_id).filter(ExamBlueprint.id == blueprint_id).scalar()
+        finally:
+            session.close()
+        if owner is None:
+            raise HTTPException(status_code=404, detail="Blueprint not found")
+        if owner != user_id:
+            raise HTTPException(status_code=403, detail="Only the blueprint owner can see its results")
+
+        def query(session) -> List[Any]:
+            return (
+                session.query(Exam.id, Exam.user_id, Exam.created_at, Exam.score, Exam.submitted)
+                .filter(Exam.blueprint_id == blueprint_id)
+                .all()
+            )
+
+        # Students are spread over every shard; older attempts may be archived
+        rows = [row for shard in fan_out(query) for row in shard]
+        session = ArchiveSession()
+        try:
+            rows += query(session)
+        finally:
+            session.close()
+        rows.sort(key=lambda r: (r.user_id, r.created_at))
+        return [
+            {
+                "exam_id": r.id,
+                "user_id": r.user_id,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+                "score": r.score,
+                "submitted": bool(r.submitted),
+            }
+            for r in rows
+        ]
+
+    @app.get("/exam/blueprint/{blueprint_id}/results")
+    async def blueprint_results_endpoint(blueprint_id: int, user_id: int = Depends(get_current_user_id)):
+        return {"blueprint_id": blueprint_id, "results": await run_in_threadpool(_blueprint_results, blueprint_id, user_id)}
+
+    async def _start_blueprint_exam(blueprint_id: int, user_id: int) -> Dict[str, Any]:
+        mode, questions = _blueprint_questions(blueprint_id)
+        seed = variant_seed(blueprint_id, user_id)
+        session = ExamsSession(user_id)
+        try:
+            # Only the blueprint reference and the seed are stored per student
+            exam_row = Exam(
+                user_id=user_id,
+                created_at=datetime.utcnow(),
+                questions_json=None,
+                answers_json=json.dumps({}),
+                score=0.0,
+                topic_stats_json=json.dumps({}),
+                blueprint_id=blueprint_id,
+                variant_seed=seed,
+            )
+            session.add(exam_row)
+            session.commit()
+            session.refresh(exam_row)
+            exam_id = exam_row.id
+        finally:
+            session.close()
+        bump_user_version(user_id)
+        return {
+            "exam_id": exam_id,
+            "blueprint_id": blueprint_id,
+            "questions": build_variant(list(questions), seed),
+            "mode": mode,
+        }
+
+    def _exam_open(user_id: int, exam_id: int) -> bool:
+        session = ExamsSession(user_id)
+        try:
+            row = session.query(Exam.submitted).filter(Exam.id == exam_id, Exam.user_id == user_id).first()
+        finally:
+            session.close()
+        return row is not None and not row[0]
+
+    @app.post("/exam/generate")
+    async def generate_exam_endpoint(
+        body: GenerateExamRequest,
+        response: Response,
+        user_id: int = Depends(get_current_user_id),
+        idempotency_key: Optional[str] = Header(None),
+    ):
+        # A repeat (rerun, double click) gets the same exam back while it is still unsubmitted
+        key, fingerprint = request_key("generate", user_id, idempotency_key, body.model_dump())
+        result, replayed = await run_once(
+            key,
+            fingerprint,
+            lambda: _generate(body, user_id),
+            lambda r: run_in_threadpool(_exam_open, user_id, r["exam_id"]),
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+    async def _generate(body: GenerateExamRequest, user_id: int) -> Dict[str, Any]:
+        if body.blueprint_id is not None:
+            return await _start_blueprint_exam(body.blueprint_id, user_id)
+
+        exam = None
+        if body.subtopic is None and body.similar_to_exam_id is None:
+            # Plain requests are the ones a speculative build can reproduce after the next submit
+            params = body.model_dump(exclude_unset=True)
+            remember_generate(user_id, params)
+            exam = take_prefetched(user_id, params)
+        if exam is None:
+            exam = await _build_exam(body, user_id)
+
+        session = ExamsSession(user_id)
         try:
             exam_row = Exam(
                 user_id=user_id,
@@ -121,12 +306,53 @@ def create_app() -> FastAPI:
             exam_id = exam_row.id
         finally:
             session.close()
+        bump_user_version(user_id)
 
         return {"exam_id": exam_id, **exam}
 
-    @app.post("/exam/submit")
-    async def submit_exam_endpoint(body: SubmitExamRequest, user_id: int = Depends(get_current_user_id)):
-        session = ExamsSession()
+    def _plan_exam(body: GenerateExamRequest, user_id: int) -> Dict[str, Any]:
+        """Topics, difficulty, weights and missed questions for a new exam (database reads)."""
+        topics = body.topics or ["Algebra", "Functions", "Integrals", "Derivatives", "Geometry"]
+        difficulty = (body.difficulty or "medium").lower()
+
+        weights = None
+        if (body.mode or "deterministic").lower() == "ai_adaptive":
+            # Precomputed plan first (one lookup), then live mastery, then the dataset heuristic
+            plan = get_plan(user_id)
+            if plan is not None:
+                weights = {t: w for t, w in plan["weights"].items() if t in topics} or None
+                if "difficulty" not in body.model_fields_set:
+                    difficulty = plan["difficulty"]
+            if weights is None:
+                weights = topic_weights(user_id, topics)
+            if weights is None:
+                topics = _compute_weak_topics(user_id=user_id, default_topics=topics)
+
+        missed: List[Dict[str, Any]] = []
+        if body.similar_to_exam_id is not None:
+            prev = _my_exam(user_id, body.similar_to_exam_id)
+            prev_answers = json.loads(prev.answers_json or "{}")
+            missed = [q for q in _exam_questions(prev) if prev_answers.get(q["id"]) != q.get("answer")]
+        return {"topics": topics, "difficulty": difficulty, "topic_weights": weights, "similar_to": missed or None}
+
+    async def _build_exam(
+        body: GenerateExamRequest, user_id: int, priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict[str, Any]:
+        plan = await run_in_threadpool(_plan_exam, body, user_id)
+        # Blocking LLM/template work runs off the event loop so the scheduler can queue it
+        return await run_in_threadpool(
+            generate_exam,
+            num_questions=int(body.num_questions or 10),
+            mode=(body.mode or "deterministic").lower(),
+            avoid_repeat=True,
+            subtopic=body.subtopic,
+            priority=priority,
+            **plan,
+        )
+
+    def _submission_target(body: SubmitExamRequest, user_id: int) -> tuple:
+        """``(exam_id, questions to grade, whether the server issued them)`` for a submit."""
+        session = ExamsSession(user_id)
         try:
             if body.exam_id is None:
                 # create ephemeral exam record if not provided
@@ -141,87 +367,139 @@ def create_app() -> FastAPI:
                 session.add(exam_row)
                 session.commit()
                 session.refresh(exam_row)
-            else:
-                exam_row = session.query(Exam).filter(Exam.id == body.exam_id, Exam.user_id == user_id).first()
-                if not exam_row:
-                    raise HTTPException(status_code=404, detail="Exam not found for this user")
-                exam_row.questions_json = json.dumps(body.questions)
-                exam_row.answers_json = json.dumps(body.answers)
-
-            questions = body.questions
-            answers = body.answers
-            analysis = analyze_performance(questions, answers)
-            exam_row.score = float(analysis["overall_accuracy"])
-            exam_row.topic_stats_json = json.dumps(analysis["topic_accuracy"])
-            # Save feedback list (not just overall summary)
-            if hasattr(exam_row, "feedback_json"):
-                exam_row.feedback_json = json.dumps(analysis.get("feedback", []))
-            session.commit()
-            append_result_to_dataset(user_id=user_id, topic_accuracy=analysis["topic_accuracy"])
-            return {
-                "exam_id": exam_row.id,
-                "overall_accuracy": analysis["overall_accuracy"],
-                "topic_accuracy": analysis["topic_accuracy"],
-                "feedback": analysis["feedback"],
-                "overall_feedback": analysis.get("overall_feedback")
-            }
+                return exam_row.id, body.questions, False
+            exam_row = session.query(Exam).filter(Exam.id == body.exam_id, Exam.user_id == user_id).first()
+            if not exam_row:
+                raise HTTPException(status_code=404, detail="Exam not found for this user")
+            if exam_row.submitted:
+                # Grading, mastery and item statistics count an exam once
+                raise HTTPException(status_code=409, detail="Exam already submitted")
+            # Graded against the stored exam (a class exam's server-side variant), never the
+            # posted copy, whose answer keys the client controls
+            questions = _exam_questions(exam_row)
+            if not questions:
+                return exam_row.id, body.questions, False
+            return exam_row.id, questions, True
         finally:
             session.close()
 
+    @app.post("/exam/submit")
+    async def submit_exam_endpoint(body: SubmitExamRequest, user_id: int = Depends(get_current_user_id)):
+        exam_id, questions, server_issued = await run_in_threadpool(_submission_target, body, user_id)
+
+        answers = body.answers
+        analysis = await run_in_threadpool(analyze_performance, questions, answers)
+        values = {
+            "answers_json": json.dumps(answers),
+            "score": float(analysis["overall_accuracy"]),
+            "topic_stats_json": json.dumps(analysis["topic_accuracy"]),
+            # Save feedback list (not just overall summary)
+            "feedback_json": json.dumps(analysis.get("feedback", [])),
+            "submitted": True,
+        }
+        # Committed together with other submits' rows; returns once ours are on disk
+        await write_submission(user_id, exam_id, values, analysis["topic_accuracy"])
+        bump_user_version(user_id)
+        # Mastery steps use each item's calibrated difficulty from before this submission
+        item_stats = await run_in_threadpool(lookup_item_stats, questions)
+        await run_in_threadpool(
+            update_mastery,
+            user_id,
+            [
+                (fb["topic"], fb["is_correct"], item_difficulty_b(item_stats.get(question_fingerprint(q))))
+                for q, fb in zip(questions, analysis["feedback"])
+            ],
+        )
+        if server_issued:
+            # Only questions the server issued (and their stored keys) feed the global item statistics
+            await run_in_threadpool(record_responses, questions, answers)
+        # Build the likely next exam now, while the student reads this report
+        speculate(
+            user_id,
+            lambda params: _build_exam(GenerateExamRequest(**params), user_id, PRIORITY_REFILL),
+        )
+        return {
+            "exam_id": exam_id,
+            "overall_accuracy": analysis["overall_accuracy"],
+            "topic_accuracy": analysis["topic_accuracy"],
+            "feedback": analysis["feedback"],
+            "overall_feedback": analysis.get("overall_feedback")
+        }
+
+    @app.get("/analytics/cohort")
+    async def cohort_report_endpoint(user_id: int = Depends(get_current_user_id)):
+        # Built offline by `python -m ai_engine.cohort_report`
+        report = await run_in_threadpool(load_cohort_report)
+        if report is None:
+            raise HTTPException(status_code=404, detail="Cohort report has not been built yet")
+        return report
+
+    def _my_exams(user_id: int, with_feedback: bool = False) -> List[Exam]:
+        # Newest first; the archive only holds older exams, so it tops up a short hot list
+        options = [undefer(Exam.feedback_json)] if with_feedback else []
+        rows: List[Exam] = []
+        for make_session in (ExamsSession.for_user(user_id), ArchiveSession):
+            session = make_session()
+            try:
+                rows += (
+                    session.query(Exam)
+                    .options(*options)
+                    .filter(Exam.user_id == user_id)
+                    .order_by(Exam.created_at.desc())
+                    .limit(50 - len(rows))
+                    .all()
+                )
+            finally:
+                session.close()
+            if len(rows) >= 50:
+                break
+        return rows
+
+    def _my_exam(user_id: int, exam_id: int) -> Exam:
+        for make_session in (ExamsSession.for_user(user_id), ArchiveSession):
+            session = make_session()
+            try:
+                r = (
+                    session.query(Exam)
+                    .options(undefer_group("heavy"))
+                    .filter(Exam.id == exam_id, Exam.user_id == user_id)
+                    .first()
+                )
+            finally:
+                session.close()
+            if r is not None:
+                return r
+        raise HTTPException(status_code=404, detail="Exam not found")
+
+    # Repeat views are a version check plus a 304 until this user generates or submits
     @app.get("/exam/me")
-    async def list_my_exams(user_id: int = Depends(get_current_user_id)):
-        session = ExamsSession()
-        try:
-            rows = (
-                session.query(Exam)
-                .filter(Exam.user_id == user_id)
-                .order_by(Exam.created_at.desc())
-                .limit(50)
-                .all()
-            )
-            result = []
-            for r in rows:
-                feedback = []
-                try:
-                    if hasattr(r, "feedback_json") and r.feedback_json:
-                        feedback = json.loads(r.feedback_json)
-                except Exception:
-                    feedback = []
-                result.append({
-                    "id": r.id,
-                    "created_at": r.created_at.isoformat() + "Z",
-                    "score": r.score,
-                    "topic_accuracy": json.loads(r.topic_stats_json or "{}"),
-                    "feedback": feedback
-                })
-            return result
-        finally:
-            session.close()
+    async def list_my_exams(request: Request, user_id: int = Depends(get_current_user_id)):
+        return cached_json(
+            request, ("me", user_id), user_id,
+            lambda: [exam_summary_v1(r) for r in _my_exams(user_id, with_feedback=True)],
+        )
 
     @app.get("/exam/{exam_id}")
-    async def get_exam(exam_id: int, user_id: int = Depends(get_current_user_id)):
-        session = ExamsSession()
-        try:
-            r = session.query(Exam).filter(Exam.id == exam_id, Exam.user_id == user_id).first()
-            if not r:
-                raise HTTPException(status_code=404, detail="Exam not found")
-            feedback = []
-            try:
-                if hasattr(r, "feedback_json") and r.feedback_json:
-                    feedback = json.loads(r.feedback_json)
-            except Exception:
-                feedback = []
-            return {
-                "id": r.id,
-                "created_at": r.created_at.isoformat() + "Z",
-                "questions": json.loads(r.questions_json or "[]"),
-                "answers": json.loads(r.answers_json or "{}"),
-                "score": r.score,
-                "topic_accuracy": json.loads(r.topic_stats_json or "{}"),
-                "feedback": feedback
-            }
-        finally:
-            session.close()
+    async def get_exam(exam_id: int, request: Request, user_id: int = Depends(get_current_user_id)):
+        def build() -> Dict[str, Any]:
+            r = _my_exam(user_id, exam_id)
+            return exam_detail_v1(r, _exam_questions(r))
+
+        return cached_json(request, ("exam", user_id, exam_id), user_id, build)
+
+    # v2: feedback refers to question ids and /exam/me drops feedback entirely
+    @app.get("/v2/exam/me")
+    async def list_my_exams_v2(request: Request, user_id: int = Depends(get_current_user_id)):
+        return cached_json(request, ("me.v2", user_id), user_id, lambda: exam_list_v2(_my_exams(user_id)))
+
+    @app.get("/v2/exam/{exam_id}")
+    async def get_exam_v2(exam_id: int, request: Request, user_id: int = Depends(get_current_user_id)):
+        def build() -> bytes:
+            r = _my_exam(user_id, exam_id)
+            # Stored questions are spliced in raw; only class-exam variants are rebuilt
+            return exam_detail_v2(r, _exam_questions(r) if r.blueprint_id is not None and not r.questions_json else None)
+
+        return cached_json(request, ("exam.v2", user_id, exam_id), user_id, build)
 
     return app
 
@@ -231,6 +509,14 @@ app = create_app()
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000)), reload=True)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # All shared state is multi-process safe; reload only makes sense for a single dev worker
+    uvicorn.run(
+        "backend.main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        reload=workers == 1,
+        workers=workers,
+    )
 
 
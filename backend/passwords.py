@@ -0,0 +1,126 @@
+# Password hashing off the request path.
+#
+# pbkdf2 is CPU-bound. Hashed on the request threadpool, a login burst runs
+# up to 40 hashes at once and occupies the threads other requests need.
+# Hashes are computed in a small, lower-priority process pool instead, so at
+# most PASSWORD_WORKERS cores hash at a time (PASSWORD_WORKERS=0 hashes inline).
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# pbkdf2_sha256 work factor; stored hashes with other rounds are re-hashed at their next login
+PASSWORD_ROUNDS = int(os.getenv("PASSWORD_ROUNDS", "29000"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Pool processes run at lower CPU priority so request handling wins on a busy core
+PASSWORD_NICE = int(os.getenv("PASSWORD_NICE", "10"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def _context(rounds: int) -> CryptContext:
+    # min == max == default: any hash made with a different work factor needs an update
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+        pbkdf2_sha256__max_rounds=rounds,
+    )
+
+
+# ---------------- run inside pool processes ----------------
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, password_hash: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    try:
+        return _context(rounds).verify_and_update(password, password_hash)
+    except ValueError:  # malformed or unknown hash
+        return False, None
+
+
+def _ping() -> None:
+    pass
+
+
+def _init_worker(niceness: int) -> None:
+    if niceness and hasattr(os, "nice"):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+# ---------------- callers ----------------
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PASSWORD_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=PASSWORD_WORKERS, initializer=_init_worker, initargs=(PASSWORD_NICE,)
+                )
+    return _pool
+
+
+def _submit(fn, *args) -> Future:
+    pool = _get_pool()
+    if pool is not None:
+        return pool.submit(fn, *args)
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def hash_password(password: str) -> str:
+    return _submit(_hash, password, PASSWORD_ROUNDS).result()
+
+
+def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """``(ok, new_hash)``; ``new_hash`` is set when the stored hash uses outdated parameters."""
+    return _submit(_verify_and_update, password, password_hash, PASSWORD_ROUNDS).result()
+
+
+async def _run(fn, *args):
+    if _get_pool() is None:
+        # Inline hashing still must not block the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+    return await asyncio.wrap_future(_submit(fn, *args))
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(_hash, password, PASSWORD_ROUNDS)
+
+
+async def verify_password_async(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    return await _run(_verify_and_update, password, password_hash, PASSWORD_ROUNDS)
+
+
+def warm_up() -> None:
+    """Start the pool processes now so the first logins do not pay for process spawn."""
+    pool = _get_pool()
+    if pool is not None:
+        for future in [pool.submit(_ping) for _ in range(PASSWORD_WORKERS)]:
+            future.result()
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
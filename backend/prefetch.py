@@ -0,0 +1,131 @@
+# Speculative next exam.
+#
+# Most students start another exam right after submitting one, with the same
+# settings. Once a submission is graded, the exam that student's last
+# request would produce now (with the updated mastery) is built in the
+# background at refill priority, and only while the LLM scheduler has spare
+# capacity. The questions wait in a per-user slot for PREFETCH_TTL_S; a
+# /exam/generate whose parameters match takes them instead of generating.
+# No exam row exists until the slot is taken, so unused speculation leaves
+# nothing behind to sweep.
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from ai_engine.cache_backend import get_cache
+from ai_engine.llm_scheduler import get_scheduler
+
+PREFETCH = os.getenv("PREFETCH", "1") == "1"
+PREFETCH_TTL_S = float(os.getenv("PREFETCH_TTL_S", "600"))
+# Speculative builds running at once in this worker
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "1"))
+# How long a user's last generate parameters are remembered
+LAST_REQUEST_TTL_S = 7 * 24 * 3600
+
+_store = None
+_running = 0
+_tasks: Set["asyncio.Task[None]"] = set()
+_stats = {
+    "scheduled": 0, "built": 0, "failed": 0, "skipped_busy": 0,
+    "hits": 0, "mismatched": 0, "empty": 0, "saved_ms": 0.0,
+}
+
+
+def _cache():
+    global _store
+    if _store is None:
+        _store = get_cache("prefetch")
+    return _store
+
+
+def _fingerprint(params: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def remember(user_id: int, params: Dict[str, Any]) -> None:
+    """Record the parameters of a plain generate request as this user's likely next one."""
+    if PREFETCH:
+        _cache().set(f"last:{user_id}", params, LAST_REQUEST_TTL_S)
+
+
+def take(user_id: int, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The prefetched exam for these parameters, removed from the slot; ``None`` on a miss."""
+    if not PREFETCH:
+        return None
+    slot = _cache().get(f"slot:{user_id}")
+    if slot is None:
+        _stats["empty"] += 1
+        return None
+    if slot.get("fingerprint") != _fingerprint(params):
+        _stats["mismatched"] += 1
+        return None
+    _cache().delete(f"slot:{user_id}")
+    _stats["hits"] += 1
+    _stats["saved_ms"] += slot.get("build_ms", 0.0)
+    return slot["exam"]
+
+
+def _spare_capacity() -> bool:
+    if _running >= PREFETCH_CONCURRENCY:
+        return False
+    scheduler = get_scheduler().stats()
+    # Anything queued is a student waiting; speculation never competes with them
+    return scheduler["queued"] == 0 and scheduler["active"] < get_scheduler().max_concurrency
+
+
+async def _build(user_id: int, params: Dict[str, Any], build: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> None:
+    global _running
+    start = time.perf_counter()
+    try:
+        exam = await build(params)
+        _cache().set(
+            f"slot:{user_id}",
+            {
+                "fingerprint": _fingerprint(params),
+                "exam": exam,
+                "build_ms": round((time.perf_counter() - start) * 1000, 1),
+            },
+            PREFETCH_TTL_S,
+        )
+        _stats["built"] += 1
+    except Exception:
+        _stats["failed"] += 1
+    finally:
+        _running -= 1
+
+
+def speculate(user_id: int, build: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> None:
+    """Start building ``user_id``'s likely next exam in the background, if there is room.
+
+    ``build(params)`` produces an exam (questions and mode) for remembered
+    generate parameters; it should run at refill priority.
+    """
+    global _running
+    if not PREFETCH:
+        return
+    params = _cache().get(f"last:{user_id}")
+    if params is None:
+        return
+    if not _spare_capacity():
+        _stats["skipped_busy"] += 1
+        return
+    _stats["scheduled"] += 1
+    _running += 1
+    task = asyncio.create_task(_build(user_id, params, build))
+    # The event loop only keeps weak references to tasks
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def prefetch_stats() -> Dict[str, Any]:
+    lookups = _stats["hits"] + _stats["mismatched"] + _stats["empty"]
+    return {
+        **_stats,
+        "saved_ms": round(_stats["saved_ms"], 1),
+        "running": _running,
+        "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0.0,
+        "used_rate": round(_stats["hits"] / _stats["built"], 3) if _stats["built"] else 0.0,
+    }
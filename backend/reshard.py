@@ -0,0 +1,125 @@
+# Move exams between shard files after changing EXAMS_SHARDS.
+#
+#   python reshard.py --status          # exams per shard file
+#   python reshard.py --to 4 [--batch 500] [--dry-run]
+#
+# Stop the API first, run this, then start it again with EXAMS_SHARDS=4. Every
+# existing shard file is scanned and rows whose user now hashes elsewhere are
+# copied to their new shard and deleted from the old one, batch by batch with
+# the archive's copy-then-delete (a rerun after a crash finishes the job).
+# Rows keep their ids. Shrinking empties the files past the new count; they
+# can then be deleted. Blueprints always stay in exams.db.
+import os
+import sys
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from archive import COLUMNS, move_rows  # noqa: E402
+from database import SHARD_ID_BITS, exams_db_url, init_databases, init_exams_shard  # noqa: E402
+from ai_engine.storage import connect_sqlite, shard_for_user, transaction  # noqa: E402
+
+
+def _path(shard: int) -> str:
+    return exams_db_url(shard).replace("sqlite:///", "")
+
+
+def existing_shards() -> int:
+    """Number of shard files on disk (exams.db, exams-1.db, ... without gaps)."""
+    n = 1
+    while os.path.exists(_path(n)):
+        n += 1
+    return n
+
+
+def status() -> Dict[int, int]:
+    init_databases()
+    counts = {}
+    for shard in range(existing_shards()):
+        conn = connect_sqlite(_path(shard))
+        try:
+            counts[shard] = conn.execute("SELECT COUNT(*) FROM exams").fetchone()[0]
+        finally:
+            conn.close()
+    return counts
+
+
+def _bump_counters(shards: int) -> None:
+    # A shard file deleted after shrinking starts its counter again at the bottom
+    # of its range, while its old ids live on elsewhere; skip past all of them
+    highest: Dict[int, int] = defaultdict(int)
+    for src in range(shards):
+        conn = connect_sqlite(_path(src))
+        try:
+            for shard, max_id in conn.execute(f"SELECT id >> {SHARD_ID_BITS}, MAX(id) FROM exams GROUP BY 1"):
+                highest[shard] = max(highest[shard], max_id)
+        finally:
+            conn.close()
+    for shard in range(shards):
+        if highest[shard]:
+            conn = connect_sqlite(_path(shard))
+            try:
+                with transaction(conn):
+                    conn.execute("UPDATE exam_id_counter SET next_id = MAX(next_id, ?)", (highest[shard] + 1,))
+            finally:
+                conn.close()
+
+
+def reshard(to: int, batch: int = 500, dry_run: bool = False) -> Dict[str, object]:
+    init_databases()
+    sources = existing_shards()
+    if not dry_run:
+        for shard in range(1, to):
+            init_exams_shard(shard)
+    conns = {k: connect_sqlite(_path(k)) for k in range(max(sources, to)) if os.path.exists(_path(k))}
+    cols = ", ".join(COLUMNS)
+    moves: Dict[Tuple[int, int], int] = defaultdict(int)
+    try:
+        for src in range(sources):
+            last_id = 0
+            while True:
+                rows = (
+                    conns[src]
+                    .execute(f"SELECT {cols} FROM exams WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch))
+                    .fetchall()
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                by_target: Dict[int, List[tuple]] = defaultdict(list)
+                for row in rows:
+                    target = shard_for_user(row[1], to)
+                    if target != src:
+                        by_target[target].append(row)
+                for target, moving in by_target.items():
+                    if not dry_run:
+                        move_rows(conns[src], conns[target], moving)
+                    moves[(src, target)] += len(moving)
+    finally:
+        for conn in conns.values():
+            conn.close()
+    if not dry_run:
+        _bump_counters(max(sources, to))
+    return {
+        "moved": sum(moves.values()),
+        "moves": {f"{src}->{dst}": n for (src, dst), n in sorted(moves.items())},
+        "shards": status() if not dry_run else None,
+        "empty_files": [_path(k) for k in range(to, sources)] if not dry_run else [],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Redistribute exams across EXAMS_SHARDS shard files")
+    parser.add_argument("--to", type=int, help="new shard count")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would move")
+    parser.add_argument("--status", action="store_true", help="print exams per shard file")
+    args = parser.parse_args()
+    if args.status or not args.to:
+        print(status())
+    else:
+        if args.to < 1:
+            parser.error("--to must be at least 1")
+        print(reshard(args.to, args.batch, args.dry_run))
@@ -0,0 +1,76 @@
+import os
+import gzip
+import json
+from typing import Any, Iterable, Optional, Tuple
+
+try:
+    import orjson
+except Exception:  # optional speed-up
+    orjson = None
+
+try:
+    import brotli
+except Exception:  # optional; gzip is always available
+    brotli = None
+
+# Small bodies are not worth the CPU or the extra header
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+
+class RawJSON(bytes):
+    """Already-serialized JSON (e.g. a stored column) spliced into output as-is."""
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def raw(text: Optional[str], default: str) -> RawJSON:
+    return RawJSON((text or default).encode("utf-8"))
+
+
+def json_object(items: Iterable[Tuple[str, Any]]) -> bytes:
+    """Encode a JSON object whose ``RawJSON`` values skip the decode/re-encode round trip."""
+    parts = []
+    for key, value in items:
+        encoded = value if isinstance(value, RawJSON) else dumps(value)
+        parts.append(dumps(key) + b":" + encoded)
+    return b"{" + b",".join(parts) + b"}"
+
+
+def negotiate_encoding(accept_encoding: str, size: int) -> Optional[str]:
+    if size < COMPRESS_MIN_BYTES or not accept_encoding:
+        return None
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    pass
+        offered[name.strip().lower()] = q
+    # q=0 means "not acceptable"; "*" covers codings not named
+    wildcard = offered.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if (encoding != "br" or brotli is not None) and offered.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    # mtime=0 keeps the output (and therefore its ETag) stable
+    return gzip.compress(body, compresslevel=6, mtime=0)
@@ -0,0 +1,141 @@
+# Cold-start bookkeeping and the post-startup warm-up.
+#
+#   python startup.py [--top 15]      # import time per module, then init/warm-up stages
+#   STARTUP_PROFILE=1 python main.py  # print each stage's time as the server boots
+#
+# Importing main only defines the app. Schema checks run in the startup hook,
+# and everything that merely makes the first requests faster (password pool,
+# numeric stack, question bank index, shared caches) loads in a background
+# thread once the server is already accepting traffic. Stage timings are
+# served under /metrics as "startup".
+import os
+import re
+import sys
+import time
+import subprocess
+import argparse
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_timings: Dict[str, float] = {}
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+        if STARTUP_PROFILE:
+            print(f"[startup] {stage}: {_timings[stage]} ms", file=sys.stderr, flush=True)
+
+
+def startup_timings() -> Dict[str, float]:
+    return dict(_timings)
+
+
+def _warm_questions() -> None:
+    from ai_engine.question_generator import warm_up
+
+    warm_up()
+
+
+def _warm_analytics() -> None:
+    from ai_engine.analytics_store import get_store
+
+    get_store().import_legacy_csv()
+
+
+def _warm_passwords() -> None:
+    from passwords import warm_up
+
+    warm_up()
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("warmup.passwords", _warm_passwords),
+    ("warmup.questions", _warm_questions),
+    ("warmup.analytics", _warm_analytics),
+]
+
+
+def warm_up() -> None:
+    """Run every warm-up step; a failing step only costs its own speed-up."""
+    with timed("warmup"):
+        for stage, step in WARMUP_STEPS:
+            try:
+                with timed(stage):
+                    step()
+            except Exception as e:
+                print(f"[startup] {stage} failed: {e}", file=sys.stderr, flush=True)
+
+
+# ---------------- profile CLI ----------------
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|\s*(\S+)$")
+
+
+def _first_party() -> set:
+    names = {f[:-3] for f in os.listdir(BACKEND_DIR) if f.endswith(".py")}
+    return names | {"ai_engine"}
+
+
+def import_profile(module: str = "main") -> List[Dict[str, object]]:
+    """Per-module import cost of ``module`` in a fresh interpreter (``-X importtime``)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    ours = _first_party()
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, name = int(m.group(1)), int(m.group(2)), m.group(3)
+        package = name.split(".")[0]
+        # First-party modules individually; third-party packages by their top-level import
+        if package in ours or name == package:
+            rows.append({
+                "module": name,
+                "first_party": package in ours,
+                "self_ms": round(self_us / 1000, 1),
+                "cumulative_ms": round(cumulative_us / 1000, 1),
+            })
+    return rows
+
+
+def _print_rows(title: str, rows: List[Dict[str, object]]) -> None:
+    print(title)
+    for r in rows:
+        print(f"  {r['module']:<40} {r['cumulative_ms']:>9.1f} ms  (self {r['self_ms']:.1f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile CodexEDU API cold start")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = import_profile(args.module)
+    total = max((r["cumulative_ms"] for r in rows if r["module"] == args.module), default=0.0)
+    print(f"import {args.module}: {total:.1f} ms")
+    by_cost = sorted(rows, key=lambda r: -r["cumulative_ms"])
+    _print_rows("first-party modules:", [r for r in by_cost if r["first_party"]][: args.top])
+    _print_rows("third-party packages:", [r for r in by_cost if not r["first_party"]][: args.top])
+
+    with timed("import"):
+        __import__(args.module)
+    from database import init_databases
+
+    with timed("init_databases"):
+        init_databases()
+    warm_up()
+    print("stages:")
+    for stage, ms in _timings.items():
+        print(f"  {stage:<40} {ms:>9.1f} ms")
@@ -0,0 +1,51 @@
+import os
+import sys
+import uuid
+import tempfile
+
+import pytest
+
+# Every database and log goes to a scratch directory, never the tracked data/;
+# set before any backend module computes its paths
+os.environ["CODEXEDU_DATA_DIR"] = tempfile.mkdtemp(prefix="codexedu-tests-")
+# Hash inline and cheaply, no background work, no shedding unless a test asks for it
+for key, value in {"PASSWORD_WORKERS": "0", "PASSWORD_ROUNDS": "1000", "WARMUP": "0",
+                   "SWEEP_INTERVAL_S": "0", "ADMISSION": "0", "OPENAI_API_KEY": "",
+                   "JWT_SECRET": "test-secret-" + "x" * 32}.items():
+    os.environ[key] = value
+# The backend runs with its own directory on sys.path (flat imports)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_redis import FakeRedis  # noqa: E402
+
+
+@pytest.fixture
+def fake_redis():
+    server = FakeRedis().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="session")
+def api():
+    """The API app with its lifespan run, on the scratch data directory."""
+    from fastapi.testclient import TestClient
+    from main import create_app
+
+    with TestClient(create_app()) as client:
+        yield client
+
+
+def register(api) -> dict:
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+    resp = api.post("/auth/register", json={"name": "Student", "email": email, "password": "correct horse"})
+    assert resp.status_code == 200, resp.text
+    return {"Authorization": f"Bearer {resp.json()['access_token']}", "email": email}
+
+
+@pytest.fixture
+def headers(api):
+    """Auth headers of a freshly registered user."""
+    h = register(api)
+    h.pop("email")
+    return h
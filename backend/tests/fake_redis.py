@@ -0,0 +1,172 @@
+# In-process stand-in for a Redis server, for tests.
+#
+# Speaks RESP2 over a real socket on 127.0.0.1, so RedisCache is exercised
+# end to end (pooling, reconnects, the subscriber thread), but implements only
+# the commands the cache sends: GET, SET [PX] [NX], DEL, INCR, PUBLISH, SUBSCRIBE,
+# SELECT, AUTH and PING. Each SELECTed db is a separate dict.
+import time
+import socket
+import socketserver
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+" + value.encode("utf-8") + b"\r\n"
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v) for v in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class _Client(socketserver.StreamRequestHandler):
+    server: "FakeRedis"
+
+    def setup(self) -> None:
+        super().setup()
+        self.db = 0
+        self.server.clients.add(self)
+        self.write_lock = threading.Lock()  # publishers write to subscribed clients from their own threads
+
+    def send(self, data: bytes) -> None:
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self) -> None:
+        try:
+            while True:
+                args = self.read_command()
+                if args is None:
+                    return
+                self.server.commands += 1
+                reply = self.server.execute(self, args[0].upper().decode("ascii"), args[1:])
+                if reply is not None:
+                    self.send(reply)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.server.clients.discard(self)
+            self.server.unsubscribe(self)
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Client)
+        self.lock = threading.Lock()
+        self.data: Dict[int, Dict[bytes, Tuple[bytes, Optional[float]]]] = defaultdict(dict)
+        self.channels: Dict[bytes, List[_Client]] = defaultdict(list)
+        self.clients: Set[_Client] = set()
+        self.commands = 0
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-redis", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "FakeRedis":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def drop_connections(self) -> None:
+        """Close every client socket, as a server restart or idle timeout would."""
+        for client in list(self.clients):
+            try:
+                client.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def subscribers(self, channel: str) -> int:
+        with self.lock:
+            return len(self.channels.get(channel.encode("utf-8"), []))
+
+    def unsubscribe(self, client: _Client) -> None:
+        with self.lock:
+            for clients in self.channels.values():
+                if client in clients:
+                    clients.remove(client)
+
+    def _live(self, db: int, key: bytes) -> Optional[bytes]:
+        item = self.data[db].get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self.data[db][key]
+            return None
+        return value
+
+    def execute(self, client: _Client, cmd: str, args: List[bytes]) -> Optional[bytes]:
+        with self.lock:
+            db = self.data[client.db]
+            if cmd in ("PING", "AUTH"):
+                return _encode("PONG" if cmd == "PING" else "OK")
+            if cmd == "SELECT":
+                client.db = int(args[0])
+                return _encode("OK")
+            if cmd == "GET":
+                return _encode(self._live(client.db, args[0]))
+            if cmd == "SET":
+                expires = None
+                flags = [a.upper() for a in args[2:]]
+                if b"PX" in flags:
+                    expires = time.monotonic() + int(args[2 + flags.index(b"PX") + 1]) / 1000.0
+                if b"NX" in flags and self._live(client.db, args[0]) is not None:
+                    return _encode(None)
+                db[args[0]] = (args[1], expires)
+                return _encode("OK")
+            if cmd == "DEL":
+                return _encode(sum(1 for key in args if db.pop(key, None) is not None))
+            if cmd == "INCR":
+                current = self._live(client.db, args[0])
+                try:
+                    value = int(current or b"0") + 1
+                except ValueError:
+                    return b"-ERR value is not an integer or out of range\r\n"
+                expires = db[args[0]][1] if args[0] in db else None
+                db[args[0]] = (str(value).encode("ascii"), expires)
+                return _encode(value)
+            if cmd == "PUBLISH":
+                receivers = list(self.channels.get(args[0], []))
+            elif cmd == "SUBSCRIBE":
+                for channel in args:
+                    self.channels[channel].append(client)
+                receivers = None
+            else:
+                return b"-ERR unknown command '%s'\r\n" % cmd.encode("ascii")
+        # Pub/sub writes go out without the data lock held
+        if cmd == "SUBSCRIBE":
+            for i, channel in enumerate(args, 1):
+                client.send(_encode([b"subscribe", channel, i]))
+            return None
+        delivered = 0
+        for receiver in receivers:
+            try:
+                receiver.send(_encode([b"message", args[0], args[1]]))
+                delivered += 1
+            except OSError:
+                pass
+        return _encode(delivered)
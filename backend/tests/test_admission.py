@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+import pytest
+
+import admission
+from admission import AdmissionMiddleware, RouteLimits, client_key
+
+
+async def _app(scope, receive, send):
+    """Answers 200 after sleeping ``?hold=<seconds>``."""
+    query = scope.get("query_string", b"").decode()
+    if query.startswith("hold="):
+        await asyncio.sleep(float(query[5:]))
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _run(limits, *requests):
+    """Send ``(path, headers)`` requests concurrently, each started 10 ms after the previous one."""
+    app = AdmissionMiddleware(_app, limits=[limits], enabled=True)
+
+    async def one(client, i, path, headers):
+        await asyncio.sleep(0.01 * i)
+        return await client.get(path, headers=headers or {})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await asyncio.gather(*(one(client, i, *r) for i, r in enumerate(requests)))
+
+    try:
+        return asyncio.run(run())
+    finally:
+        admission._registry.remove(app)  # keep the test policies out of the API's stats
+
+
+@pytest.fixture
+def users(monkeypatch):
+    # Bearer "user-N" authenticates as user N
+    monkeypatch.setattr(admission, "verify_token",
+                        lambda token: (int(token[5:]), 0, 0.0) if token.startswith("user-") else None)
+    return lambda n: {"Authorization": f"Bearer user-{n}"}
+
+
+def test_each_user_has_their_own_rate_limit(users):
+    limits = RouteLimits("api", None, "/", client_rate=0.01, client_burst=2)
+    responses = _run(limits, *[("/x", users(1))] * 3, ("/x", users(2)))
+    assert [r.status_code for r in responses] == [200, 200, 429, 200]
+    assert int(responses[2].headers["Retry-After"]) >= 1
+    assert limits.stats == {"admitted": 3, "rate_limited": 1, "shed": 0}
+
+
+def test_route_bucket_limits_all_clients_together(users):
+    limits = RouteLimits("api", None, "/", client_rate=10, client_burst=10, route_rate=0.01, route_burst=2)
+    responses = _run(limits, ("/x", users(1)), ("/x", users(2)), ("/x", users(3)))
+    assert [r.status_code for r in responses] == [200, 200, 429]
+
+
+def test_sheds_at_once_when_the_expected_wait_exceeds_the_budget(users):
+    limits = RouteLimits("slow", None, "/", client_rate=10, client_burst=10, concurrency=1, queue_budget=0.1)
+    responses = _run(limits, ("/x?hold=0.2", users(1)), ("/x", users(2)))
+    assert [r.status_code for r in responses] == [200, 503]
+    assert "Retry-After" in responses[1].headers
+    # A shed request takes no rate token
+    assert len(limits.buckets) == 1
+
+
+def test_queued_request_is_shed_when_its_slot_comes_too_late(users):
+    limits = RouteLimits("slow", None, "/", client_rate=10, client_burst=10, concurrency=1, queue_budget=0.1)
+    limits.service_s = 0.01  # looks fast, so the second request queues
+    responses = _run(limits, ("/x?hold=0.3", users(1)), ("/x", users(2)))
+    assert [r.status_code for r in responses] == [200, 503]
+    assert limits.stats["shed"] == 1 and limits.in_flight == 0 and limits.waiting == 0
+
+
+def test_queued_request_runs_once_a_slot_frees(users):
+    limits = RouteLimits("slow", None, "/", client_rate=10, client_burst=10, concurrency=1, queue_budget=1.0)
+    limits.service_s = 0.01
+    responses = _run(limits, ("/x?hold=0.05", users(1)), ("/x", users(2)))
+    assert [r.status_code for r in responses] == [200, 200]
+
+
+def test_forwarded_for_is_only_believed_from_trusted_proxies(monkeypatch):
+    scope = {"client": ("10.0.0.2", 1234), "headers": [(b"x-forwarded-for", b"203.0.113.9, 10.0.0.1")]}
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", set())
+    assert client_key(scope) == "ip:10.0.0.2"
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"10.0.0.1", "10.0.0.2"})
+    assert client_key(scope) == "ip:203.0.113.9"
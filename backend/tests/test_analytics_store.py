@@ -0,0 +1,93 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from ai_engine import analytics_store
+from ai_engine.analytics_store import AnalyticsStore
+
+DAY_TS = datetime(2024, 3, 5, 12, tzinfo=timezone.utc).timestamp()
+LATER = datetime(2024, 4, 1, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_store, "ANALYTICS_DIR", str(tmp_path))
+    store = AnalyticsStore(flush_rows=10**6, flush_interval=3600)
+    store._imported = True  # no legacy CSV import
+    for user_id in range(3):
+        store.append(user_id, {"Algebra": 0.5, "Geometry": 1.0}, exam_id=user_id, ts=DAY_TS)
+    store.flush()
+    return store
+
+
+def _month_rows(tmp_path):
+    conn = analytics_store._connect(str(tmp_path / "month-2024-03.db"))
+    try:
+        return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_compact_folds_day_into_month(store, tmp_path):
+    assert store.compact(now=LATER) == ["2024-03-05"]
+    assert not os.path.exists(tmp_path / "day-2024-03-05.db")
+    assert _month_rows(tmp_path) == 6
+    assert store.topic_averages() == {"Algebra": 0.5, "Geometry": 1.0}
+
+
+def test_compact_skips_recent_days(store, tmp_path):
+    assert store.compact(now=DAY_TS) == []
+    assert os.path.exists(tmp_path / "day-2024-03-05.db")
+
+
+def test_compact_crash_before_unlink_does_not_duplicate(store, tmp_path, monkeypatch):
+    real_remove = os.remove
+
+    def crash(path):
+        raise KeyboardInterrupt("killed before the day file was removed")
+
+    monkeypatch.setattr(analytics_store.os, "remove", crash)
+    with pytest.raises(KeyboardInterrupt):
+        store.compact(now=LATER)
+    monkeypatch.setattr(analytics_store.os, "remove", real_remove)
+    assert os.path.exists(tmp_path / "day-2024-03-05.db")
+    assert len(list(store.query())) == 6  # the leftover day file is already empty
+
+    assert store.compact(now=LATER) == ["2024-03-05"]
+    assert _month_rows(tmp_path) == 6
+    assert not os.path.exists(tmp_path / "day-2024-03-05.db")
+
+
+def test_compact_crash_between_month_commit_and_day_clear(store, tmp_path, monkeypatch):
+    real_drop = analytics_store._drop_day
+
+    def crash(path):
+        raise KeyboardInterrupt("killed after the month file committed")
+
+    monkeypatch.setattr(analytics_store, "_drop_day", crash)
+    with pytest.raises(KeyboardInterrupt):
+        store.compact(now=LATER)
+    monkeypatch.setattr(analytics_store, "_drop_day", real_drop)
+    # The day file still holds its rows, but readers skip a day its month has marked
+    assert os.path.exists(tmp_path / "day-2024-03-05.db")
+    assert len(list(store.query())) == 6
+    assert store.topic_averages() == {"Algebra": 0.5, "Geometry": 1.0}
+
+    assert store.compact(now=LATER) == ["2024-03-05"]
+    assert _month_rows(tmp_path) == 6
+    assert not os.path.exists(tmp_path / "day-2024-03-05.db")
+
+
+def test_compact_crash_after_marker_skips_reinsert(store, tmp_path):
+    # A run that committed the month file but died before emptying the day file
+    conn = analytics_store._connect(str(tmp_path / "month-2024-03.db"))
+    conn.execute("CREATE TABLE compacted_days (day TEXT PRIMARY KEY, rows INTEGER NOT NULL, compacted_at REAL NOT NULL)")
+    conn.execute("ATTACH DATABASE ? AS src", (str(tmp_path / "day-2024-03-05.db"),))
+    conn.execute("INSERT INTO results SELECT * FROM src.results")
+    conn.execute("INSERT INTO compacted_days VALUES ('2024-03-05', 6, 0)")
+    conn.execute("DETACH DATABASE src")
+    conn.close()
+
+    assert store.compact(now=LATER) == ["2024-03-05"]
+    assert _month_rows(tmp_path) == 6
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("streamlit")  # the client module also holds the Streamlit session glue
+requests = pytest.importorskip("requests")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "frontend"))
+
+import api_client  # noqa: E402
+from api_client import ApiClient, build_session  # noqa: E402
+
+
+class _Resp:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self):
+        if self._data is None:
+            raise ValueError("no body")
+        return self._data
+
+
+class FakeSession:
+    """Replays queued responses (or raises queued exceptions) and records every call."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def _next(self, method, url, headers):
+        self.calls.append((method, url, headers))
+        item = self.responses.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def get(self, url, headers=None, timeout=None):
+        return self._next("GET", url, headers)
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        return self._next("POST", url, headers)
+
+
+def test_get_is_served_from_cache_then_revalidated(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(api_client.time, "monotonic", lambda: now[0])
+    session = FakeSession(_Resp(200, {"n": 1}, {"ETag": '"v1"'}), _Resp(304))
+    client = ApiClient(session, token="t", base="http://api")
+
+    assert client.get("/exam/me", ttl=30).json() == {"n": 1}
+    assert client.get("/exam/me", ttl=30).json() == {"n": 1}
+    assert len(session.calls) == 1
+    now[0] += 31
+    assert client.get("/exam/me", ttl=30).json() == {"n": 1}
+    assert session.calls[1][2] == {"Authorization": "Bearer t", "If-None-Match": '"v1"'}
+    assert client.stats == {"requests": 2, "cache_hits": 1, "not_modified": 1}
+
+
+def test_errors_are_not_cached_and_invalidate_drops_entries():
+    session = FakeSession(_Resp(429, {"detail": "slow down"}), _Resp(200, {"n": 1}), _Resp(200, {"n": 2}))
+    client = ApiClient(session, base="http://api")
+    assert client.get("/exam/1").status_code == 429
+    assert client.get("/exam/1").json() == {"n": 1}
+    client.invalidate("/exam/")
+    assert client.get("/exam/1").json() == {"n": 2}
+    assert client.get("/exam/1").json() == {"n": 2}
+    assert len(session.calls) == 3
+
+
+def test_post_retries_only_when_asked(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(api_client.time, "sleep", sleeps.append)
+    busy = _Resp(503, {"detail": "busy"}, {"Retry-After": "2"})
+
+    client = ApiClient(FakeSession(busy), base="http://api")
+    assert client.post("/exam/submit", json={}).status_code == 503
+    assert sleeps == []
+
+    session = FakeSession(requests.ConnectionError("reset"), busy, _Resp(200, {"exam_id": 1}))
+    client = ApiClient(session, base="http://api")
+    resp = client.post("/exam/generate", json={}, headers={"Idempotency-Key": "k"}, retries=2)
+    assert resp.status_code == 200 and resp.json() == {"exam_id": 1}
+    assert sleeps == [0.5, 2.0]
+    assert all(call[2]["Idempotency-Key"] == "k" for call in session.calls)
+
+
+def test_network_failure_is_a_503_response():
+    client = ApiClient(FakeSession(requests.Timeout("slow")), base="http://api")
+    assert client.get("/exam/me").status_code == 503
+
+
+def test_shared_session_pools_and_retries_only_idempotent_methods():
+    adapter = build_session(pool_size=7).get_adapter("https://api.example.com")
+    assert adapter._pool_maxsize == 7
+    assert "GET" in adapter.max_retries.allowed_methods
+    assert "POST" not in adapter.max_retries.allowed_methods
@@ -0,0 +1,78 @@
+import json
+
+from archive import archive_exams, sweep_unsubmitted
+from database import ARCHIVE_DB_URL, EXAMS_SHARD_URLS
+from ai_engine.storage import compress_text, connect_sqlite, decompress_text
+from tests.test_submit import _answers, _generate
+
+
+def _path(url):
+    return url.replace("sqlite:///", "")
+
+
+def _backdate(exam_id, created_at="2000-01-01 00:00:00"):
+    for url in EXAMS_SHARD_URLS:
+        conn = connect_sqlite(_path(url))
+        try:
+            conn.execute("UPDATE exams SET created_at = ? WHERE id = ?", (created_at, exam_id))
+        finally:
+            conn.close()
+
+
+def _stored(url, exam_id):
+    conn = connect_sqlite(_path(url))
+    try:
+        return conn.execute("SELECT questions_json, feedback_json FROM exams WHERE id = ?", (exam_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_long_text_is_compressed_and_short_or_legacy_text_passes_through():
+    text = json.dumps([{"question": "What is 2 + 2?", "options": {"A": "4"}}] * 20)
+    packed = compress_text(text)
+    assert isinstance(packed, bytes) and len(packed) < len(text)
+    assert decompress_text(packed) == text
+    assert compress_text("[]") == "[]"
+    assert decompress_text("[1]") == "[1]" and decompress_text(b"[1]") == "[1]"
+    assert compress_text(None) is None and decompress_text(None) is None
+
+
+def test_old_submitted_exams_move_to_the_archive_and_stay_readable(api, headers):
+    exam = _generate(api, headers, num_questions=10)
+    body = {"exam_id": exam["exam_id"], "questions": exam["questions"], "answers": _answers(exam["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    before = api.get(f"/exam/{exam['exam_id']}", headers=headers).json()
+    open_exam = _generate(api, headers, num_questions=6)
+    _backdate(exam["exam_id"])
+    _backdate(open_exam["exam_id"])
+
+    assert archive_exams(days=1)["moved"] == 1
+    assert all(_stored(url, exam["exam_id"]) is None for url in EXAMS_SHARD_URLS)
+    questions, feedback = _stored(ARCHIVE_DB_URL, exam["exam_id"])
+    assert isinstance(questions, bytes) and json.loads(decompress_text(questions)) == exam["questions"]
+    assert isinstance(feedback, bytes)
+
+    after = api.get(f"/exam/{exam['exam_id']}", headers=headers)
+    assert after.status_code == 200
+    assert {**after.json(), "created_at": None} == {**before, "created_at": None}
+    assert exam["exam_id"] in [e["id"] for e in api.get("/exam/me", headers=headers).json()]
+    assert archive_exams(days=1)["moved"] == 0  # unsubmitted exams are never archived
+
+
+def test_sweep_deletes_only_stale_unsubmitted_exams(api, headers):
+    # Distinct requests, or the idempotent replay would hand back the same open exam
+    stale, fresh, done = (_generate(api, headers, num_questions=n) for n in (4, 5, 6))
+    body = {"exam_id": done["exam_id"], "questions": done["questions"], "answers": _answers(done["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    listed = api.get("/exam/me", headers=headers)
+    _backdate(stale["exam_id"])
+    _backdate(done["exam_id"])
+
+    assert sweep_unsubmitted(hours=1)["deleted"] >= 1
+    assert api.get(f"/exam/{stale['exam_id']}", headers=headers).status_code == 404
+    assert api.get(f"/exam/{fresh['exam_id']}", headers=headers).status_code == 200
+    assert api.get(f"/exam/{done['exam_id']}", headers=headers).status_code == 200
+    # The user's cached list was invalidated along with the row
+    relisted = api.get("/exam/me", headers={**headers, "If-None-Match": listed.headers["ETag"]})
+    assert relisted.status_code == 200
+    assert stale["exam_id"] not in [e["id"] for e in relisted.json()]
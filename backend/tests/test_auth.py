@@ -0,0 +1,59 @@
+import pytest
+
+import auth
+from ai_engine.cache_backend import MemoryCache
+from tests.conftest import register
+
+
+class _RevokeOnFirstWrite(MemoryCache):
+    """Version store where a logout lands between a lookup's database read and its cache write."""
+
+    def __init__(self, user_id):
+        super().__init__()
+        self.user_id = user_id
+        self.pending = True
+
+    def _interleave(self):
+        if self.pending:
+            self.pending = False
+            auth.revoke_tokens(self.user_id)
+
+    def set(self, key, value, ttl=None):
+        self._interleave()
+        super().set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        self._interleave()
+        return super().add(key, value, ttl)
+
+
+@pytest.fixture
+def user(api):
+    h = register(api)
+    token = h["Authorization"].split()[1]
+    return auth.verify_token(token)[0], token, {"Authorization": h["Authorization"]}
+
+
+def test_revoke_during_version_lookup_is_not_overwritten(user, monkeypatch):
+    user_id, token, _ = user
+    monkeypatch.setattr(auth, "_versions", _RevokeOnFirstWrite(user_id))
+    assert auth.token_version(user_id) == 1
+    assert auth.token_version(user_id) == 1
+    assert auth.authenticate(token) is None
+
+
+def test_logout_revokes_every_token(api, user):
+    _, _, headers = user
+    assert api.get("/exam/me", headers=headers).status_code == 200
+    assert api.post("/auth/logout", headers=headers).status_code == 200
+    assert api.get("/exam/me", headers=headers).status_code == 401
+
+
+def test_password_change_issues_a_fresh_token(api, user):
+    _, _, headers = user
+    resp = api.post("/auth/password", headers=headers,
+                    json={"current_password": "correct horse", "new_password": "battery staple"})
+    assert resp.status_code == 200
+    assert api.get("/exam/me", headers=headers).status_code == 401
+    fresh = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    assert api.get("/exam/me", headers=fresh).status_code == 200
@@ -0,0 +1,75 @@
+import json
+
+from ai_engine import question_generator as qg
+from tests.test_question_stream import FakeStreamingClient, _body, _question
+
+
+class RecordingClient(FakeStreamingClient):
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        return super().create(**kwargs)
+
+
+def _offline(monkeypatch):
+    # Nothing cached or pooled, nothing retired: every topic has to be generated
+    monkeypatch.setattr(qg, "_load_openai_api_key", lambda: "sk-test")
+    monkeypatch.setattr(qg, "_cache_get", lambda key: None)
+    monkeypatch.setattr(qg, "_cache_set", lambda key, items: None)
+    monkeypatch.setattr(qg, "_bank_pool", lambda topic, difficulty, count: [])
+    monkeypatch.setattr(qg, "_bank_store", lambda questions, difficulty, source: None)
+    monkeypatch.setattr(qg, "filter_usable", lambda qs, difficulty=None: qs)
+
+
+def test_batch_prompt_asks_for_every_topic_and_groups_the_answer(monkeypatch):
+    fake = RecordingClient(_body([_question(1), _question(2), _question(3), _question(4, topic="Geometry"),
+                                  _question(5, topic="Calculus")]))
+    monkeypatch.setattr(qg, "_openai_client", lambda: fake)
+    grouped = qg._openai_generate_batch({"Algebra": 2, "Geometry": 1}, "hard")
+
+    user = json.loads(fake.kwargs["messages"][-1]["content"])
+    assert user["topics"] == {"Algebra": 2, "Geometry": 1}
+    assert user["num_questions"] == 3 and user["difficulty"] == "hard"
+    # A third Algebra question and an unrequested topic are not kept
+    assert {t: [q["id"] for q in qs] for t, qs in grouped.items()} == {"Algebra": ["q1", "q2"], "Geometry": ["q4"]}
+
+
+def test_exam_makes_one_call_for_all_topics_and_tops_up_only_the_shortfall(monkeypatch):
+    _offline(monkeypatch)
+    batches, singles = [], []
+
+    def batch(topic_counts, difficulty, priority=qg.PRIORITY_INTERACTIVE):
+        batches.append(dict(topic_counts))
+        return {"Algebra": [_question(i) for i in range(3)],
+                "Geometry": [_question(10, topic="Geometry")],
+                "Functions": []}
+
+    def single(topic, difficulty, num_questions, priority=qg.PRIORITY_INTERACTIVE):
+        singles.append((topic, num_questions))
+        return [_question(f"{topic}{i}", topic=topic) for i in range(num_questions)]
+
+    monkeypatch.setattr(qg, "_openai_generate_batch", batch)
+    monkeypatch.setattr(qg, "_openai_generate", single)
+    exam = qg.generate_exam(topics=["Algebra", "Geometry", "Functions"], num_questions=9, mode="ai")
+
+    assert batches == [{"Algebra": 3, "Geometry": 3, "Functions": 3}]
+    assert sorted(singles) == [("Functions", 3), ("Geometry", 2)]
+    assert len(exam["questions"]) == 9
+    assert [q["topic"] for q in exam["questions"]].count("Geometry") == 3
+
+
+def test_failed_batch_falls_back_to_one_call_per_topic(monkeypatch):
+    _offline(monkeypatch)
+    singles = []
+
+    def batch(topic_counts, difficulty, priority=qg.PRIORITY_INTERACTIVE):
+        raise TimeoutError("model timed out")
+
+    def single(topic, difficulty, num_questions, priority=qg.PRIORITY_INTERACTIVE):
+        singles.append((topic, num_questions))
+        return [_question(f"{topic}{i}", topic=topic) for i in range(num_questions)]
+
+    monkeypatch.setattr(qg, "_openai_generate_batch", batch)
+    monkeypatch.setattr(qg, "_openai_generate", single)
+    exam = qg.generate_exam(topics=["Algebra", "Geometry"], num_questions=4, mode="ai")
+    assert sorted(singles) == [("Algebra", 2), ("Geometry", 2)]
+    assert len(exam["questions"]) == 4
@@ -0,0 +1,58 @@
+from ai_engine.blueprint import build_variant, variant_seed
+from ai_engine.question_generator import _generate_question
+from tests.conftest import register
+from tests.test_submit import _answers
+
+
+def _key(q):
+    return q["options"][q["answer"]]
+
+
+def test_variant_keeps_each_answer_on_its_option_text():
+    questions = [_generate_question(t) for t in ("Algebra", "Geometry", "Functions", "Derivatives") * 3]
+    variant = build_variant(questions, seed=7)
+    by_id = {q["id"]: q for q in questions}
+    assert sorted(q["id"] for q in variant) == sorted(by_id)
+    for q in variant:
+        assert q["question"] == by_id[q["id"]]["question"]
+        assert sorted(q["options"].values()) == sorted(by_id[q["id"]]["options"].values())
+        assert _key(q) == _key(by_id[q["id"]])
+    assert build_variant(questions, seed=7) == variant
+    assert build_variant(questions, seed=8) != variant
+
+
+def test_variant_seed_is_stable_and_per_student():
+    assert variant_seed(3, 41) == variant_seed(3, 41)
+    assert len({variant_seed(3, user) for user in range(50)}) == 50
+    assert 0 <= variant_seed(3, 41) < 2 ** 63
+
+
+def test_class_exam_gives_each_student_their_own_variant(api, headers):
+    resp = api.post("/exam/blueprint", headers=headers, json={
+        "title": "Quiz 1", "topics": ["Algebra", "Geometry"], "mode": "deterministic", "num_questions": 8,
+    })
+    assert resp.status_code == 200, resp.text
+    blueprint = resp.json()
+    originals = {q["id"]: q for q in blueprint["questions"]}
+
+    students = [register(api) for _ in range(2)]
+    for s in students:
+        s.pop("email")
+    exams = [api.post("/exam/generate", headers=s, json={"blueprint_id": blueprint["blueprint_id"]}).json()
+             for s in students]
+    assert exams[0]["questions"] != exams[1]["questions"]
+    for exam in exams:
+        assert {q["id"]: _key(q) for q in exam["questions"]} == {i: _key(q) for i, q in originals.items()}
+
+    # Graded against the student's own variant, stored server side as a seed
+    stored = api.get(f"/exam/{exams[0]['exam_id']}", headers=students[0]).json()
+    assert stored["questions"] == exams[0]["questions"]
+    body = {"exam_id": exams[0]["exam_id"], "questions": exams[0]["questions"], "answers": _answers(exams[0]["questions"])}
+    assert api.post("/exam/submit", headers=students[0], json=body).json()["overall_accuracy"] == 100.0
+
+    results = api.get(f"/exam/blueprint/{blueprint['blueprint_id']}/results", headers=headers)
+    assert results.status_code == 200
+    assert [(r["exam_id"], r["submitted"], r["score"]) for r in results.json()["results"]] == [
+        (exams[0]["exam_id"], True, 100.0), (exams[1]["exam_id"], False, 0.0),
+    ]
+    assert api.get(f"/exam/blueprint/{blueprint['blueprint_id']}/results", headers=students[0]).status_code == 403
@@ -0,0 +1,249 @@
+import os
+import time
+import threading
+
+import pytest
+
+from ai_engine.cache_backend import (
+    INVALIDATION_CHANNEL, CacheBackend, MemoryCache, NamespacedCache, RedisCache, SQLiteCache, TwoTierCache,
+)
+from tests import wait_for
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    return SQLiteCache(str(tmp_path / "state.db"))
+
+
+def test_backends_must_implement_the_whole_interface():
+    class NoAdd(CacheBackend):
+        get = set = delete = incr = publish = subscribe = lambda self, *args: None
+
+    with pytest.raises(TypeError):
+        CacheBackend()
+    with pytest.raises(TypeError, match="add"):
+        NoAdd()
+    for cls in (MemoryCache, SQLiteCache, RedisCache, TwoTierCache, NamespacedCache):
+        assert not cls.__abstractmethods__
+
+
+# ---------------- RedisCache ----------------
+
+def test_redis_roundtrip(fake_redis):
+    cache = RedisCache(fake_redis.url)
+    assert cache.get("k") is None
+    cache.set("k", {"questions": [1, 2], "topic": "Ünicode"})
+    assert cache.get("k") == {"questions": [1, 2], "topic": "Ünicode"}
+    cache.delete("k")
+    assert cache.get("k") is None
+
+
+def test_redis_add_only_fills_missing_keys(fake_redis):
+    cache = RedisCache(fake_redis.url)
+    assert cache.add("k", 1, ttl=0.05)
+    assert not cache.add("k", 2)
+    assert cache.get("k") == 1
+    time.sleep(0.1)
+    assert cache.add("k", 3)
+    assert cache.get("k") == 3
+
+
+def test_redis_ttl(fake_redis):
+    cache = RedisCache(fake_redis.url)
+    cache.set("short", 1, ttl=0.05)
+    cache.set("long", 2, ttl=60)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_redis_incr_is_atomic(fake_redis):
+    cache = RedisCache(fake_redis.url)
+
+    def bump():
+        for _ in range(50):
+            cache.incr("n")
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.get("n") == 200
+
+
+def test_redis_selects_db_from_url(fake_redis):
+    a = RedisCache(fake_redis.url)
+    b = RedisCache(fake_redis.url.rsplit("/", 1)[0] + "/3")
+    a.set("k", "db0")
+    assert b.get("k") is None
+    b.set("k", "db3")
+    assert a.get("k") == "db0"
+
+
+def test_redis_reuses_pooled_connections(fake_redis):
+    cache = RedisCache(fake_redis.url)
+    for i in range(20):
+        cache.set(f"k{i}", i)
+    assert len(cache._pool) == 1
+
+
+def test_redis_drops_broken_connection(fake_redis):
+    cache = RedisCache(fake_redis.url)
+    cache.set("k", 1)
+    fake_redis.drop_connections()
+    with pytest.raises(ConnectionError):
+        cache.get("k")
+    assert cache._pool == []
+    assert cache.get("k") == 1
+
+
+def test_redis_subscriber_reconnects(fake_redis):
+    cache = RedisCache(fake_redis.url)
+    received = []
+    cache.subscribe("chan", received.append)
+    assert wait_for(lambda: fake_redis.subscribers("chan") == 1)
+    fake_redis.drop_connections()
+    assert wait_for(lambda: fake_redis.subscribers("chan") == 0)
+    assert wait_for(lambda: fake_redis.subscribers("chan") == 1)  # resubscribed after its backoff
+    cache.publish("chan", "after")
+    assert wait_for(lambda: received == ["after"])
+
+
+def test_redis_pubsub(fake_redis):
+    cache = RedisCache(fake_redis.url)
+    received = []
+    cache.subscribe("chan", received.append)
+    assert wait_for(lambda: fake_redis.subscribers("chan") == 1)
+    cache.publish("chan", "hello")
+    assert wait_for(lambda: received == ["hello"])
+
+
+# ---------------- TwoTierCache ----------------
+
+def _nodes(shared_factory, n=2):
+    return [TwoTierCache(shared_factory(), MemoryCache()) for _ in range(n)]
+
+
+def test_two_tier_invalidates_other_nodes_over_redis(fake_redis):
+    a, b = _nodes(lambda: RedisCache(fake_redis.url))
+    assert wait_for(lambda: fake_redis.subscribers(INVALIDATION_CHANNEL) == 2)
+
+    a.set("k", "v1")
+    assert b.get("k") == "v1"  # now cached in b's local tier
+    assert b.get("k") == "v1"
+    assert b.stats["local_hits"] == 1
+
+    a.set("k", "v2")
+    assert wait_for(lambda: b.local.get("k") is None)
+    assert b.get("k") == "v2"
+
+    a.delete("k")
+    assert wait_for(lambda: b.local.get("k") is None)
+    assert b.get("k") is None
+
+
+def test_two_tier_keeps_own_write_local(fake_redis):
+    (a,) = _nodes(lambda: RedisCache(fake_redis.url), n=1)
+    assert wait_for(lambda: fake_redis.subscribers(INVALIDATION_CHANNEL) == 1)
+    a.set("k", "v")
+    time.sleep(0.05)  # its own broadcast comes back and must be ignored
+    assert a.local.get("k") == "v"
+
+
+def test_two_tier_incr_invalidates(fake_redis):
+    a, b = _nodes(lambda: RedisCache(fake_redis.url))
+    assert wait_for(lambda: fake_redis.subscribers(INVALIDATION_CHANNEL) == 2)
+    assert a.incr("version") == 1
+    assert b.get("version") == 1
+    assert a.incr("version") == 2
+    assert wait_for(lambda: b.get("version") == 2)
+
+
+def test_two_tier_add_yields_to_another_nodes_value(fake_redis):
+    a, b = _nodes(lambda: RedisCache(fake_redis.url))
+    b.local.set("k", "stale")
+    a.set("k", "new")
+    assert not b.add("k", "old")
+    assert b.get("k") == "new"
+
+
+def test_two_tier_invalidates_over_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQLiteCache, "POLL_INTERVAL_S", 0.02)
+    path = str(tmp_path / "state.db")
+    a, b = _nodes(lambda: SQLiteCache(path))
+    time.sleep(0.1)  # pollers start from the newest event
+    a.set("k", "v1")
+    assert b.get("k") == "v1"
+    a.set("k", "v2")
+    assert wait_for(lambda: b.get("k") == "v2")
+
+
+# ---------------- SQLiteCache ----------------
+
+def test_sqlite_roundtrip_and_ttl(sqlite_cache):
+    sqlite_cache.set("k", {"a": [1, 2]})
+    sqlite_cache.set("short", 1, ttl=0.05)
+    assert sqlite_cache.get("k") == {"a": [1, 2]}
+    time.sleep(0.1)
+    assert sqlite_cache.get("short") is None
+    sqlite_cache.delete("k")
+    assert sqlite_cache.get("k") is None
+
+
+@pytest.mark.parametrize("make", [MemoryCache, lambda: SQLiteCache(":memory:")], ids=["memory", "sqlite"])
+def test_add_only_fills_missing_or_expired_keys(make):
+    cache = make()
+    assert cache.add("k", 1, ttl=0.05)
+    assert not cache.add("k", 2)
+    assert cache.get("k") == 1
+    time.sleep(0.1)
+    assert cache.add("k", 3)
+    assert not cache.add("k", 4)
+    assert cache.get("k") == 3
+
+
+def test_sqlite_incr_across_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    caches = [SQLiteCache(path) for _ in range(4)]
+
+    def bump(cache):
+        for _ in range(25):
+            cache.incr("n")
+
+    threads = [threading.Thread(target=bump, args=(c,)) for c in caches]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert caches[0].get("n") == 100
+
+
+def _rows(cache):
+    return cache._db().execute("SELECT key FROM cache ORDER BY key").fetchall()
+
+
+def test_sqlite_purges_expired_keys_never_read_again(sqlite_cache):
+    sqlite_cache.set("idem-1", {"status": 200}, ttl=0.05)
+    sqlite_cache.set("keep", 1)
+    time.sleep(0.1)
+    assert sqlite_cache.purge_expired() == 1
+    assert _rows(sqlite_cache) == [("keep",)]
+
+
+def test_sqlite_writes_purge_at_most_once_per_interval(sqlite_cache):
+    sqlite_cache.set("a", 1, ttl=0.05)  # first write sweeps and schedules the next sweep
+    time.sleep(0.1)
+    sqlite_cache.set("b", 2)
+    assert ("a",) in _rows(sqlite_cache)  # not yet due
+
+    sqlite_cache._next_purge = 0.0
+    sqlite_cache.set("c", 3)
+    assert _rows(sqlite_cache) == [("b",), ("c",)]
+
+
+def test_sqlite_shared_file(tmp_path):
+    path = str(tmp_path / "state.db")
+    SQLiteCache(path).set("k", "v")
+    assert SQLiteCache(path).get("k") == "v"
+    assert os.path.exists(path)
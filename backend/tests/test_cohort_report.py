@@ -0,0 +1,89 @@
+import json
+import sqlite3
+
+import pytest
+
+from ai_engine.blueprint import build_variant
+from ai_engine.cohort_report import build_report, load_report, write_report
+from ai_engine.storage import compress_text
+
+ALGEBRA = {"id": "a1", "topic": "Algebra", "question": "Solve x + 1 = 2. " + "Show your steps. " * 20,
+           "options": {"A": "1", "B": "2", "C": "3", "D": "4"}, "answer": "A"}
+GEOMETRY = {"id": "g1", "topic": "Geometry", "question": "How many sides has a square?",
+            "options": {"A": "3", "B": "4", "C": "5", "D": "6"}, "answer": "B"}
+
+
+def _exams_db(path, rows, blueprints=()):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE exams (id INTEGER PRIMARY KEY, user_id INTEGER, created_at TEXT, score REAL,"
+                 " questions_json, answers_json TEXT, blueprint_id INTEGER, variant_seed INTEGER)")
+    conn.execute("CREATE TABLE exam_blueprints (id INTEGER PRIMARY KEY, questions_json TEXT)")
+    conn.executemany("INSERT INTO exams VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany("INSERT INTO exam_blueprints VALUES (?, ?)", blueprints)
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def history(tmp_path):
+    """Five graded exams over two shards and the archive, one class exam, one unsubmitted exam."""
+    variant = build_variant([ALGEBRA, GEOMETRY], 5)
+    both = json.dumps([ALGEBRA, GEOMETRY])
+    _exams_db(tmp_path / "exams.db", [
+        (1, 1, "2024-03-04 10:00:00", 100.0, both, json.dumps({"a1": "A", "g1": "B"}), None, None),
+        (2, 1, "2024-03-06 10:00:00", 50.0, compress_text(both), json.dumps({"a1": "A", "g1": "C"}), None, None),
+        (3, 2, "2024-03-07 10:00:00", 0.0, both, "{}", None, None),
+        (4, 2, "2024-03-12 10:00:00", 100.0, None, json.dumps({q["id"]: q["answer"] for q in variant}), 1, 5),
+    ], blueprints=[(1, both)])
+    _exams_db(tmp_path / "exams-1.db", [
+        (5, 2, "2024-03-13 10:00:00", 0.0, json.dumps([ALGEBRA]), json.dumps({"a1": "B"}), None, None),
+    ])
+    _exams_db(tmp_path / "archive.db", [
+        (6, 1, "2024-02-26 10:00:00", 100.0, json.dumps([GEOMETRY]), json.dumps({"g1": "B"}), None, None),
+    ])
+    conn = sqlite3.connect(tmp_path / "users.db")
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, created_at TEXT)")
+    conn.executemany("INSERT INTO users VALUES (?, ?)", [(1, "2024-01-15 09:00:00"), (2, "2024-02-03 09:00:00")])
+    conn.commit()
+    conn.close()
+    return tmp_path
+
+
+def _build(history, chunk):
+    report = build_report(str(history / "exams.db"), str(history / "users.db"), workers=1, chunk=chunk,
+                          archive_path=str(history / "archive.db"), shards=2)
+    report.pop("generated_at")
+    return report
+
+
+def test_report_over_shards_archive_and_class_exams(history):
+    report = _build(history, chunk=100)
+    assert (report["exams"], report["answers"]) == (5, 8)
+    assert report["topics"] == {"Algebra": {"answers": 4, "accuracy": 75.0}, "Geometry": {"answers": 4, "accuracy": 75.0}}
+    assert report["weekly"] == [
+        {"week": "2024-02-26", "exams": 1, "avg_score": 100.0, "answers": 1, "accuracy": 100.0},
+        {"week": "2024-03-04", "exams": 2, "avg_score": 75.0, "answers": 4, "accuracy": 75.0},
+        {"week": "2024-03-11", "exams": 2, "avg_score": 50.0, "answers": 3, "accuracy": 66.67},
+    ]
+    assert report["cohorts"] == {
+        "2024-01": {"exams": 3, "avg_score": 83.33, "score_std": 23.57,
+                    "topic_accuracy": {"Algebra": 100.0, "Geometry": 66.67}},
+        "2024-02": {"exams": 2, "avg_score": 50.0, "score_std": 50.0,
+                    "topic_accuracy": {"Algebra": 50.0, "Geometry": 100.0}},
+    }
+    counts = report["score_histogram"]["counts"]
+    assert (counts[0], counts[10], counts[-1], sum(counts)) == (1, 1, 3, 5)
+
+
+def test_chunk_size_does_not_change_the_report(history):
+    assert _build(history, chunk=1) == _build(history, chunk=100)
+
+
+def test_empty_history_and_report_roundtrip(tmp_path):
+    report = build_report(str(tmp_path / "missing.db"), str(tmp_path / "users.db"), workers=1,
+                          archive_path=None, shards=1)
+    assert (report["exams"], report["answers"], report["weekly"]) == (0, 0, [])
+    path = str(tmp_path / "out" / "report.json")
+    write_report(report, path)
+    assert load_report(path) == report
+    assert load_report(str(tmp_path / "none.json")) is None
@@ -0,0 +1,52 @@
+import exam_cache
+import serialization
+from exam_cache import _ResponseCache
+from tests.test_submit import _answers, _generate
+
+
+def test_etag_revalidates_until_the_user_changes_something(api, headers):
+    exam = _generate(api, headers)
+    first = api.get(f"/exam/{exam['exam_id']}", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    again = api.get(f"/exam/{exam['exam_id']}", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag and not again.content
+
+    body = {"exam_id": exam["exam_id"], "questions": exam["questions"], "answers": _answers(exam["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    after = api.get(f"/exam/{exam['exam_id']}", headers={**headers, "If-None-Match": etag})
+    assert after.status_code == 200 and after.headers["etag"] != etag
+
+
+def test_compressed_representation_has_its_own_etag(api, headers, monkeypatch):
+    monkeypatch.setattr(serialization, "COMPRESS_MIN_BYTES", 0)
+    _generate(api, headers)
+    plain = api.get("/exam/me", headers={**headers, "Accept-Encoding": "identity"})
+    gzipped = api.get("/exam/me", headers={**headers, "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in plain.headers
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["etag"] != plain.headers["etag"]
+    assert gzipped.json() == plain.json()
+
+
+def test_response_cache_is_bounded_by_bytes():
+    cache = _ResponseCache(max_bytes=1000)
+    for i in range(5):
+        cache.set(f"k{i}", (1, "d", b"x" * 300, {}))
+    assert len(cache) == 3 and cache.bytes == 900
+    assert cache.get("k0") is None and cache.get("k4") is not None
+
+    # Compressed forms count too, and push out the least recently used entry
+    entry = cache.get("k2")
+    cache.add_encoding("k2", entry, "gzip", b"z" * 200)
+    assert cache.bytes <= 1000
+    assert cache.get("k3") is None and cache.get("k2") is entry
+
+
+def test_versions_bypass_the_near_cache(monkeypatch):
+    from ai_engine import cache_backend
+    from ai_engine.cache_backend import MemoryCache, TwoTierCache
+
+    monkeypatch.setattr(cache_backend, "_backend", TwoTierCache(MemoryCache()))
+    monkeypatch.setattr(exam_cache, "_versions", None)
+    assert exam_cache._version_store().backend is cache_backend._backend.shared
@@ -0,0 +1,43 @@
+import pytest
+
+from serialization import negotiate_encoding
+from tests.test_submit import _answers, _generate
+
+
+def test_v2_detail_refers_to_questions_by_id(api, headers):
+    exam = _generate(api, headers)
+    unsubmitted = api.get(f"/v2/exam/{exam['exam_id']}", headers=headers).json()
+    assert unsubmitted["questions"] == exam["questions"] and unsubmitted["feedback"] == []
+
+    answers = _answers(exam["questions"])
+    wrong = exam["questions"][0]["id"]
+    answers[wrong] = next(k for k in exam["questions"][0]["options"] if k != exam["questions"][0]["answer"])
+    body = {"exam_id": exam["exam_id"], "questions": exam["questions"], "answers": answers}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+
+    detail = api.get(f"/v2/exam/{exam['exam_id']}", headers=headers).json()
+    assert detail["submitted"] and detail["answers"] == answers
+    assert detail["feedback"] == [{"id": q["id"], "is_correct": q["id"] != wrong} for q in exam["questions"]]
+    listed = api.get("/v2/exam/me", headers=headers).json()
+    assert all("feedback" not in item for item in listed)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=0.0, deflate", None),
+    ("GZIP; q=0.5", "gzip"),
+    ("*", "gzip"),
+    ("*, gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_encoding_honours_q_values(header, expected, monkeypatch):
+    import serialization
+
+    monkeypatch.setattr(serialization, "brotli", None)
+    assert negotiate_encoding(header, 10_000) == expected
+
+
+def test_negotiate_encoding_skips_small_bodies():
+    assert negotiate_encoding("gzip", 10) is None
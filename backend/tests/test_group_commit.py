@@ -0,0 +1,86 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import group_commit
+from database import Exam, ExamsSession
+
+
+def _exam(user_id: int, submitted: bool = False) -> int:
+    session = ExamsSession(user_id)
+    try:
+        row = Exam(user_id=user_id, created_at=datetime.utcnow(), questions_json="[]", answers_json="{}",
+                   score=0.0, topic_stats_json="{}", submitted=submitted)
+        session.add(row)
+        session.commit()
+        return row.id
+    finally:
+        session.close()
+
+
+def _row(user_id: int, exam_id: int) -> Exam:
+    session = ExamsSession(user_id)
+    try:
+        return session.query(Exam).filter(Exam.id == exam_id).first()
+    finally:
+        session.close()
+
+
+def _values(score: float) -> dict:
+    return {"answers_json": json.dumps({"q1": "A"}), "score": score, "submitted": True}
+
+
+def _submit_together(submissions):
+    async def run():
+        return await asyncio.gather(
+            *(group_commit.write_submission(uid, eid, _values(score), {"Algebra": score})
+              for uid, eid, score in submissions),
+            return_exceptions=True,
+        )
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def users(api):
+    # The api fixture created the schema; ids far from the ones registered users get
+    return [900001, 900002, 900003]
+
+
+def test_batch_commits_every_submission(users):
+    exams = [(uid, _exam(uid), 50.0 + i) for i, uid in enumerate(users)]
+    before = group_commit.group_commit_stats()["batches"]
+    assert _submit_together(exams) == [None, None, None]
+    assert group_commit.group_commit_stats()["batches"] == before + 1
+    for uid, eid, score in exams:
+        row = _row(uid, eid)
+        assert row.submitted and row.score == score
+
+
+def test_one_missing_exam_does_not_fail_the_batch(users):
+    good = [(users[0], _exam(users[0]), 80.0), (users[1], _exam(users[1]), 90.0)]
+    results = _submit_together([good[0], (users[2], 10**9, 10.0), good[1]])
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 404
+    for uid, eid, score in good:
+        assert _row(uid, eid).score == score
+
+
+def test_same_exam_twice_in_a_batch_lands_once(users):
+    uid = users[0]
+    eid = _exam(uid)
+    results = _submit_together([(uid, eid, 70.0), (uid, eid, 20.0)])
+    assert results[0] is None
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 409
+    assert _row(uid, eid).score == 70.0
+
+
+def test_submitted_exam_is_not_overwritten(users):
+    uid = users[1]
+    eid = _exam(uid, submitted=True)
+    (result,) = _submit_together([(uid, eid, 5.0)])
+    assert isinstance(result, HTTPException) and result.status_code == 409
+    assert _row(uid, eid).score == 0.0
@@ -0,0 +1,87 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import request_key, run_once
+from tests.test_submit import _answers
+
+BODY = {"topics": ["Algebra"], "mode": "deterministic", "num_questions": 3}
+
+
+def _post(api, headers, body=BODY, key=None):
+    extra = {"Idempotency-Key": key} if key else {}
+    return api.post("/exam/generate", json=body, headers={**headers, **extra})
+
+
+def test_repeated_key_replays_the_same_exam(api, headers):
+    key = uuid.uuid4().hex
+    first = _post(api, headers, key=key)
+    again = _post(api, headers, key=key)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert _post(api, headers, body={**BODY, "num_questions": 4}, key=key).status_code == 422
+
+
+def test_submitted_exam_is_not_replayed(api, headers):
+    first = _post(api, headers).json()
+    assert _post(api, headers).json()["exam_id"] == first["exam_id"]  # same body, no key
+    body = {"exam_id": first["exam_id"], "questions": first["questions"], "answers": _answers(first["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    fresh = _post(api, headers)
+    assert fresh.json()["exam_id"] != first["exam_id"]
+    assert "Idempotent-Replayed" not in fresh.headers
+
+
+def _key():
+    return request_key("test", 1, uuid.uuid4().hex, {"n": 1})
+
+
+async def _valid(response):
+    return True
+
+
+def test_concurrent_duplicates_share_one_execution():
+    key, fingerprint = _key()
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"exam_id": 7}
+
+    async def run():
+        return await asyncio.gather(*(run_once(key, fingerprint, produce, _valid) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+    assert all(response == {"exam_id": 7} for response, _ in results)
+
+
+def test_failure_reaches_joined_duplicates_and_is_not_kept():
+    key, fingerprint = _key()
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise HTTPException(status_code=503, detail="busy")
+
+    async def ok():
+        return {"exam_id": 8}
+
+    async def run():
+        return await asyncio.gather(*(run_once(key, fingerprint, fail, _valid) for _ in range(2)),
+                                    return_exceptions=True)
+
+    assert [e.status_code for e in asyncio.run(run())] == [503, 503]
+    assert asyncio.run(run_once(key, fingerprint, ok, _valid)) == ({"exam_id": 8}, False)
+
+
+def test_key_is_scoped_to_the_user():
+    a, fp_a = request_key("generate", 1, "k", {"n": 1})
+    b, fp_b = request_key("generate", 2, "k", {"n": 1})
+    assert a != b and fp_a == fp_b
+    assert request_key("generate", 1, None, {"n": 1}) != request_key("generate", 1, None, {"n": 2})
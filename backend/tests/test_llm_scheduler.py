@@ -0,0 +1,74 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from ai_engine.llm_scheduler import (
+    PRIORITY_FEEDBACK, PRIORITY_INTERACTIVE, PRIORITY_REFILL, LLMScheduler, SchedulerBusy, TokenBucket,
+)
+from tests import wait_for
+
+
+def _hold(scheduler):
+    """Occupy the scheduler's only slot until the returned event is set."""
+    release = threading.Event()
+    holder = threading.Thread(target=scheduler.run, args=(release.wait,))
+    holder.start()
+    assert wait_for(lambda: scheduler.stats()["active"] == 1)
+    return release, holder
+
+
+def test_waiting_calls_run_in_priority_order():
+    scheduler = LLMScheduler(rpm=6000, tpm=10 ** 6, max_concurrency=1)
+    release, holder = _hold(scheduler)
+    order = []
+    threads = []
+    for name, priority in [("feedback", PRIORITY_FEEDBACK), ("refill", PRIORITY_REFILL),
+                           ("interactive", PRIORITY_INTERACTIVE), ("refill-2", PRIORITY_REFILL)]:
+        t = threading.Thread(target=scheduler.run, args=(lambda n=name: order.append(n),), kwargs={"priority": priority})
+        t.start()
+        threads.append(t)
+        assert wait_for(lambda n=len(threads): scheduler.stats()["queued"] == n)
+    release.set()
+    for t in [holder, *threads]:
+        t.join()
+    # Equal priorities keep arrival order
+    assert order == ["interactive", "refill", "refill-2", "feedback"]
+
+
+def test_full_queue_sheds_immediately():
+    scheduler = LLMScheduler(rpm=6000, tpm=10 ** 6, max_concurrency=1, max_queue=1)
+    release, holder = _hold(scheduler)
+    waiter = threading.Thread(target=scheduler.run, args=(lambda: None,))
+    waiter.start()
+    assert wait_for(lambda: scheduler.stats()["queued"] == 1)
+    with pytest.raises(SchedulerBusy):
+        scheduler.run(lambda: None, max_wait=5)
+    release.set()
+    holder.join()
+    waiter.join()
+    assert scheduler.stats()["shed_queue_full"] == 1
+
+
+def test_call_waiting_past_its_deadline_is_shed():
+    scheduler = LLMScheduler(rpm=1, tpm=10 ** 6)
+    scheduler.run(lambda: None)  # spends the only request this minute
+    with pytest.raises(SchedulerBusy):
+        scheduler.run(lambda: None, max_wait=0.05)
+    stats = scheduler.stats()
+    assert stats["shed_timeout"] == 1 and stats["queued"] == 0
+
+
+def test_token_estimate_is_settled_against_actual_usage():
+    scheduler = LLMScheduler(rpm=6000, tpm=10000)
+    scheduler.run(lambda: SimpleNamespace(usage=SimpleNamespace(total_tokens=300)), est_tokens=2000)
+    # Charged what the call used, not what was reserved for it
+    assert 9690 <= scheduler.tokens.tokens <= 9710
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_sec=10, capacity=20)
+    assert bucket.wait_time(20, now=bucket.updated) == 0
+    bucket.take(20)
+    assert bucket.wait_time(5, now=bucket.updated) == pytest.approx(0.5)
+    assert bucket.wait_time(5, now=bucket.updated + 0.5) == 0
@@ -0,0 +1,59 @@
+import json
+import sqlite3
+
+import pytest
+
+from ai_engine import item_stats, mastery
+from ai_engine.question_bank import question_fingerprint
+
+HARD = {"id": "q1", "topic": "Algebra", "question": "Solve x^2 = -1 over R", "answer": "A", "options": {"A": "none"}}
+EASY = {"id": "q2", "topic": "Algebra", "question": "1 + 1", "answer": "B", "options": {"B": "2"}}
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(item_stats, "BANK_PATH", str(tmp_path / "bank.db"))
+    monkeypatch.setattr(mastery, "MASTERY_PATH", str(tmp_path / "mastery.db"))
+    exams = str(tmp_path / "exams.db")
+    conn = sqlite3.connect(exams)
+    conn.execute("CREATE TABLE exams (id INTEGER PRIMARY KEY, user_id INTEGER, questions_json TEXT,"
+                 " answers_json TEXT, created_at TEXT)")
+    conn.execute("INSERT INTO exams VALUES (1, 7, ?, ?, '2024-01-01')",
+                 (json.dumps([HARD, EASY]), json.dumps({"q1": "A", "q2": "C"})))
+    conn.commit()
+    conn.close()
+    return exams, str(tmp_path / "archive.db")
+
+
+def _calibrate(q, p_value, n=100):
+    item_stats._connect().execute(
+        "INSERT INTO item_stats (fingerprint, topic, n, n_correct, p_value, retired) VALUES (?, ?, ?, ?, ?, 0)",
+        (question_fingerprint(q), q["topic"], n, int(n * p_value), p_value),
+    )
+
+
+def _theta():
+    return mastery._connect().execute("SELECT theta FROM mastery WHERE user_id = 7").fetchone()[0]
+
+
+def test_rebuild_matches_submit_path(paths):
+    _calibrate(HARD, 0.1)
+    _calibrate(EASY, 0.9)
+    assert mastery.rebuild_from_exams(*paths, shards=1) == 1
+    rebuilt = _theta()
+
+    stats = item_stats.lookup([HARD, EASY])
+    b_hard, b_easy = (item_stats.item_difficulty_b(stats[question_fingerprint(q)]) for q in (HARD, EASY))
+    mastery._connect().execute("DELETE FROM mastery")
+    mastery.update_mastery(7, [("Algebra", True, b_hard), ("Algebra", False, b_easy)])
+    assert rebuilt == pytest.approx(_theta())
+
+
+def test_rebuild_uses_item_difficulty(paths):
+    mastery.rebuild_from_exams(*paths, shards=1)
+    uncalibrated = _theta()
+    _calibrate(HARD, 0.1)
+    _calibrate(EASY, 0.9)
+    mastery.rebuild_from_exams(*paths, shards=1)
+    # Right on a hard item and wrong on an easy one moves theta further up
+    assert _theta() > uncalibrated
@@ -0,0 +1,50 @@
+import auth
+import passwords
+from tests.conftest import register
+
+
+def _rounds(password_hash):
+    return int(password_hash.split("$")[2])
+
+
+def test_hash_and_verify():
+    h = passwords.hash_password("s3cret")
+    assert _rounds(h) == passwords.PASSWORD_ROUNDS
+    assert passwords.verify_password("s3cret", h) == (True, None)
+    assert passwords.verify_password("wrong", h) == (False, None)
+    assert passwords.verify_password("s3cret", "not a hash") == (False, None)
+
+
+def test_changed_work_factor_yields_an_updated_hash(monkeypatch):
+    h = passwords.hash_password("s3cret")
+    monkeypatch.setattr(passwords, "PASSWORD_ROUNDS", passwords.PASSWORD_ROUNDS + 500)
+    ok, new_hash = passwords.verify_password("s3cret", h)
+    assert ok and _rounds(new_hash) == passwords.PASSWORD_ROUNDS
+    assert passwords.verify_password("s3cret", new_hash) == (True, None)
+
+
+def test_login_rehashes_with_the_current_work_factor(api, monkeypatch):
+    email = register(api)["email"]
+    old = auth._user_by(email=email).password_hash
+    monkeypatch.setattr(passwords, "PASSWORD_ROUNDS", _rounds(old) + 500)
+
+    resp = api.post("/auth/login", json={"email": email, "password": "correct horse"})
+    assert resp.status_code == 200
+    new = auth._user_by(email=email).password_hash
+    assert new != old and _rounds(new) == passwords.PASSWORD_ROUNDS
+    # The next login verifies against the new hash and leaves it alone
+    assert api.post("/auth/login", json={"email": email, "password": "correct horse"}).status_code == 200
+    assert auth._user_by(email=email).password_hash == new
+    assert api.post("/auth/login", json={"email": email, "password": "wrong"}).status_code == 401
+
+
+def test_hashes_in_the_process_pool(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_WORKERS", 1)
+    monkeypatch.setattr(passwords, "_pool", None)
+    try:
+        passwords.warm_up()
+        assert passwords._pool is not None
+        h = passwords.hash_password("s3cret")
+        assert passwords.verify_password("s3cret", h) == (True, None)
+    finally:
+        passwords.shutdown()
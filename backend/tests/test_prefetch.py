@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import prefetch
+from ai_engine.cache_backend import MemoryCache
+from auth import decode_access_token
+from tests import wait_for
+from tests.test_submit import _answers, _generate
+
+
+def test_next_exam_is_built_after_submit_and_served_once(api, headers):
+    user_id = int(decode_access_token(headers["Authorization"].split()[1])["sub"])
+    first = _generate(api, headers, num_questions=5)
+    body = {"exam_id": first["exam_id"], "questions": first["questions"], "answers": _answers(first["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    assert wait_for(lambda: prefetch._cache().get(f"slot:{user_id}") is not None)
+    slot = prefetch._cache().get(f"slot:{user_id}")
+
+    hits = prefetch.prefetch_stats()["hits"]
+    second = _generate(api, headers, num_questions=5)
+    assert second["exam_id"] != first["exam_id"]
+    assert second["questions"] == slot["exam"]["questions"]
+    assert prefetch.prefetch_stats()["hits"] == hits + 1
+    assert prefetch._cache().get(f"slot:{user_id}") is None
+    # Stored like any generated exam, so it can be graded
+    body = {"exam_id": second["exam_id"], "questions": second["questions"], "answers": _answers(second["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).json()["overall_accuracy"] == 100.0
+
+
+@pytest.fixture
+def store(monkeypatch):
+    # The API's speculation after an earlier submit holds the only build slot until it is done
+    assert wait_for(lambda: prefetch._running == 0)
+    store = MemoryCache()
+    monkeypatch.setattr(prefetch, "_store", store)
+    return store
+
+
+def _speculate(build):
+    async def run():
+        before = set(prefetch._tasks)  # the API's own speculation runs on another loop
+        prefetch.speculate(1, build)
+        await asyncio.gather(*(prefetch._tasks - before))
+
+    asyncio.run(run())
+
+
+async def _exam(params):
+    return {"questions": [{"id": "q1"}], "mode": "deterministic", "params": params}
+
+
+def test_slot_only_serves_the_parameters_it_was_built_for(store):
+    prefetch.remember(1, {"num_questions": 5})
+    _speculate(_exam)
+    assert prefetch.take(1, {"num_questions": 6}) is None
+    assert prefetch.take(1, {"num_questions": 5})["params"] == {"num_questions": 5}
+    assert prefetch.take(1, {"num_questions": 5}) is None
+
+
+def test_nothing_is_built_without_a_remembered_request_or_when_busy(store, monkeypatch):
+    built = []
+
+    async def build(params):
+        built.append(params)
+        return await _exam(params)
+
+    _speculate(build)
+    prefetch.remember(1, {"num_questions": 5})
+    busy = SimpleNamespace(max_concurrency=4, stats=lambda: {"queued": 1, "active": 0})
+    monkeypatch.setattr(prefetch, "get_scheduler", lambda: busy)
+    skipped = prefetch.prefetch_stats()["skipped_busy"]
+    _speculate(build)
+    assert built == [] and prefetch.prefetch_stats()["skipped_busy"] == skipped + 1
+
+
+def test_failed_build_leaves_no_slot(store):
+    async def build(params):
+        raise TimeoutError("model timed out")
+
+    prefetch.remember(1, {"num_questions": 5})
+    failed = prefetch.prefetch_stats()["failed"]
+    _speculate(build)
+    assert prefetch.prefetch_stats()["failed"] == failed + 1
+    assert prefetch.prefetch_stats()["running"] == 0
+    assert store.get("slot:1") is None
@@ -0,0 +1,68 @@
+import pytest
+
+from ai_engine import question_bank
+from ai_engine.question_bank import QuestionBank, question_fingerprint
+
+
+def _q(i, stem, topic="Derivatives", options=("1", "2", "3", "4")):
+    return {"id": f"b{i}", "topic": topic, "question": stem,
+            "options": dict(zip("ABCD", options)), "answer": "A"}
+
+
+STEMS = [
+    ("Derivatives", "Use the chain rule to differentiate sin(3x)"),
+    ("Derivatives", "Apply the chain rule to find the derivative of (2x + 1)^5"),
+    ("Derivatives", "Find the derivative of x^3 using the power rule"),
+    ("Derivatives", "Differentiate x * e^x with the product rule"),
+    ("Integrals", "Integrate 2x from 0 to 3"),
+    ("Integrals", "Use substitution to integrate 2x cos(x^2)"),
+    ("Geometry", "Find the area of a triangle with base 4 and height 6"),
+]
+
+
+@pytest.fixture
+def bank(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.db"))
+    bank.add_questions([_q(i, stem, topic) for i, (topic, stem) in enumerate(STEMS)], difficulty="medium", source="ai")
+    return bank
+
+
+def test_same_question_is_stored_once(bank):
+    again = _q(99, STEMS[0][1], options=("4", "3", "2", "1"))  # new id, shuffled options
+    bank.add_questions([again], difficulty="medium", source="ai")
+    assert bank.count("Derivatives") == 4
+    assert bank.count("Derivatives", source="template") == 0
+
+
+def test_search_ranks_by_subtopic_and_filters(bank):
+    hits = bank.search("chain rule", topics=["Derivatives"], k=2)
+    assert {q["id"] for q in hits} == {"b0", "b1"}
+    assert bank.search("chain rule", topics=["Geometry"]) == []
+    assert bank.search("chain rule", difficulty="hard") == []
+    assert {q["id"] for q in bank.search("integrate", k=2)} == {"b4", "b5"}
+    assert "b0" not in {q["id"] for q in bank.search("chain rule", exclude=[question_fingerprint(_q(0, STEMS[0][1]))])}
+
+
+def test_similar_to_returns_neighbours_not_the_question_itself(bank):
+    missed = _q(0, STEMS[0][1])
+    hits = bank.similar_to([missed], k=2)
+    assert hits and hits[0]["id"] == "b1"
+    assert all(q["topic"] == "Derivatives" and q["id"] != "b0" for q in hits)
+
+
+def test_index_picks_up_rows_added_by_another_process(bank, tmp_path):
+    assert bank.search("parallelogram") == []
+    other = QuestionBank(bank.path)
+    other.add_questions([_q(50, "Find the area of a parallelogram", topic="Geometry")], difficulty="medium", source="ai")
+    assert [q["id"] for q in bank.search("parallelogram")] == ["b50"]
+
+
+def test_merged_index_blocks_answer_like_separate_ones(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_bank, "MAX_BLOCKS", 2)
+    bank = QuestionBank(str(tmp_path / "bank.db"))
+    for i, (topic, stem) in enumerate(STEMS):
+        bank.add_questions([_q(i, stem, topic)], difficulty="medium", source="ai")
+        bank.search("rule")  # one index block per insert
+    assert len(bank._blocks) <= 3
+    assert {q["id"] for q in bank.search("chain rule", topics=["Derivatives"], k=2)} == {"b0", "b1"}
+    assert len(bank.sample("Derivatives", "medium", 10)) == 4
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from ai_engine import question_generator as qg
+from ai_engine.cache_backend import MemoryCache
+from ai_engine.question_record import QuestionRecord, QuestionTable
+
+QUESTIONS = [
+    {"id": "q1", "topic": "Algebra", "question": "Solve x² = 4", "options": {"A": "2", "B": "-2", "C": "±2", "D": "4"},
+     "answer": "C"},
+    {"id": "q2", "topic": "Geometry", "question": "Sum of angles?", "options": {"A": "180°", "B": "360°"},
+     "answer": "A", "explanation": "Triangle", "difficulty_b": 0.4},
+    {"id": "q3", "topic": "Derivatives", "question": "d/dx e^x", "options": {"B": "e^x", "A": "x"}},  # no key
+    # Irregular shapes are kept verbatim rather than forced into columns
+    {"id": "q4", "topic": "Algebra", "question": "1 + 1", "options": {"A": "2"}, "answer": "Z"},
+    {"id": 5, "topic": "Algebra", "question": "2 + 2", "options": ["4", "5"], "answer": "A"},
+    {"id": "q6", "topic": "Algebra", "question": "", "options": {"A": 1, "B": 2}, "answer": "A"},
+]
+
+
+def _json(q):
+    # Key order, option order included, must survive the round trip
+    return json.dumps(q, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("q", QUESTIONS, ids=lambda q: str(q["id"]))
+def test_record_round_trips_exactly(q):
+    assert _json(QuestionRecord.from_dict(q).to_dict()) == _json(q)
+    row = json.loads(json.dumps(QuestionRecord.from_dict(q).to_row()))
+    assert _json(QuestionRecord.from_row(row).to_dict()) == _json(q)
+
+
+def test_records_share_option_texts_and_labels():
+    a = QuestionRecord.from_dict({**QUESTIONS[1], "options": {"A": "".join(["180", "°"]), "B": "90°"}})
+    b = QuestionRecord.from_dict(QUESTIONS[1])
+    assert a.options[0] is b.options[0]
+    assert a.labels is b.labels
+    assert a.answer == 0
+
+
+def test_table_rows_read_back_as_fresh_dicts():
+    table = QuestionTable(QUESTIONS)
+    assert len(table) == len(QUESTIONS)
+    assert [_json(q) for q in table] == [_json(q) for q in QUESTIONS]
+    assert _json(table[-1]) == _json(QUESTIONS[-1])
+    table[0]["options"]["A"] = "changed"
+    assert table[0]["options"]["A"] == "2"
+
+
+def test_concatenated_tables_keep_every_row():
+    tables = [QuestionTable(QUESTIONS[:2]), QuestionTable(), QuestionTable(QUESTIONS[2:])]
+    merged = QuestionTable.concat(tables)
+    assert [_json(q) for q in merged] == [_json(q) for q in QUESTIONS]
+    merged.append(QUESTIONS[0])
+    assert _json(merged[len(QUESTIONS)]) == _json(QUESTIONS[0])
+
+
+def test_question_cache_stores_compact_rows_and_reads_old_dicts(monkeypatch):
+    cache = MemoryCache()
+    monkeypatch.setattr(qg, "_cache_store", cache)
+    qg._cache_set("Algebra::medium::2", QUESTIONS[:2])
+    assert all(isinstance(row, list) for row in cache.get("Algebra::medium::2"))
+    assert [_json(q) for q in qg._cache_get("Algebra::medium::2")] == [_json(q) for q in QUESTIONS[:2]]
+    cache.set("legacy", [QUESTIONS[0]])
+    assert qg._cache_get("legacy") == [QUESTIONS[0]]
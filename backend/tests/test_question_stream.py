@@ -0,0 +1,173 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from ai_engine import question_generator as qg
+from ai_engine.json_stream import ObjectArrayStream
+
+
+def _question(i, topic="Algebra", **overrides):
+    q = {
+        "id": f"q{i}",
+        "topic": topic,
+        "question": f"Question {i}?",
+        "options": {"A": "1", "B": "2", "C": "3", "D": "4"},
+        "answer": "A",
+    }
+    q.update(overrides)
+    return q
+
+
+class FakeStreamingClient:
+    """Chat completions client that streams ``text`` in small chunks."""
+
+    def __init__(self, text, chunk=7, finish_reason="stop", fail_after=None):
+        self.text = text
+        self.chunk = chunk
+        self.finish_reason = finish_reason
+        self.fail_after = fail_after
+        self.read = 0
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        assert kwargs["stream"] is True
+        client = self
+
+        class Stream:
+            def __iter__(self):
+                pieces = [client.text[i:i + client.chunk] for i in range(0, len(client.text), client.chunk)]
+                for n, piece in enumerate(pieces):
+                    if client.fail_after is not None and client.read >= client.fail_after:
+                        raise ConnectionError("connection reset")
+                    client.read += len(piece)
+                    last = n == len(pieces) - 1
+                    choice = SimpleNamespace(delta=SimpleNamespace(content=piece),
+                                             finish_reason=client.finish_reason if last else None)
+                    yield SimpleNamespace(choices=[choice], usage=None)
+
+            def close(self):
+                client.closed = True
+
+        return Stream()
+
+
+def _body(questions):
+    return json.dumps({"questions": questions})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    holder = {}
+    monkeypatch.setattr(qg, "_openai_client", lambda: holder["client"])
+
+    def use(text, **kwargs):
+        holder["client"] = FakeStreamingClient(text, **kwargs)
+        return holder["client"]
+
+    return use
+
+
+def _stats_delta(before):
+    return {k: v - before[k] for k, v in qg.stream_stats().items() if k != "first_question_ms"}
+
+
+@pytest.mark.parametrize("bad", [
+    {"options": ["1", "2", "3", "4"]},
+    {"answer": ["A"]},
+    {"topic": {"name": "Algebra"}},
+    {"question": None},
+])
+def test_malformed_element_mid_stream_drops_only_itself(client, bad):
+    client(_body([_question(1), _question(2, **bad), _question(3)]))
+    before = qg.stream_stats()
+    questions = qg._openai_generate("Algebra", "medium", 3)
+    assert [q["id"] for q in questions] == ["q1", "q3"]
+    delta = _stats_delta(before)
+    assert delta["invalid"] == 1
+    assert delta["truncated"] == 0 and delta["salvaged"] == 0
+
+
+def test_batch_malformed_element_drops_only_itself(client):
+    client(_body([_question(1), _question(2, topic=["Algebra"]), _question(3, topic="Geometry"),
+                  _question(4, options="A) 1")]))
+    before = qg.stream_stats()
+    grouped = qg._openai_generate_batch({"Algebra": 1, "Geometry": 1}, "medium")
+    assert {t: [q["id"] for q in qs] for t, qs in grouped.items()} == {"Algebra": ["q1"], "Geometry": ["q3"]}
+    assert _stats_delta(before)["invalid"] == 1  # the stream stopped once both topics were full
+
+
+def test_truncated_stream_keeps_complete_questions(client):
+    text = _body([_question(1), _question(2), _question(3)])
+    client(text[: text.index('"q3"') + 10], finish_reason="length")
+    before = qg.stream_stats()
+    questions = qg._openai_generate("Algebra", "medium", 3)
+    assert [q["id"] for q in questions] == ["q1", "q2"]
+    delta = _stats_delta(before)
+    assert delta["truncated"] == 1 and delta["salvaged"] == 1
+
+
+def test_connection_drop_salvages_what_arrived(client):
+    text = _body([_question(i) for i in range(1, 6)])
+    client(text, fail_after=text.index('"q3"'))
+    questions = qg._openai_generate("Algebra", "medium", 5)
+    assert [q["id"] for q in questions] == ["q1", "q2"]
+
+
+def test_connection_drop_before_any_question_raises(client):
+    client(_body([_question(1)]), fail_after=5)
+    with pytest.raises(ConnectionError):
+        qg._openai_generate("Algebra", "medium", 1)
+
+
+def test_stops_reading_once_enough_questions_arrived(client):
+    text = _body([_question(i) for i in range(1, 11)])
+    fake = client(text)
+    before = qg.stream_stats()
+    questions = qg._openai_generate("Algebra", "medium", 2)
+    assert [q["id"] for q in questions] == ["q1", "q2"]
+    assert fake.closed and fake.read < len(text) / 2
+    assert _stats_delta(before)["stopped_early"] == 1
+
+
+def test_parser_handles_braces_and_escapes_split_across_chunks():
+    tricky = {"question": 'Is "{x}" a set? \\ [y]', "options": {"A": "}"}}
+    text = "Sure! " + json.dumps([tricky]) + " trailing"
+    parser = ObjectArrayStream()
+    got = []
+    for ch in text:
+        got += parser.feed(ch)
+    assert got == [tricky]
+
+
+def test_parser_drops_malformed_element_and_keeps_neighbours():
+    parser = ObjectArrayStream()
+    got = parser.feed('{"questions": [{"a": 1}, {"b": 2,}, {"c": 3}]}')
+    assert got == [{"a": 1}, {"c": 3}]
+    assert parser.malformed == 1 and not parser.in_element
+
+
+def test_ai_mode_template_fallback_skips_retired_items(monkeypatch):
+    # The model is down, so every question comes from templates; sums are retired
+    def broken(**kwargs):
+        raise ConnectionError("model unavailable")
+
+    monkeypatch.setattr(qg, "_load_openai_api_key", lambda: "sk-test")
+    monkeypatch.setattr(qg, "_openai_generate", broken)
+    monkeypatch.setattr(qg, "_cache_get", lambda key: None)
+    monkeypatch.setattr(qg, "_bank_pool", lambda topic, difficulty, count: [])
+    monkeypatch.setattr(qg, "filter_usable",
+                        lambda qs, difficulty=None: [q for q in qs if " + " not in q["question"]])
+    exam = qg.generate_exam(topics=["Algebra"], num_questions=12, mode="ai")
+    assert exam["mode"] == "ai" and len(exam["questions"]) == 12
+    assert not [q for q in exam["questions"] if " + " in q["question"]]
+
+
+def test_retired_template_replacement_never_pads_with_retired_items(monkeypatch):
+    # Only subtraction stems survive, too few distinct ones for the exam: repeats, not retired items
+    monkeypatch.setattr(qg, "filter_usable", lambda qs, difficulty=None: [q for q in qs if " - " in q["question"]])
+    questions = qg._replace_retired_templates([qg._generate_question("Algebra") for _ in range(100)], ["Algebra"])
+    assert len(questions) == 100
+    assert all(" - " in q["question"] for q in questions)
+    assert len({q["id"] for q in questions}) == 100
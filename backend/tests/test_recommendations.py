@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from ai_engine import analytics_store, recommendations
+from ai_engine.analytics_store import AnalyticsStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_store, "ANALYTICS_DIR", str(tmp_path / "analytics"))
+    monkeypatch.setattr(recommendations, "PLANS_PATH", str(tmp_path / "plans.db"))
+    store = AnalyticsStore(flush_rows=10**6, flush_interval=3600)
+    store._imported = True
+    monkeypatch.setattr(recommendations, "get_store", lambda: store)
+    return store
+
+
+def test_plan_favours_the_students_weak_topics(store):
+    store.append(1, {"Algebra": 95.0, "Geometry": 20.0})
+    store.append(2, {"Algebra": 90.0, "Geometry": 90.0})
+    assert recommendations.refresh(full=True)["users"] == 2
+
+    weak = recommendations.get_plan(1)
+    assert weak["weights"]["Geometry"] > weak["weights"]["Algebra"]
+    assert sum(weak["quotas"].values()) == recommendations.PLAN_NUM_QUESTIONS
+    assert recommendations.get_plan(2)["difficulty"] == "hard"
+    assert recommendations.get_plan(3) is None
+
+
+def test_incremental_refresh_only_rewrites_active_users(store):
+    store.append(1, {"Algebra": 40.0})
+    recommendations.refresh(full=True)
+    before = recommendations.get_plan(1)
+    store.append(2, {"Algebra": 80.0})  # submitted after the last run
+    result = recommendations.refresh()
+    assert result["mode"] == "incremental" and result["users"] == 1
+    assert recommendations.get_plan(1) == before
+    assert recommendations.get_plan(2) is not None
+
+
+def test_lookups_reuse_one_connection_per_thread(store, monkeypatch):
+    calls = []
+    create = recommendations._create_schema
+    monkeypatch.setattr(recommendations, "_create_schema", lambda conn: calls.append(conn) or create(conn))
+    for user_id in range(5):
+        recommendations.get_plan(user_id)
+    assert len(calls) == 1
+    assert recommendations._connect() is recommendations._connect()
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(recommendations._connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not recommendations._connect() and len(calls) == 1
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from ai_engine.storage import shard_for_user
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARD_ID_BITS = 40
+
+# Adds ``n`` exams per user from 8 threads at once; prints {exam id: user id}
+ADD_EXAMS = """
+import json, sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import Exam, ExamsSession
+
+users, n = json.loads(sys.argv[1]), int(sys.argv[2])
+
+def add(user_id):
+    session = ExamsSession(user_id)
+    try:
+        row = Exam(user_id=user_id, created_at=datetime.utcnow(), questions_json="[]", answers_json="{}")
+        session.add(row)
+        session.commit()
+        return row.id, user_id
+    finally:
+        session.close()
+
+with ThreadPoolExecutor(8) as pool:
+    print(json.dumps(dict(pool.map(add, [u for u in users for _ in range(n)]))))
+"""
+
+# Prints {exam id: user id} of every exam, as the API would find them
+FIND_EXAMS = """
+import json, sys
+from database import Exam, ExamsSession
+
+found = {}
+for user_id in json.loads(sys.argv[1]):
+    session = ExamsSession(user_id)
+    try:
+        found.update((r.id, r.user_id) for r in session.query(Exam).filter(Exam.user_id == user_id))
+    finally:
+        session.close()
+print(json.dumps(found))
+"""
+
+
+def _python(data_dir, shards, args):
+    env = {**os.environ, "CODEXEDU_DATA_DIR": str(data_dir), "EXAMS_SHARDS": str(shards)}
+    out = subprocess.run([sys.executable, *args], cwd=BACKEND, env=env, capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
+    return out.stdout
+
+
+def _exams(data_dir, shards, script, users, *args):
+    out = _python(data_dir, shards, ["-c", script, json.dumps(users), *map(str, args)])
+    return {int(k): v for k, v in json.loads(out).items()}
+
+
+def test_users_spread_evenly_and_growing_only_moves_users_to_new_shards():
+    users = range(1, 4001)
+    for shards in (2, 3, 4, 8):
+        counts = Counter(shard_for_user(u, shards) for u in users)
+        assert set(counts) == set(range(shards))
+        assert max(counts.values()) < 1.25 * len(users) / shards
+    before = {u: shard_for_user(u, 3) for u in users}
+    after = {u: shard_for_user(u, 4) for u in users}
+    moved = [u for u in users if before[u] != after[u]]
+    assert all(after[u] == 3 for u in moved)
+    assert 0.15 < len(moved) / len(users) < 0.35
+
+
+def test_concurrent_inserts_get_unique_ids_from_their_shard_range(tmp_path):
+    users = list(range(1, 31))
+    added = _exams(tmp_path, 3, ADD_EXAMS, users, 4)
+    assert len(added) == 4 * len(users)
+    assert all(exam_id >> SHARD_ID_BITS == shard_for_user(user_id, 3) for exam_id, user_id in added.items())
+
+
+def _reshard(data_dir, shards, to):
+    return json.loads(_python(data_dir, shards, ["-c", f"import json, reshard; print(json.dumps(reshard.reshard({to}, batch=7)))"]))
+
+
+def test_reshard_moves_rows_keeps_ids_and_never_reuses_one(tmp_path):
+    users = list(range(1, 41))
+    exams = _exams(tmp_path, 1, ADD_EXAMS, users, 2)
+
+    result = _reshard(tmp_path, 1, 3)
+    assert result["moved"] == 2 * sum(1 for u in users if shard_for_user(u, 3) != 0)
+    assert sum(result["shards"].values()) == len(exams)
+    # Every exam is found on its user's new shard, under its old id
+    assert _exams(tmp_path, 3, FIND_EXAMS, users) == exams
+    exams.update(_exams(tmp_path, 3, ADD_EXAMS, users, 1))
+
+    # Shrink and delete the emptied files; their ids now live in shard 0
+    result = _reshard(tmp_path, 3, 1)
+    assert result["shards"] == {"0": len(exams), "1": 0, "2": 0}
+    for path in result["empty_files"]:
+        os.remove(path)
+    assert _exams(tmp_path, 1, FIND_EXAMS, users) == exams
+
+    # Recreated shards must hand out ids past the ones they get back
+    _python(tmp_path, 1, ["reshard.py", "--to", "3"])
+    assert _exams(tmp_path, 3, FIND_EXAMS, users) == exams
+    added = _exams(tmp_path, 3, ADD_EXAMS, users, 1)
+    assert len(added) == len(users) and not set(added) & set(exams)
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _modules_after_import(module):
+    # A fresh interpreter: this test process has long since imported everything
+    out = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(' '.join(sorted(sys.modules)))"],
+        cwd=BACKEND, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    ).stdout
+    return set(out.split())
+
+
+def test_api_import_skips_numeric_stack():
+    loaded = _modules_after_import("main")
+    assert not {"numpy", "scipy", "sklearn"} & loaded
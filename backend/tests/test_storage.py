@@ -0,0 +1,30 @@
+import csv
+from collections import Counter
+
+from ai_engine.storage import SQLiteKeyValueStore, stress
+
+
+def test_stress_loses_and_tears_nothing(tmp_path):
+    workers, rounds = 4, 60
+    result = stress(workers=workers, rounds=rounds, base=str(tmp_path))
+    assert result["ok"], result
+    assert result["kv_missing"] == 0
+    assert result["counter"] == workers * rounds
+
+    # Every value written by every worker is intact, not just present
+    kv = SQLiteKeyValueStore(str(tmp_path / "state.db"))
+    for w in range(workers):
+        for i in range(rounds):
+            assert kv.get(f"w{w}:{i}") == {"worker": w, "i": i, "pad": "x" * 200}
+
+    # Each worker's rows appear exactly once, with one header for the whole file
+    with open(tmp_path / "dataset.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["user_id", "topic", "accuracy"]
+    assert Counter(row[0] for row in rows[1:]) == {str(w): 2 * rounds for w in range(workers)}
+    assert len({tuple(row) for row in rows[1:]}) == len(rows) - 1
+
+    with open(tmp_path / "ai.log", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    expected = {f"[stress] worker={w} i={i} " + "y" * 300 for w in range(workers) for i in range(rounds)}
+    assert set(lines) == expected and len(lines) == len(expected)
@@ -0,0 +1,90 @@
+from collections import Counter
+
+from ai_engine.item_stats import lookup
+from ai_engine.mastery import predict_mastery
+from ai_engine.question_bank import question_fingerprint
+from auth import decode_access_token
+
+
+def _generate(api, headers, **body):
+    payload = {"topics": ["Algebra", "Geometry"], "mode": "deterministic", "num_questions": 4, **body}
+    resp = api.post("/exam/generate", json=payload, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def _answers(questions, right=True):
+    return {q["id"]: (q["answer"] if right else next(k for k in q["options"] if k != q["answer"])) for q in questions}
+
+
+def test_second_submit_is_rejected(api, headers):
+    exam = _generate(api, headers)
+    body = {"exam_id": exam["exam_id"], "questions": exam["questions"], "answers": _answers(exam["questions"])}
+    first = api.post("/exam/submit", json=body, headers=headers)
+    assert first.status_code == 200 and first.json()["overall_accuracy"] == 100.0
+
+    body["answers"] = _answers(exam["questions"], right=False)
+    second = api.post("/exam/submit", json=body, headers=headers)
+    assert second.status_code == 409
+    stored = api.get(f"/exam/{exam['exam_id']}", headers=headers).json()
+    assert stored["score"] == 100.0
+
+
+def _item_counts(questions):
+    stats = lookup(questions)
+    return {question_fingerprint(q): (stats.get(question_fingerprint(q)) or {}).get("n", 0) for q in questions}
+
+
+def test_grading_uses_stored_answer_keys(api, headers):
+    exam = _generate(api, headers)
+    # A client that rewrites every key to the option it picked
+    forged = [{**q, "answer": next(k for k in q["options"] if k != q["answer"])} for q in exam["questions"]]
+    resp = api.post("/exam/submit", headers=headers, json={
+        "exam_id": exam["exam_id"], "questions": forged, "answers": {q["id"]: q["answer"] for q in forged},
+    })
+    assert resp.status_code == 200
+    assert resp.json()["overall_accuracy"] == 0.0
+    assert all(not fb["is_correct"] for fb in resp.json()["feedback"])
+
+
+def test_item_statistics_count_each_exam_once(api, headers):
+    exam = _generate(api, headers)
+    before = _item_counts(exam["questions"])
+    body = {"exam_id": exam["exam_id"], "questions": exam["questions"], "answers": _answers(exam["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 409
+    after = _item_counts(exam["questions"])
+    # A template can appear twice in one exam; each appearance is one response
+    served = Counter(question_fingerprint(q) for q in exam["questions"])
+    assert {fp: after[fp] - before[fp] for fp in after} == served
+
+
+def test_client_supplied_questions_do_not_feed_item_statistics(api, headers):
+    questions = [{"id": f"x{i}", "topic": "Algebra", "question": f"Made-up question {i} {headers['Authorization'][-8:]}",
+                  "options": {"A": "1", "B": "2", "C": "3", "D": "4"}, "answer": "A"} for i in range(3)]
+    resp = api.post("/exam/submit", headers=headers, json={"questions": questions, "answers": _answers(questions)})
+    assert resp.status_code == 200 and resp.json()["overall_accuracy"] == 100.0
+    assert set(_item_counts(questions).values()) == {0}
+
+
+def test_mastery_follows_stored_questions_once(api, headers):
+    user_id = int(decode_access_token(headers["Authorization"].split()[1])["sub"])
+    exam = _generate(api, headers)
+    # The posted copy claims another topic; mastery moves for the stored topics only
+    forged = [{**q, "topic": "Forged"} for q in exam["questions"]]
+    body = {"exam_id": exam["exam_id"], "questions": forged, "answers": _answers(exam["questions"])}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    mastery = predict_mastery(user_id)
+    assert set(mastery) == {q["topic"] for q in exam["questions"]}
+    assert all(p > 0.5 for p in mastery.values())
+
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 409
+    assert predict_mastery(user_id) == mastery
+
+
+def test_adaptive_and_similar_exams_plan_from_history(api, headers):
+    exam = _generate(api, headers)
+    body = {"exam_id": exam["exam_id"], "questions": exam["questions"], "answers": _answers(exam["questions"], right=False)}
+    assert api.post("/exam/submit", json=body, headers=headers).status_code == 200
+    assert len(_generate(api, headers, mode="ai_adaptive")["questions"]) == 4
+    assert _generate(api, headers, similar_to_exam_id=exam["exam_id"])["questions"]
@@ -0,0 +1,141 @@
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_BASE = os.environ.get("API_BASE", "https://codexedu-api.onrender.com")
+# (connect, read) seconds; generation gets a longer read timeout
+TIMEOUT = (5, 30)
+GENERATE_TIMEOUT = (5, 120)
+# GET responses are reused this long, then revalidated with If-None-Match
+API_CACHE_TTL_S = float(os.environ.get("API_CACHE_TTL_S", "30"))
+
+
+class ApiResponse:
+    """The subset of ``requests.Response`` the pages use; also stands in for cache hits."""
+
+    def __init__(self, status_code: int, data: Any = None, headers: Optional[Dict[str, str]] = None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self) -> Any:
+        return self._data
+
+
+def build_session(pool_size: int = 20) -> requests.Session:
+    # Keep-alive connections are reused across reruns; only idempotent methods are retried here
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ApiClient:
+    """One user's view of the API: auth header, GET cache and request counters."""
+
+    def __init__(self, session: requests.Session, token: Optional[str] = None, base: str = API_BASE):
+        self.session = session
+        self.token = token
+        self.base = base
+        # path -> (fresh until, etag, response)
+        self.cache: Dict[str, Tuple[float, Optional[str], ApiResponse]] = {}
+        self.stats = {"requests": 0, "cache_hits": 0, "not_modified": 0}
+
+    def _headers(self, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        return {**headers, **(extra or {})}
+
+    def _to_response(self, resp: requests.Response) -> ApiResponse:
+        try:
+            data = resp.json()
+        except ValueError:
+            data = None
+        return ApiResponse(resp.status_code, data, dict(resp.headers))
+
+    def get(self, path: str, ttl: float = API_CACHE_TTL_S) -> ApiResponse:
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] > time.monotonic():
+            self.stats["cache_hits"] += 1
+            return cached[2]
+        extra = {"If-None-Match": cached[1]} if cached is not None and cached[1] else None
+        self.stats["requests"] += 1
+        try:
+            resp = self.session.get(self.base + path, headers=self._headers(extra), timeout=TIMEOUT)
+        except requests.RequestException:
+            return ApiResponse(503)
+        if resp.status_code == 304 and cached is not None:
+            self.stats["not_modified"] += 1
+            self.cache[path] = (time.monotonic() + ttl, cached[1], cached[2])
+            return cached[2]
+        result = self._to_response(resp)
+        # A 404 ("no report yet") is an answer too; errors and rate limits are not kept
+        if resp.status_code in (200, 404):
+            self.cache[path] = (time.monotonic() + ttl, resp.headers.get("ETag"), result)
+        return result
+
+    def post(
+        self,
+        path: str,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Tuple[float, float] = TIMEOUT,
+        retries: int = 0,
+    ) -> ApiResponse:
+        """``retries`` > 0 is only safe for requests the API de-duplicates (Idempotency-Key)."""
+        for attempt in range(retries + 1):
+            self.stats["requests"] += 1
+            try:
+                resp = self.session.post(self.base + path, json=json, headers=self._headers(headers), timeout=timeout)
+            except requests.RequestException:
+                if attempt == retries:
+                    return ApiResponse(503)
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+            if resp.status_code in (502, 503, 504) and attempt < retries:
+                time.sleep(min(float(resp.headers.get("Retry-After") or 0.5 * 2 ** attempt), 5))
+                continue
+            return self._to_response(resp)
+        return ApiResponse(503)
+
+    def invalidate(self, prefix: str = "") -> None:
+        for path in [p for p in self.cache if p.startswith(prefix)]:
+            del self.cache[path]
+
+
+@st.cache_resource
+def _shared_session() -> requests.Session:
+    # One connection pool for every Streamlit session in this server process
+    return build_session()
+
+
+def get_client() -> ApiClient:
+    """Client for the current browser session; a new login starts with an empty cache."""
+    token = st.session_state.get("token")
+    client = st.session_state.get("_api_client")
+    if client is None or client.token != token:
+        client = st.session_state["_api_client"] = ApiClient(_shared_session(), token)
+    return client
+
+
+def require_login() -> ApiClient:
+    """Send the user to the login page unless a token is present; otherwise return their client."""
+    if not st.session_state.get("token"):
+        st.session_state["is_logged_in"] = False
+        st.warning("Please login first.")
+        st.switch_page("pages/login.py")
+    st.session_state["is_logged_in"] = True
+    return get_client()
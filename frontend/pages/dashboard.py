@@ -1,20 +1,7 @@
 import streamlit as st
-import requests
 import pandas as pd
 import altair as alt
-import os
-API_BASE = os.environ.get("API_BASE", "https://codexedu-api.onrender.com")
-
-
-def auth_headers():
-    token = st.session_state.get("token")
-    if not token:
-        st.session_state["is_logged_in"] = False
-        st.warning("Please login first.")
-        st.switch_page("pages/login.py")
-    else:
-        st.session_state["is_logged_in"] = True
-    return {"Authorization": f"Bearer {token}"}
+from api_client import get_client, require_login
 
 
 st.title("📊 Dashboard")
@@ -24,18 +11,21 @@ if "is_logged_in" not in st.session_state or not st.session_state["is_logged_in"
 
 # Logout button in sidebar
 if st.sidebar.button("Log out"):
+    if st.session_state.get("token"):
+        # Revoke the token server-side too, so a copied token stops working
+        get_client().post("/auth/logout", timeout=(5, 5))
     for key in list(st.session_state.keys()):
         del st.session_state[key]
     st.success("You have been logged out.")
     st.switch_page("pages/login.py")
 
-headers = auth_headers()
+client = require_login()
 
 col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("My Recent Exams")
-    resp = requests.get(f"{API_BASE}/exam/me", headers=headers)
+    resp = client.get("/v2/exam/me")
     if resp.status_code == 200:
         exams = resp.json()
         if exams:
@@ -76,6 +66,16 @@ if resp.status_code == 200 and resp.json():
     else:
         st.info("No topic data yet.")
 
+st.subheader("Class Trends")
+# The class report is rebuilt in batches, so it can be reused for longer
+cohort = client.get("/analytics/cohort", ttl=300)
+if cohort.status_code == 200 and cohort.json().get("weekly"):
+    df_weeks = pd.DataFrame(cohort.json()["weekly"])
+    chart = alt.Chart(df_weeks).mark_line(point=True).encode(x="week:T", y="avg_score:Q").properties(height=250)
+    st.altair_chart(chart, use_container_width=True)
+else:
+    st.info("No class report yet.")
+
 st.page_link("pages/exam.py", label="Take a new exam ➜", icon="📝")
 
 
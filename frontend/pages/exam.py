@@ -1,15 +1,8 @@
 import streamlit as st
-import requests
-import os
-API_BASE = os.environ.get("API_BASE", "https://codexedu-api.onrender.com")
-
-
-def auth_headers():
-    token = st.session_state.get("token")
-    if not token:
-        st.warning("Please login first.")
-        st.stop()
-    return {"Authorization": f"Bearer {token}"}
+import json
+import uuid
+import hashlib
+from api_client import GENERATE_TIMEOUT, require_login
 
 
 st.title("📝 Take Exam")
@@ -27,16 +20,33 @@ difficulty = st.selectbox(
     index=1,
 )
 num_questions = st.slider("Number of questions", min_value=5, max_value=20, value=10, step=1)
+class_code = st.text_input("Class exam code (optional)", help="Enter the code your teacher shared to take the class exam")
 
-headers = auth_headers()
+client = require_login()
 
 if "current_exam" not in st.session_state:
     st.session_state["current_exam"] = None
 
+# Same key for reruns and double clicks, so the API hands back the exam it already made;
+# a new key is drawn once that exam is submitted
+if "generate_nonce" not in st.session_state:
+    st.session_state["generate_nonce"] = uuid.uuid4().hex
+
 if st.button("Generate Exam"):
     payload = {"mode": mode, "difficulty": difficulty, "num_questions": num_questions}
-    resp = requests.post(f"{API_BASE}/exam/generate", json=payload, headers=headers)
+    if class_code.strip().isdigit():
+        payload["blueprint_id"] = int(class_code.strip())
+    request_key = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+    # The key makes retrying a dropped or shed request safe: the API replays instead of generating twice
+    resp = client.post(
+        "/exam/generate",
+        json=payload,
+        headers={"Idempotency-Key": f"{st.session_state['generate_nonce']}-{request_key}"},
+        timeout=GENERATE_TIMEOUT,
+        retries=2,
+    )
     if resp.status_code == 200:
+        client.invalidate("/v2/exam/")
         data = resp.json()
         if "exam_id" not in data:
             st.session_state["current_exam"] = None
@@ -47,6 +57,8 @@ if st.button("Generate Exam"):
             st.session_state["current_exam_id"] = data.get("exam_id")
             if data.get("mode") == "ai":
                 st.success("🤖 AI Mode Active")
+    elif resp.status_code in (429, 503):
+        st.warning(f"Too many requests right now. Please try again in {resp.headers.get('Retry-After', 'a few')} seconds.")
     else:
         st.error("Failed to generate exam")
 
@@ -71,12 +83,11 @@ if exam:
             "questions": questions,
             "answers": answers
         }
-        resp = requests.post(
-            f"{API_BASE}/exam/submit",
-            headers=headers,
-            json=payload,
-        )
+        resp = client.post("/exam/submit", json=payload)
         if resp.status_code == 200:
+            # Scores and the exam list changed; refetch them on the next page
+            client.invalidate()
+            st.session_state["generate_nonce"] = uuid.uuid4().hex
             st.session_state["last_report"] = resp.json()
             st.success("Exam submitted. View your report.")
             st.switch_page("pages/report.py")
@@ -1,10 +1,8 @@
 import streamlit as st
-import requests
-import os
-API_BASE = os.environ.get("API_BASE", "https://codexedu-api.onrender.com")
+from api_client import get_client
 
 def do_login(email: str, password: str):
-    resp = requests.post(f"{API_BASE}/auth/login", json={"email": email, "password": password})
+    resp = get_client().post("/auth/login", json={"email": email, "password": password})
     if resp.status_code == 200:
         token = resp.json().get("access_token")
         st.session_state["token"] = token
@@ -24,8 +22,8 @@ def do_login(email: str, password: str):
 
 
 def do_register(name: str, email: str, password: str):
-    resp = requests.post(
-        f"{API_BASE}/auth/register", json={"name": name, "email": email, "password": password}
+    resp = get_client().post(
+        "/auth/register", json={"name": name, "email": email, "password": password}
     )
     if resp.status_code == 200:
         token = resp.json().get("access_token")
@@ -1,23 +1,40 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-import requests
-import os
-API_BASE = os.environ.get("API_BASE", "https://codexedu-api.onrender.com")
+from api_client import require_login
 
 
-token = st.session_state.get("token")
-if not token:
-    st.switch_page("pages/login.py")
+client = require_login()
+
+
+def expand_v2_feedback(report):
+    # v2 feedback only carries question ids; rebuild the texts from the questions
+    questions = {q.get("id"): q for q in report.get("questions", [])}
+    answers = report.get("answers", {})
+    expanded = []
+    for item in report.get("feedback", []):
+        q = questions.get(item.get("id"), {})
+        options = q.get("options") or {}
+        selected = answers.get(item.get("id"), "?")
+        expanded.append({
+            "question": q.get("question"),
+            "topic": q.get("topic", "General"),
+            "selected_label": selected,
+            "selected_text": options.get(selected, ""),
+            "correct_label": q.get("answer"),
+            "correct_text": options.get(q.get("answer"), ""),
+            "is_correct": item.get("is_correct"),
+        })
+    return {**report, "feedback": expanded}
+
 
 st.title("🧠 Performance Report")
 
 if st.session_state.get("review_exam_id"):
     exam_id = st.session_state["review_exam_id"]
-    headers = {"Authorization": f"Bearer {token}"}
-    resp = requests.get(f"{API_BASE}/exam/{exam_id}", headers=headers)
+    resp = client.get(f"/v2/exam/{exam_id}")
     if resp.status_code == 200:
-        report = resp.json()
+        report = expand_v2_feedback(resp.json())
     else:
         st.error("Could not load that exam.")
         st.stop()